@@ -0,0 +1,102 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+
+Memory held per log by the original LogModel, the slotted LogModel
+and LogBatch, for a decoded page of query results. Then the verifier's
+bulk path over the page: building the LogBatch it verifies, and
+replaying the PCR chain over it.
+Run from src/: python -m benchmarks.bench_model
+"""
+
+import gc
+import json
+import tracemalloc
+
+from argparse import ArgumentParser
+
+from chain_verifier import ChainVerifier
+from log_model import LogBatch, LogModel
+from benchmarks.harness import measure, report
+from benchmarks.samples import insights_documents
+
+
+class LegacyLogModel(object):
+    """
+    LogModel as it was before __slots__: a __dict__ per log, the raw
+    payload kept next to the fields, the signature as hex.
+    """
+
+    def __init__(self, json_obj):
+        self.id = json_obj["_id"]
+        self.payload = json_obj["payload"]
+        self.message = json_obj["payload"]["Message"]
+        self.pcr = json_obj["payload"]["PCR"]
+        self.signature = json_obj["payload"]["Signature"]
+        self.can_id = json_obj["payload"]["CanId"]
+        self.timestamp = json_obj["payload"]["Timestamp"]
+        self.count = int(json_obj["payload"]["Count"])
+        self.is_new_chain = bool(json_obj["payload"]["IsNewChain"])
+        self.root = json_obj["payload"].get("Root")
+        self.proof = json_obj["payload"].get("Proof")
+        self.leaf_index = json_obj["payload"].get("LeafIndex")
+        self.batch_size = json_obj["payload"].get("BatchSize")
+
+
+def retained(body, build):
+    """
+    Bytes still allocated once the page is decoded and turned into
+    models, after the decoded JSON itself is released.
+    """
+    gc.collect()
+    tracemalloc.start()
+
+    documents = json.loads(body)
+    models = build(documents)
+    del documents
+
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Keep the models alive until measured
+    del models
+
+    return current
+
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(description="LogModel memory benchmark.")
+    parser.add_argument("-n", type=int, default=20000, help="Logs per page.")
+    args = parser.parse_args()
+
+    body = json.dumps(insights_documents(args.n))
+
+    legacy = retained(body, lambda docs: [LegacyLogModel(doc) for doc in docs])
+    slotted = retained(body, lambda docs: [LogModel(doc) for doc in docs])
+    columnar = retained(body, lambda docs: LogBatch.from_models(LogModel(doc)
+                                                                for doc in docs))
+
+    for name, size in (("legacy LogModel", legacy),
+                       ("slotted LogModel", slotted),
+                       ("LogBatch", columnar)):
+        print("{:<32} {:>8,.0f} bytes/log  x{:.2f}".format(
+              name, size / args.n, legacy / size))
+
+    objs = [LogModel(doc) for doc in json.loads(body)]
+    batch = LogBatch.from_models(objs)
+
+    report("build LogBatch", measure(lambda: LogBatch.from_models(objs), 1) * args.n)
+
+    verifier = ChainVerifier()
+    results = verifier.feed(batch)
+    assert len(results) == args.n and verifier.broken == 0
+
+    report("chain replay", measure(lambda: ChainVerifier().feed(batch), 1) * args.n)
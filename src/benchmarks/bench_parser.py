@@ -0,0 +1,81 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+
+Compares MessageParser against the original per-field regex parser.
+Run from src/: python -m benchmarks.bench_parser
+"""
+
+import re
+import time
+
+from argparse import ArgumentParser
+from string import printable
+
+from log_parser import MessageParser
+from benchmarks.harness import measure, report
+from benchmarks.samples import firewall_lines
+
+
+def legacy_parse_message(msg):
+    """
+    The parser as it was before the single pass pattern.
+    """
+
+    def _get_value(regex, msg):
+        m = re.search(regex, msg)
+        return m.group(1) if m else None
+
+    can_id = 0
+    timestamp = 0.0
+
+    log = ''.join(char for char in msg if char in printable)
+
+    try:
+        can_id = int(_get_value('CAN ID: (.+?) .', log))
+    except (ValueError, TypeError):
+        pass
+
+    parsed_log = _get_value('(.+?) CAN', log)
+
+    try:
+        timestamp = float(_get_value("Timestamp: (.+?) .", log))
+    except (ValueError, TypeError):
+        timestamp = time.time()
+
+    return (can_id, parsed_log, 1, timestamp)
+
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(description="MessageParser microbenchmark.")
+    parser.add_argument("-n", type=int, default=10000, help="Lines per run.")
+    parser.add_argument("-r", type=int, default=5, help="Runs, best is kept.")
+    args = parser.parse_args()
+
+    lines = firewall_lines(args.n)
+
+    assert [legacy_parse_message(l) for l in lines] == \
+        MessageParser.parse_many(lines)
+
+    def run_legacy():
+        for line in lines:
+            legacy_parse_message(line)
+
+    def run_single():
+        for line in lines:
+            MessageParser.parse_message(line)
+
+    def run_many():
+        MessageParser.parse_many(lines)
+
+    baseline = measure(run_legacy, 1, args.r) * args.n
+    report("legacy parse_message", baseline)
+    report("parse_message", measure(run_single, 1, args.r) * args.n, baseline)
+    report("parse_many", measure(run_many, 1, args.r) * args.n, baseline)
@@ -0,0 +1,92 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+
+Publishes signed-log shaped records to a broker, one per message and
+in batches. Needs a broker, e.g. a local mosquitto:
+    mosquitto -p 1883 &
+    python -m benchmarks.bench_publish --host 127.0.0.1 --port 1883
+"""
+
+import time
+
+from argparse import ArgumentParser
+
+from client_mqtt import MQTTClient, BatchPublisher
+from benchmarks.harness import report
+from benchmarks.samples import firewall_lines
+
+
+def signed_records(count):
+    records = []
+
+    for index, line in enumerate(firewall_lines(count)):
+        records.append({
+            "Message": line.split(" CAN ID")[0],
+            "PCR": "0x" + "{:040X}".format(index),
+            "Signature": "ab" * 262,
+            "CanId": 0x1A0,
+            "Timestamp": 1658395439.0 + index,
+            "Count": 1,
+            "IsNewChain": index == 0,
+        })
+
+    return records
+
+
+def run(client, records, batch_records, fmt):
+    publisher = BatchPublisher(client, max_records=batch_records, fmt=fmt)
+
+    start = time.perf_counter()
+
+    for record in records:
+        publisher.add(record)
+
+    publisher.flush()
+    client.wait_for_publish()
+
+    return len(records) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(description="MQTT publishing benchmark.")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--user", type=str, default="tpm_logger")
+    parser.add_argument("--passwd", type=str, default="tpm_logger")
+    parser.add_argument("--qos", type=int, default=1)
+    parser.add_argument("--max-inflight", type=int, default=20)
+    parser.add_argument("-n", type=int, default=5000, help="Records per run.")
+    parser.add_argument("--batches", type=int, nargs="+", default=[10, 50, 200])
+    args = parser.parse_args()
+
+    client = MQTTClient(args.user, args.passwd, args.host, args.port,
+                        qos=args.qos, max_inflight=args.max_inflight)
+    client.connect()
+
+    deadline = time.time() + 5
+    while not client.is_connected() and time.time() < deadline:
+        time.sleep(0.05)
+
+    if not client.is_connected():
+        raise SystemExit("Couldn't connect to {}:{}".format(args.host, args.port))
+
+    records = signed_records(args.n)
+
+    try:
+        baseline = run(client, records, 1, BatchPublisher.FORMAT_NDJSON)
+        report("one log per message", baseline)
+
+        for size in args.batches:
+            for fmt in (BatchPublisher.FORMAT_NDJSON, BatchPublisher.FORMAT_JSON):
+                report("batch {} {}".format(size, fmt),
+                       run(client, records, size, fmt), baseline)
+    finally:
+        client.stop()
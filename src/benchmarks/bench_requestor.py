@@ -0,0 +1,173 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+
+Fetches a time range from the local Insights stand-in: one new
+connection per request, a pooled session, and concurrent sub-windows.
+Then decodes one large page whole and streamed, comparing the time to
+the first log and peak memory.
+Run from src/: python -m benchmarks.bench_requestor
+"""
+
+import json
+import socket
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from argparse import ArgumentParser
+
+import requests
+
+from log_model import LogModel
+from log_requestor import LogRequestor, QueryBuilder
+from benchmarks.harness import report
+from benchmarks.insights_stub import InsightsStub
+from benchmarks.samples import insights_documents
+
+
+def unpooled_fetch(url, start, end, page_size):
+    """
+    Pages one after the other, a new connection for each.
+    """
+    objects = []
+    after = None
+
+    while True:
+        data = QueryBuilder.build("logs", limit=page_size, start_date=start,
+                                  end_date=end, after=after)
+        response = requests.post(url, data=json.dumps(data),
+                                 headers={'Content-type': 'application/json'})
+        page = [LogModel(item) for item in json.loads(response.content.decode())]
+        objects.extend(page)
+
+        if len(page) < page_size:
+            return objects
+
+        after = (page[-1].timestamp, page[-1].id)
+
+
+def first_and_peak(fetch):
+    """
+    Consumes what fetch() returns, returns (count, seconds to the
+    first item, peak bytes).
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    first = None
+    count = 0
+
+    for _ in fetch():
+        if first is None:
+            first = time.perf_counter() - start
+        count += 1
+
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return count, first, peak
+
+
+def external_stub(count, latency):
+    """
+    Starts the stand-in in its own process, so its allocations
+    don't show up in the measured peak.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    process = subprocess.Popen([sys.executable, "-m", "benchmarks.insights_stub",
+                                "--port", str(port), "-n", str(count),
+                                "--latency", str(latency)],
+                               stdout=subprocess.DEVNULL)
+
+    deadline = time.time() + 30
+
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+
+    return process, "http://127.0.0.1:{}/execute-aggregation-query".format(port)
+
+
+def timed(func):
+    start = time.perf_counter()
+    objects = func()
+    return objects, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(description="LogRequestor transport benchmark.")
+    parser.add_argument("-n", type=int, default=20000, help="Documents served.")
+    parser.add_argument("--window", type=float, default=5.0, help="Seconds per sub-window.")
+    parser.add_argument("--page", type=int, default=500, help="Logs per page.")
+    parser.add_argument("--latency", type=float, default=0.02, help="Added per response.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[4, 8])
+    args = parser.parse_args()
+
+    documents = insights_documents(args.n)
+    start = documents[0]["payload"]["Timestamp"]
+    end = documents[-1]["payload"]["Timestamp"]
+
+    stub = InsightsStub(documents, latency=args.latency).start()
+
+    try:
+        objects, elapsed = timed(lambda: unpooled_fetch(stub.url, start, end, args.page))
+        baseline = len(objects) / elapsed
+        report("unpooled, sequential", baseline)
+
+        connections = stub.connections
+        requestor = LogRequestor("user", "passwd", stub.url, "logs", "token",
+                                 concurrency=1, window=args.window)
+
+        objects, elapsed = timed(lambda: requestor.request_all(start, end, args.page))
+        report("pooled, sequential ({} conn)".format(stub.connections - connections),
+               len(objects) / elapsed, baseline)
+        requestor.close()
+
+        for concurrency in args.concurrency:
+            connections = stub.connections
+            requestor = LogRequestor("user", "passwd", stub.url, "logs", "token",
+                                     concurrency=concurrency, window=args.window)
+
+            objects, elapsed = timed(lambda: requestor.request_all(start, end, args.page))
+            timestamps = [obj.timestamp for obj in objects]
+
+            assert len(objects) == args.n and timestamps == sorted(timestamps)
+            assert len(set(obj.id for obj in objects)) == args.n
+
+            report("pooled, {} concurrent ({} conn)".format(
+                   concurrency, stub.connections - connections),
+                   len(objects) / elapsed, baseline)
+            requestor.close()
+    finally:
+        stub.stop()
+
+    process, url = external_stub(args.n, args.latency)
+    requestor = LogRequestor("user", "passwd", url, "logs", "token")
+
+    try:
+        for name, fetch in (("whole page", requestor.request_all),
+                            ("streamed page", requestor.stream)):
+            count, first, peak = first_and_peak(lambda: fetch(start, end, args.n))
+
+            assert count == args.n
+
+            print("{:<32} first log {:>7.1f} ms  peak {:>7.1f} MiB".format(
+                  name, first * 1000, peak / (1 << 20)))
+    finally:
+        requestor.close()
+        process.terminate()
+        process.wait()
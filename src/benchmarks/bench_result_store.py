@@ -0,0 +1,85 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+
+Fills a ResultStore with verified logs, then times typical queries.
+Run from src/: python -m benchmarks.bench_result_store -n 1000000
+"""
+
+import os
+import random
+import tempfile
+import time
+
+from argparse import ArgumentParser
+
+from log_model import LogModel
+from result_store import ResultStore
+from benchmarks.harness import measure
+
+CAN_IDS = (0x0C4, 0x1A0, 0x2F1, 0x3E8, 0x7DF)
+
+
+def fill(store, count, start, batch):
+    rnd = random.Random(0)
+    obj = LogModel()
+
+    for index in range(count):
+        obj.id = "{:024x}".format(index)
+        obj.timestamp = start + index * 0.1
+        obj.can_id = rnd.choice(CAN_IDS)
+        obj.count = 1
+        obj.message = "Frame dropped by rule {}".format(rnd.randint(1, 64))
+        obj.pcr = "0x" + "{:040X}".format(index)
+
+        store.add("logs", obj, rnd.random() > 0.001)
+
+        if index % batch == batch - 1:
+            store.flush()
+
+    store.flush()
+
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(description="ResultStore benchmark.")
+    parser.add_argument("-n", type=int, default=1000000, help="Rows stored.")
+    parser.add_argument("--batch", type=int, default=256, help="Rows per transaction.")
+    args = parser.parse_args()
+
+    start = 1658395439.0
+    end = start + args.n * 0.1
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = ResultStore(os.path.join(directory, "results.db"))
+
+        began = time.perf_counter()
+        fill(store, args.n, start, args.batch)
+        elapsed = time.perf_counter() - began
+        print("{:<40} {:>12,.0f} rows/s".format("insert", args.n / elapsed))
+
+        hour = end - 3600
+
+        queries = (
+            ("range, last hour, one CAN ID",
+             lambda: store.range(hour, end, can_id=0x1A0, limit=100)),
+            ("range, failed, last hour",
+             lambda: store.range(hour, end, failed=True)),
+            ("failures by CAN ID, last hour",
+             lambda: store.failures_by_can_id(hour, end)),
+            ("summary, last hour",
+             lambda: store.summary(hour, end)),
+            ("failures by CAN ID, everything",
+             lambda: store.failures_by_can_id()),
+        )
+
+        for name, query in queries:
+            print("{:<40} {:>12.2f} ms".format(name, 1000 / measure(query, 5, 3)))
+
+        store.close()
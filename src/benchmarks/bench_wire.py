@@ -0,0 +1,106 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+
+Size, encode and decode cost of a signed log in every wire format
+available here, against JSON. Decoding goes down to LogModel, as the
+verifier does. Run from src/:
+    python -m benchmarks.bench_wire
+    python -m benchmarks.bench_wire --proof 6
+"""
+
+from argparse import ArgumentParser
+from itertools import cycle
+
+from log_model import LogModel
+from wire import JsonCodec, CborCodec, MsgpackCodec, cbor2, cbor_dumps, cbor_loads
+from benchmarks.harness import measure, report
+from benchmarks.samples import firewall_lines
+
+
+def signed_records(count, proof=0):
+    """
+    Logs shaped like TPMLogger's, with a Merkle proof of proof hashes
+    when proof isn't 0.
+    """
+    records = []
+
+    for index, line in enumerate(firewall_lines(count)):
+        record = {
+            "Message": line.split(" CAN ID")[0],
+            "PCR": "0x{:040X}".format(index),
+            "Signature": "ab" * 262,
+            "CanId": 0x1A0,
+            "Timestamp": 1658395439.0 + index / 100,
+            "Count": 1,
+            "IsNewChain": index == 0,
+        }
+
+        if proof:
+            record.update(Root="cd" * 20, Proof=["{:040x}".format(index + level)
+                                                 for level in range(proof)],
+                          LeafIndex=index % (1 << proof), BatchSize=1 << proof)
+
+        records.append(record)
+
+    return records
+
+
+def codecs():
+    found = [("json", JsonCodec())]
+
+    builtin = CborCodec()
+    builtin._dumps, builtin._loads = cbor_dumps, cbor_loads
+
+    if cbor2 is not None:
+        found.append(("cbor (cbor2)", CborCodec()))
+
+    found.append(("cbor (built-in)", builtin))
+
+    try:
+        found.append(("msgpack", MsgpackCodec()))
+    except ValueError:
+        print("msgpack is not installed, skipped")
+
+    return found
+
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(description="Wire format benchmark.")
+    parser.add_argument("-n", type=int, default=20000, help="Calls per measurement.")
+    parser.add_argument("--batch", type=int, default=64, help="Logs per batch.")
+    parser.add_argument("--proof", type=int, default=0, help="Merkle proof length.")
+    args = parser.parse_args()
+
+    records = signed_records(1024, args.proof)
+    batches = [records[i:i + args.batch] for i in range(0, len(records), args.batch)]
+    baseline = dict()
+
+    for name, codec in codecs():
+        encoded = [codec.encode(record) for record in records]
+        size = sum(len(item) for item in encoded) / len(encoded)
+        packed = [codec.pack([codec.encode(record) for record in batch])
+                  for batch in batches]
+        batch_size = sum(len(payload) for payload in packed) / len(records)
+
+        # As published, JSON goes out encoded to UTF-8
+        payloads = [item if codec.binary else item.encode() for item in encoded]
+        record, payload = cycle(records).__next__, cycle(payloads).__next__
+
+        encode = measure(lambda: codec.encode(record()), args.n)
+        decode = measure(lambda: LogModel.decode(payload(), codec), args.n)
+
+        if not baseline:
+            baseline = {"size": size, "encode": encode, "decode": decode}
+
+        print("{}: {:,.0f} bytes/log, {:,.0f} bytes/log in batches of {}, x{:.2f} size".format(
+              name, size, batch_size, args.batch, baseline["size"] / size))
+        report("  encode", encode, baseline["encode"])
+        report("  decode to LogModel", decode, baseline["decode"])
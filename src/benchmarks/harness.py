@@ -0,0 +1,80 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import time
+
+from tracing import _percentile
+
+
+def measure(func, number, repeat=5):
+    """
+    Calls func number times, repeat times over, and returns
+    the best rate in calls per second.
+    """
+    best = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+
+        for _ in range(number):
+            func()
+
+        elapsed = time.perf_counter() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return number / best
+
+
+def report(name, ops, baseline=None):
+    line = "{:<32} {:>14,.0f} ops/s".format(name, ops)
+
+    if baseline:
+        line += "  x{:.2f}".format(ops / baseline)
+
+    print(line)
+
+
+def latencies(func, number, warmup=100):
+    """
+    Calls func number times after warmup calls and returns the
+    duration of every call in seconds.
+    """
+    for _ in range(warmup):
+        func()
+
+    clock = time.perf_counter
+    samples = [0.0] * number
+
+    for index in range(number):
+        start = clock()
+        func()
+        samples[index] = clock() - start
+
+    return samples
+
+
+def summarize(samples, ops_per_sample=1):
+    """
+    Rate and p50/p99/p999 latency, in microseconds, of samples
+    in seconds.
+    """
+    samples = sorted(samples)
+    total = sum(samples)
+
+    return {
+        "ops": len(samples) * ops_per_sample / total if total else None,
+        "p50_us": _percentile(samples, 0.50) * 1e6,
+        "p99_us": _percentile(samples, 0.99) * 1e6,
+        "p999_us": _percentile(samples, 0.999) * 1e6,
+        "samples": len(samples),
+    }
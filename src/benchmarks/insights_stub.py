@@ -0,0 +1,216 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+
+Local stand-in for the Bosch IoT Insights aggregation endpoint. It keeps
+documents sorted by (payload.Timestamp, _id) and understands the $match
+(timestamp range and keyset $or), $limit and $project stages the
+verifier sends. Run from src/:
+    python -m benchmarks.insights_stub --port 8080 -n 10000
+"""
+
+import bisect
+import gzip
+import json
+import threading
+import time
+
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.samples import insights_documents
+
+
+def _decimal(value):
+    if isinstance(value, dict):
+        value = value.get("$numberDecimal")
+    return float(value)
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    # Keep-alive needs HTTP/1.1 and a Content-Length on every response
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes, don't let them
+    # wait for a delayed ACK on a reused connection
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        stub = self.server.stub
+        stub.requests += 1
+
+        length = int(self.headers.get("Content-Length", 0))
+
+        try:
+            query = json.loads(self.rfile.read(length))
+            documents = stub.execute(query)
+        except (ValueError, KeyError, TypeError) as ex:
+            self._reply(400, str(ex).encode())
+            return
+
+        if stub.latency:
+            time.sleep(stub.latency)
+
+        body = json.dumps(documents).encode()
+        encoding = None
+
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, compresslevel=1)
+            encoding = "gzip"
+
+        self._reply(200, body, encoding)
+
+    def _reply(self, status, body, encoding=None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _Server(ThreadingHTTPServer):
+    """
+    Counts accepted connections, to show keep-alive at work.
+    """
+
+    daemon_threads = True
+    connections = 0
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        super().process_request(request, client_address)
+
+
+class InsightsStub:
+    """
+    Serves documents on 127.0.0.1, latency seconds are added to every
+    response to stand in for the round trip to the real service.
+    """
+
+    def __init__(self, documents, port=0, latency=0.0):
+        self._documents = sorted(documents,
+                                 key=lambda doc: _decimal(doc["payload"]["Timestamp"]))
+        self._timestamps = [_decimal(doc["payload"]["Timestamp"])
+                            for doc in self._documents]
+        self._keys = [(timestamp, doc["_id"])
+                      for timestamp, doc in zip(self._timestamps, self._documents)]
+
+        self.latency = latency
+        self.requests = 0
+
+        self._server = _Server(("127.0.0.1", port), _Handler)
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return "http://{}:{}/execute-aggregation-query".format(host, port)
+
+    @property
+    def connections(self):
+        """
+        TCP connections accepted so far.
+        """
+        return self._server.connections
+
+    def execute(self, query):
+        lo, hi = 0, len(self._documents)
+        limit = None
+        projection = None
+
+        for stage in query["query"]:
+            if "$match" in stage:
+                lo, hi = self._match(stage["$match"], lo, hi)
+            elif "$limit" in stage:
+                limit = int(stage["$limit"])
+            elif "$project" in stage:
+                projection = stage["$project"]
+
+        documents = self._documents[lo:hi]
+
+        if limit is not None:
+            documents = documents[:limit]
+
+        if projection:
+            documents = [self._project(doc, projection) for doc in documents]
+
+        return documents
+
+    def _match(self, match, lo, hi):
+        timestamp = match.get("payload.Timestamp") or {}
+
+        if "$gte" in timestamp:
+            lo = max(lo, bisect.bisect_left(self._timestamps, _decimal(timestamp["$gte"])))
+        if "$gt" in timestamp:
+            lo = max(lo, bisect.bisect_right(self._timestamps, _decimal(timestamp["$gt"])))
+        if "$lte" in timestamp:
+            hi = min(hi, bisect.bisect_right(self._timestamps, _decimal(timestamp["$lte"])))
+        if "$lt" in timestamp:
+            hi = min(hi, bisect.bisect_left(self._timestamps, _decimal(timestamp["$lt"])))
+
+        if "$or" in match:
+            # Keyset: timestamp > t or (timestamp == t and _id > id), or >= id
+            after = match["$or"][1]
+
+            if "$gte" in after["_id"]:
+                key = (_decimal(after["payload.Timestamp"]), after["_id"]["$gte"])
+                lo = max(lo, bisect.bisect_left(self._keys, key))
+            else:
+                key = (_decimal(after["payload.Timestamp"]), after["_id"]["$gt"])
+                lo = max(lo, bisect.bisect_right(self._keys, key))
+
+        return lo, max(lo, hi)
+
+    @staticmethod
+    def _project(doc, projection):
+        projected = {"_id": doc["_id"], "payload": {}}
+
+        for field, included in projection.items():
+            if included and field.startswith("payload."):
+                name = field[len("payload."):]
+                projected["payload"][name] = doc["payload"].get(name)
+
+        return projected
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(description="Bosch IoT Insights stand-in.")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("-n", type=int, default=10000, help="Documents served.")
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    stub = InsightsStub(insights_documents(args.n), args.port, args.latency)
+    print("Serving {} documents on {}".format(args.n, stub.url))
+
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
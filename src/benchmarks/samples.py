@@ -0,0 +1,73 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import random
+
+from hashlib import sha1
+
+# Shaped after the alerts dias-firewall writes to the logging fifo
+_TEMPLATES = [
+    "Frame dropped by rule {rule}: unknown identifier CAN ID: {can_id} Timestamp: {ts} .",
+    "Flooding detected ({rate} frames/s) CAN ID: {can_id} Timestamp: {ts} .",
+    "Invalid DLC {dlc} for frame CAN ID: {can_id} Timestamp: {ts} .",
+    "Unexpected payload 0x{payload} CAN ID: {can_id} Timestamp: {ts} .\x00",
+    "Frame period violation {rate} ms CAN ID: {can_id} Timestamp: {ts} .",
+]
+
+
+def firewall_lines(count, seed=0):
+    """
+    Returns count pseudo-random firewall alert lines.
+    """
+    rnd = random.Random(seed)
+    ts = 1658395439.049491
+    lines = []
+
+    for _ in range(count):
+        ts += rnd.random() / 100
+        lines.append(rnd.choice(_TEMPLATES).format(
+            rule=rnd.randint(1, 64),
+            can_id=rnd.choice((0x0C4, 0x1A0, 0x2F1, 0x3E8, 0x7DF)),
+            rate=rnd.randint(100, 5000),
+            dlc=rnd.randint(9, 15),
+            payload="{:016X}".format(rnd.getrandbits(64)),
+            ts="{:.6f}".format(ts)))
+
+    return lines
+
+
+def insights_documents(count, start=1658395439.0, step=0.01):
+    """
+    Returns count documents shaped like the signed logs stored
+    in Bosch IoT Insights, step seconds apart. Their PCRs form a
+    chain, as TPMLogger extends it.
+    """
+    documents = []
+    pcr = bytes(20)
+
+    for index, line in enumerate(firewall_lines(count)):
+        message = line.split(" CAN ID")[0]
+        pcr = sha1(pcr + sha1(message.encode()).digest()).digest()
+
+        documents.append({
+            "_id": "{:024x}".format(index),
+            "payload": {
+                "Message": message,
+                "PCR": "0x" + pcr.hex().upper(),
+                "Signature": "ab" * 262,
+                "CanId": 0x1A0,
+                "Timestamp": round(start + index * step, 6),
+                "Count": 1,
+                "IsNewChain": index == 0,
+            },
+        })
+
+    return documents
@@ -0,0 +1,367 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+
+Times every stage of the logging hot path on its own, then the whole
+fifo -> parse -> sign -> publish path of TPMLogger. The TPM is the
+software backend and MQTT a stub, no TPM or broker is needed. Run from
+src/, keep the JSON of one commit and compare the next against it:
+    python -m benchmarks.suite --json before.json
+    python -m benchmarks.suite --compare before.json
+"""
+
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from argparse import ArgumentParser
+from configparser import ConfigParser
+from itertools import cycle
+
+from client_mqtt import MQTTClient, BatchPublisher, publisher_from_config
+from log_parser import MessageParser
+from metrics import MetricsRegistry
+from tpm_logger import TPMCore, TPMLogger
+from utils import dump, write_binary, load_binary
+from benchmarks.harness import latencies, summarize
+from benchmarks.samples import firewall_lines
+
+SIGNATURE = bytes(range(256)) * 2 + bytes(6)
+
+
+class StubMQTTClient:
+    """
+    Stands in for MQTTClient, remembers when each payload was published.
+    """
+
+    def __init__(self):
+        self.published = []
+
+    def is_connected(self):
+        return True
+
+    def connect(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def publish_log(self, data):
+        self.published.append((time.perf_counter(), data))
+        return True
+
+    def wait_for_publish(self, timeout=None):
+        pass
+
+
+class _StubPaho:
+    """
+    Stands in for the paho client inside MQTTClient.
+    """
+
+    class _Info:
+        rc = 0
+
+    def is_connected(self):
+        return True
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        return self._Info
+
+
+def _config(directory, batch_size=1):
+    config = ConfigParser()
+    config.read_dict({
+        "log": {"fifo": os.path.join(directory, "fifo"), "count": 3,
+                "coalesce_window_ms": 0},
+        "tpm": {"tpm2_primary_ctx": "primary.ctx", "tpm2_prov_path": directory + "/",
+                "tpm2_priv_ctx": "priv.ctx", "tpm2_pub_rsa": "key.pub",
+                "tpm2_priv_rsa": "key.priv", "tmp_file": os.path.join(directory, "logs.dat"),
+                "tmp_digest_file": os.path.join(directory, "digest.dat"),
+                "tmp_output": os.path.join(directory, "out.dat"), "pcr": 4,
+                "backend": "software", "sim_key": "bench", "batch_size": batch_size,
+                "pcr_reconcile_interval": 0},
+        "mqtt": {"user": "bench", "passwd": "bench", "host": "127.0.0.1", "port": 1883},
+    })
+    return config
+
+
+def _messages(lines):
+    return [MessageParser.parse_message(line)[1] for line in lines]
+
+
+def bench_parse(lines, number):
+    line = cycle(lines).__next__
+    return summarize(latencies(lambda: MessageParser.parse_message(line()), number))
+
+
+def bench_sign(lines, number, directory):
+    core = TPMCore(_config(directory))
+    core.initialise()
+    message = cycle(_messages(lines)).__next__
+
+    return summarize(latencies(lambda: core.sign(message()), number))
+
+
+def bench_sign_batch(lines, number, directory, batch=64):
+    core = TPMCore(_config(directory, batch))
+    core.initialise()
+    messages = _messages(lines)
+    batches = cycle([messages[i:i + batch] for i in range(0, len(messages) - batch + 1, batch)])
+
+    # ops are logs, latencies are per batch
+    return summarize(latencies(lambda: core.sign_batch(next(batches)), max(1, number // batch)),
+                     ops_per_sample=batch)
+
+
+def bench_dump(lines, number, directory):
+    path = os.path.join(directory, "logs.dat")
+    message = cycle(_messages(lines)).__next__
+
+    return summarize(latencies(lambda: dump(message(), path), number))
+
+
+def bench_write_binary(number, directory):
+    path = os.path.join(directory, "out.dat")
+    return summarize(latencies(lambda: write_binary(SIGNATURE, path), number))
+
+
+def bench_load_binary(number, directory):
+    path = os.path.join(directory, "out.dat")
+    write_binary(SIGNATURE, path)
+
+    return summarize(latencies(lambda: load_binary(path), number))
+
+
+def _signed_records(lines):
+    return [{
+        "Message": message,
+        "PCR": "0x{:040X}".format(index),
+        "Signature": SIGNATURE.hex(),
+        "CanId": 0x1A0,
+        "Timestamp": 1658395439.0 + index,
+        "Count": 1,
+        "IsNewChain": index == 0,
+    } for index, message in enumerate(_messages(lines))]
+
+
+def bench_publish_log(lines, number):
+    client = MQTTClient("bench", "bench", "127.0.0.1", 1883)
+    client._inst = _StubPaho()
+    payload = cycle([json.dumps(record) for record in _signed_records(lines)]).__next__
+
+    return summarize(latencies(lambda: client.publish_log(payload()), number))
+
+
+def bench_publisher(lines, number):
+    """
+    Encoding and handing over of one signed log, as the publish stage
+    does it.
+    """
+    publisher = BatchPublisher(StubMQTTClient())
+    record = cycle(_signed_records(lines)).__next__
+
+    return summarize(latencies(lambda: publisher.add(record()), number))
+
+
+def bench_stage_timer(number):
+    """
+    What timing one stage costs: two clock reads and an observe().
+    """
+    histogram = MetricsRegistry().histogram("bench_seconds", "Benchmark.")
+    clock = time.perf_counter
+
+    def timed():
+        start = clock()
+        histogram.observe(clock() - start)
+
+    return summarize(latencies(timed, number))
+
+
+def bench_pipeline(lines, number, directory, rate=None):
+    """
+    Writes lines into TPMLogger's fifo one at a time and times each from
+    the write until it is published. Without rate lines are written as
+    fast as the fifo takes them, latencies are then mostly queueing;
+    with rate they are paced to rate lines per second.
+    """
+    asyncio.set_event_loop(asyncio.new_event_loop())
+
+    config = _config(directory)
+    tpm_logger = TPMLogger(config)
+
+    # No broker, everything else is the real pipeline
+    client = StubMQTTClient()
+    tpm_logger._mqtt_client = client
+    tpm_logger._publisher = publisher_from_config(client, config["mqtt"])
+
+    thread = threading.Thread(target=tpm_logger.start, daemon=True)
+    thread.start()
+
+    while not tpm_logger._loop.is_running():
+        time.sleep(0.01)
+
+    fifo = os.open(config["log"]["fifo"], os.O_WRONLY)
+    written = [0.0] * number
+    line = cycle([(line + "\n").encode() for line in lines]).__next__
+
+    start = time.perf_counter()
+
+    for index in range(number):
+        data = line()
+
+        if rate:
+            delay = start + index / rate - time.perf_counter()
+
+            if delay > 0:
+                time.sleep(delay)
+
+        written[index] = time.perf_counter()
+        os.write(fifo, data)
+
+    deadline = time.monotonic() + 60
+    while len(client.published) < number and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+    elapsed = time.perf_counter() - start
+
+    os.close(fifo)
+    tpm_logger._loop.call_soon_threadsafe(tpm_logger.stop)
+    thread.join()
+
+    published = [published for published, _ in client.published[:number]]
+
+    if len(published) < number:
+        raise RuntimeError("Only {} of {} logs were published".format(
+                           len(published), number))
+
+    result = summarize([done - began for began, done in zip(written, published)])
+    # Latencies overlap, the rate is end to end
+    result["ops"] = number / elapsed
+
+    return result
+
+
+def run(number, only=None, rate=2000):
+    lines = firewall_lines(4096)
+    results = dict()
+
+    with tempfile.TemporaryDirectory() as directory:
+        stages = (
+            ("parse_message", lambda: bench_parse(lines, number)),
+            ("tpm_sign", lambda: bench_sign(lines, number, directory)),
+            ("tpm_sign_batch_64", lambda: bench_sign_batch(lines, number, directory)),
+            ("utils_dump", lambda: bench_dump(lines, number, directory)),
+            ("utils_write_binary", lambda: bench_write_binary(number, directory)),
+            ("utils_load_binary", lambda: bench_load_binary(number, directory)),
+            ("mqtt_publish_log", lambda: bench_publish_log(lines, number)),
+            ("publisher_add", lambda: bench_publisher(lines, number)),
+            ("stage_timer", lambda: bench_stage_timer(number)),
+            ("pipeline", lambda: bench_pipeline(lines, number, directory)),
+            ("pipeline_paced", lambda: bench_pipeline(lines, min(number, 5 * rate),
+                                                      directory, rate)),
+        )
+
+        for name, stage in stages:
+            if only and name not in only:
+                continue
+
+            results[name] = stage()
+            report(name, results[name])
+
+    return results
+
+
+def report(name, result, baseline=None):
+    line = "{:<22} {:>12,.0f} ops/s  p50 {:>9.1f} us  p99 {:>9.1f} us  p999 {:>9.1f} us".format(
+        name, result["ops"], result["p50_us"], result["p99_us"], result["p999_us"])
+
+    if baseline:
+        line += "  x{:.2f} ops, x{:.2f} p99".format(result["ops"] / baseline["ops"],
+                                                    result["p99_us"] / baseline["p99_us"])
+
+    print(line)
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints results against baseline and returns the stages whose rate
+    dropped by more than threshold.
+    """
+    regressions = []
+
+    print("\nagainst {} ({})".format(baseline["meta"].get("commit"),
+                                     baseline["meta"].get("date")))
+
+    for name, result in results.items():
+        before = baseline["results"].get(name)
+
+        if before is None:
+            continue
+
+        report(name, result, before)
+
+        if result["ops"] < before["ops"] * (1 - threshold):
+            regressions.append(name)
+
+    return regressions
+
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(description="Logging hot path benchmark suite.")
+    parser.add_argument("-n", type=int, default=20000, help="Samples per stage.")
+    parser.add_argument("--only", type=str, nargs="+", help="Stages to run.")
+    parser.add_argument("--rate", type=int, default=2000,
+                        help="Logs per second written by pipeline_paced.")
+    parser.add_argument("--json", type=str, help="Write the results to this file.")
+    parser.add_argument("--compare", type=str, help="Results of an earlier run.")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Rate drop reported as a regression.")
+    args = parser.parse_args()
+
+    results = run(args.n, args.only, args.rate)
+
+    output = {
+        "meta": {
+            "commit": _commit(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "samples": args.n,
+            "rate": args.rate,
+        },
+        "results": results,
+    }
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(output, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+
+        if regressions:
+            print("\nslower: " + ", ".join(regressions))
+            sys.exit(1)
@@ -0,0 +1,373 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import time
+
+from collections import OrderedDict
+from hashlib import sha1
+
+from log import logger
+from tpm_backend import PCR_SIZE, format_pcr, parse_pcr
+
+PCR_RESET = bytes(PCR_SIZE)
+
+DEFAULT_CHAIN = "default"
+
+
+def extend(pcr, digest):
+    return sha1(pcr + digest).digest()
+
+
+def chain_digest(batch, index):
+    """
+    What the logger extended the PCR with for a log of a LogBatch: the
+    message digest, or the Merkle root for batched logs.
+    """
+    root = batch.roots[index]
+
+    if root is not None:
+        return bytes.fromhex(root)
+    return sha1(batch.message_bytes(index)).digest()
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _order_key(entry):
+    """
+    Orders pending logs by timestamp, then id. Timestamps are compared
+    as numbers when they parse as such.
+    """
+    timestamp, id = entry[0], entry[1]
+
+    try:
+        return 0, float(timestamp), "", str(id)
+    except (TypeError, ValueError):
+        return 1, 0.0, str(timestamp), str(id)
+
+
+class _Batch:
+    """
+    A Merkle batch seen in the chain: the PCR its root extended to and
+    the leaves that arrived so far. leaves is None when they aren't
+    known, for a batch restored from a checkpoint.
+    """
+
+    __slots__ = ("pcr", "size", "leaves", "position")
+
+    def __init__(self, pcr, size=None, leaves=None, position=0):
+        self.pcr = pcr
+        self.size = size
+        self.leaves = leaves
+        # When the batch last had a log accepted
+        self.position = position
+
+    def missing(self):
+        if self.leaves is None or self.size is None:
+            return []
+        return [index for index in range(self.size) if index not in self.leaves]
+
+
+class ChainState:
+
+    def __init__(self, pcr=None, root=None, timestamp=None, id=None,
+                 seen=(), max_seen=1024):
+        # PCR value after the last accepted log, None until anchored
+        self.pcr = pcr
+        # Merkle root of the last accepted log, shared by its batch
+        self.root = root
+        self.timestamp = timestamp
+        self.id = id
+
+        # Recently accepted batches by root, so their late logs still
+        # link once the chain moved on
+        self.batches = OrderedDict()
+
+        if root is not None and pcr is not None:
+            self.batches[root] = _Batch(pcr)
+
+        # (timestamp, id, batch, index, pcr, digest, arrival, arrival time)
+        # of the logs waiting for their predecessor, batch a LogBatch
+        self.pending = []
+        # Logs accepted so far, to tell how long ago a batch was seen
+        self.position = 0
+        # Logs taken in so far, to tell how long a pending one waited
+        self.arrivals = 0
+
+        # Ids of the last accepted logs, so a log fetched twice
+        # (e.g. after a restart) isn't taken for a break
+        self.seen = OrderedDict((id, None) for id in seen)
+        self._max_seen = max_seen
+
+    def mark_seen(self, id):
+        self.seen[id] = None
+
+        if len(self.seen) > self._max_seen:
+            self.seen.popitem(last=False)
+
+    def checkpoint(self):
+        checkpoint = {
+            "pcr": format_pcr(self.pcr) if self.pcr is not None else None,
+            "root": self.root,
+            "timestamp": self.timestamp,
+            "id": self.id,
+            "seen": [],
+        }
+
+        if self.pending:
+            # Buffered logs are lost with the process and fetched again
+            # from the oldest one, along with some already accepted
+            checkpoint["seen"] = list(self.seen)
+
+        return checkpoint
+
+    @staticmethod
+    def from_checkpoint(checkpoint, max_seen=1024):
+        pcr = checkpoint.get("pcr")
+        return ChainState(parse_pcr(pcr) if pcr else None,
+                          checkpoint.get("root"),
+                          checkpoint.get("timestamp"),
+                          checkpoint.get("id"),
+                          checkpoint.get("seen", ()),
+                          max_seen)
+
+
+class ChainVerifier:
+    """
+    Replays PCR extends over published logs: each log's PCR must equal
+    sha1(previous PCR || sha1(Message)). Logs may arrive out of order;
+    they wait in a reorder buffer until their predecessor shows up.
+    When none of them continues the chain and either the buffer holds
+    more than reorder_window logs or one of them waited while
+    reorder_window others arrived or for reorder_timeout seconds, that
+    log is reported as a break (a missing, altered or reordered log) and
+    the chain resumes from it. The timeout is what reports a gap on a
+    chain with few logs, feed() with an empty LogBatch checks it too.
+    Logs are fed as LogBatches and replayed over their columns.
+    Logs of a Merkle batch link to the PCR its root extended to, also
+    when they arrive after later logs; leaves of a batch that haven't
+    arrived once reorder_window logs were accepted after it are counted
+    as breaks too.
+    """
+
+    def __init__(self, reorder_window=256, chain_key=None, reorder_timeout=30):
+        self._reorder_window = reorder_window
+        # None or 0 to only age logs by arrivals
+        self._reorder_timeout = reorder_timeout
+        # chain_key(batch, index) names the chain of a log
+        self._chain_key = chain_key or (lambda batch, index: DEFAULT_CHAIN)
+        self._chains = dict()
+        # Every log accepted since the oldest pending one must be remembered
+        self._max_seen = 2 * reorder_window + 1
+
+        self.accepted = 0
+        self.broken = 0
+        # Logs of Merkle batches that never arrived, included in broken
+        self.missing = 0
+
+    def checkpoint(self, chain=DEFAULT_CHAIN):
+        """
+        State needed to continue the chain later, without its history.
+        """
+        state = self._chains.get(chain)
+        return state.checkpoint() if state else None
+
+    def restore(self, checkpoint, chain=DEFAULT_CHAIN):
+        self._chains[chain] = ChainState.from_checkpoint(checkpoint, self._max_seen)
+
+    def resume_point(self, chain=DEFAULT_CHAIN):
+        """
+        (timestamp, id) of the oldest buffered log, fetching must start
+        again from it after a restart. None if nothing is buffered.
+        """
+        state = self._chains.get(chain)
+
+        if not state or not state.pending:
+            return None
+
+        oldest = min(state.pending, key=_order_key)
+        return oldest[0], oldest[1]
+
+    def pending(self, chain=DEFAULT_CHAIN):
+        state = self._chains.get(chain)
+        return len(state.pending) if state else 0
+
+    def feed(self, batch, now=None):
+        """
+        Adds the logs of a LogBatch and returns the (LogModel, ok) pairs
+        that could be decided, in chain order. Undecided logs stay
+        buffered, with the batch they came in. now is the
+        time.monotonic() they arrived at.
+        """
+        now = time.monotonic() if now is None else now
+        touched = set()
+
+        for index in range(len(batch)):
+            key = self._chain_key(batch, index)
+            id = batch.ids[index]
+
+            try:
+                pcr = batch.pcr_bytes(index)
+                digest = chain_digest(batch, index)
+            except ValueError:
+                pcr = None
+
+            if pcr is None:
+                logger.warning("Log with id {} has no usable PCR".format(id))
+                continue
+
+            state = self._chains.get(key)
+
+            if state is None:
+                state = self._chains[key] = ChainState(max_seen=self._max_seen)
+
+            if id in state.seen:
+                continue
+
+            state.pending.append((batch.timestamp(index), id, batch, index, pcr, digest,
+                                  state.arrivals, now))
+            state.arrivals += 1
+            touched.add(key)
+
+        if self._reorder_timeout:
+            # Quiet chains with a log waiting too long
+            touched.update(key for key, state in self._chains.items()
+                           if state.pending and key not in touched and
+                           any(self._timed_out(entry, now) for entry in state.pending))
+
+        results = []
+
+        for key in touched:
+            results.extend(self._replay(self._chains[key], now))
+
+        return results
+
+    def _timed_out(self, entry, now):
+        return bool(self._reorder_timeout) and now - entry[7] >= self._reorder_timeout
+
+    @staticmethod
+    def _links(state, entry):
+        batch, index, pcr, digest = entry[2:6]
+        root = batch.roots[index]
+
+        if root is not None and root in state.batches:
+            # Another log of the batch was already accepted
+            return pcr == state.batches[root].pcr
+
+        if state.pcr is not None and pcr == extend(state.pcr, digest):
+            return True
+
+        return bool(batch.is_new_chain[index]) and pcr == extend(PCR_RESET, digest)
+
+    def _accept(self, state, entry, linked=True):
+        timestamp, id, logs, index, pcr = entry[:5]
+        root = logs.roots[index]
+
+        state.position += 1
+        state.mark_seen(id)
+
+        batch = state.batches.get(root) if root is not None else None
+        late = linked and batch is not None and root != state.root
+
+        if batch is None or not linked:
+            if root is not None:
+                batch = _Batch(pcr, _int(logs.batch_sizes[index]), set(), state.position)
+                state.batches.pop(root, None)
+                state.batches[root] = batch
+
+                if len(state.batches) > self._max_seen:
+                    self._retire(state, next(iter(state.batches)))
+
+        if batch is not None:
+            if batch.leaves is not None:
+                batch.leaves.add(_int(logs.leaf_indexes[index]))
+            batch.position = state.position
+
+        if late:
+            # A log of an earlier batch, the chain stays where it is
+            return
+
+        state.pcr = pcr
+        state.root = root
+        state.timestamp = timestamp
+        state.id = id
+
+    def _retire(self, state, root):
+        """
+        Forgets the batch of root, counting its leaves that never arrived.
+        """
+        missing = state.batches.pop(root).missing()
+
+        if missing:
+            logger.warning("Merkle batch {} is missing leaves {}".format(root, missing))
+            self.missing += len(missing)
+            self.broken += len(missing)
+
+    def _retire_batches(self, state):
+        for root, batch in list(state.batches.items()):
+            if root != state.root and state.position - batch.position > self._reorder_window:
+                self._retire(state, root)
+
+    def _replay(self, state, now):
+        results = []
+
+        state.pending.sort(key=_order_key)
+
+        while state.pending:
+
+            if state.pcr is None:
+                # Start from a fresh chain if one is pending, otherwise
+                # there is nothing to check the oldest log against
+                index = next((index for index, entry in enumerate(state.pending)
+                              if self._links(state, entry)), None)
+
+                if index is None:
+                    index = 0
+                    logger.info("Chain anchored at log {}".format(state.pending[0][1]))
+
+                entry = state.pending.pop(index)
+                self._accept(state, entry)
+                self.accepted += 1
+                results.append((entry[2][entry[3]], True))
+                continue
+
+            for index, entry in enumerate(state.pending):
+                if self._links(state, entry):
+                    del state.pending[index]
+                    self._accept(state, entry)
+                    self.accepted += 1
+                    results.append((entry[2][entry[3]], True))
+                    break
+            else:
+                # A log is given up on when reorder_window others arrived
+                # after it, it waited reorder_timeout or the buffer overflows
+                index = next((index for index, entry in enumerate(state.pending)
+                              if state.arrivals - entry[6] > self._reorder_window or
+                              self._timed_out(entry, now)), None)
+
+                if index is None:
+                    if len(state.pending) <= self._reorder_window:
+                        break
+                    index = 0
+
+                entry = state.pending.pop(index)
+                logger.warning("PCR chain broken before log {}".format(entry[1]))
+                self._accept(state, entry, linked=False)
+                self.broken += 1
+                results.append((entry[2][entry[3]], False))
+
+        self._retire_batches(state)
+
+        return results
@@ -0,0 +1,135 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import json
+import os
+import time
+
+from log import logger
+
+
+class CheckpointJournal:
+    """
+    Append-only journal of verification progress, one JSON line per
+    checkpoint: {"chain": ..., "after": [timestamp, id], "inclusive": ...,
+    "state": {...}}. The last line of a chain wins. Writes are fsynced
+    every sync_every checkpoints or sync_interval seconds, whichever
+    comes first, and the journal is compacted to one line per chain
+    after compact_every lines.
+    """
+
+    def __init__(self, path, sync_every=64, sync_interval=1.0, compact_every=10000):
+        self._path = path
+        self._sync_every = sync_every
+        self._sync_interval = sync_interval
+        self._compact_every = compact_every
+
+        self._checkpoints = dict()
+        self._lines = 0
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._torn = False
+
+        self._load()
+
+        self._file = open(self._path, "a")
+
+        if self._torn:
+            # Ends the torn line, or the next record would be appended to it
+            self._file.write("\n")
+
+    def _load(self):
+        try:
+            with open(self._path, "r") as f:
+                for line in f:
+                    self._torn = not line.endswith("\n")
+
+                    try:
+                        entry = json.loads(line)
+                        self._checkpoints[entry["chain"]] = entry
+                        self._lines += 1
+                    except (ValueError, KeyError, TypeError):
+                        # Torn last write, everything before it is intact
+                        logger.warning("Skipping damaged checkpoint line")
+        except FileNotFoundError:
+            pass
+
+    def get(self, chain):
+        """
+        Latest checkpoint of chain, None if it was never recorded.
+        """
+        return self._checkpoints.get(chain)
+
+    def record(self, chain, after, inclusive=False, state=None):
+        """
+        Records that every log up to the (timestamp, id) key after was
+        verified; with inclusive the log at after itself was not.
+        """
+        entry = {
+            "chain": chain,
+            "after": list(after),
+            "inclusive": inclusive,
+            "state": state,
+        }
+
+        self._checkpoints[chain] = entry
+        self._file.write(json.dumps(entry) + "\n")
+        self._lines += 1
+        self._unsynced += 1
+
+        if self._unsynced >= self._sync_every or \
+                time.monotonic() - self._last_sync >= self._sync_interval:
+            self.sync()
+
+    def sync(self):
+        if not self._unsynced:
+            return
+
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+        if self._lines > self._compact_every + len(self._checkpoints):
+            self.compact()
+
+    def compact(self):
+        """
+        Rewrites the journal with only the latest line of each chain.
+        """
+        tmp = self._path + ".tmp"
+
+        with open(tmp, "w") as f:
+            for entry in self._checkpoints.values():
+                f.write(json.dumps(entry) + "\n")
+
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._file.close()
+        os.replace(tmp, self._path)
+        self._fsync_directory()
+
+        self._file = open(self._path, "a")
+        self._lines = len(self._checkpoints)
+
+    def _fsync_directory(self):
+        fd = os.open(os.path.dirname(os.path.abspath(self._path)), os.O_RDONLY)
+
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def close(self):
+        self.sync()
+        self._file.close()
@@ -10,13 +10,20 @@ Contributors: Teri Lenard
 """
 import paho.mqtt.client as mqtt
 
+from wire import JsonCodec, codec_from_config, BATCH_NDJSON, BATCH_JSON
+
 
 class MQTTClient(object):
 
     def __init__(self, user, password, host, port, service_name="",
-                 on_message_callback=None):
+                 on_message_callback=None, qos=0, max_inflight=None,
+                 on_connect_callback=None, subscribe_topic=None,
+                 subscribe_qos=0):
         self._inst = mqtt.Client()
         self._inst.username_pw_set(user, password)
+
+        if max_inflight:
+            self._inst.max_inflight_messages_set(max_inflight)
         self._inst.on_connect = self._on_connect
         self._inst.on_subscribe = self._on_subscribe
 
@@ -31,6 +38,13 @@ class MQTTClient(object):
 
         self._log_topic = "logging/"
         self._event_topic = "log_events/"
+        # The logger listens for raw logs, the verifier for signed ones
+        self._subscribe_topic = subscribe_topic or self._log_topic
+        self._subscribe_qos = subscribe_qos
+
+        self._qos = qos
+        self._last_info = None
+        self._on_connect_callback = on_connect_callback
 
     def is_connected(self):
         return self._inst.is_connected()
@@ -47,7 +61,10 @@ class MQTTClient(object):
     def _on_connect(self, client, userdata, flags, rc):
 
         if rc == 0:
-            self._inst.subscribe(self._log_topic, 0)
+            self._inst.subscribe(self._subscribe_topic, self._subscribe_qos)
+
+            if self._on_connect_callback:
+                self._on_connect_callback()
 
         else:
             self._inst.reconnect()
@@ -55,13 +72,121 @@ class MQTTClient(object):
     def _on_subscribe(self, mqttc, obj, mid, granted_qos):
         pass
 
+    def _on_new_message(self, mqttc, obj, msg):
+        pass
+
     def publish_log(self, data):
         if self._inst.is_connected():
-            self._inst.publish(self._event_topic, data)
-            return True
+            self._last_info = self._inst.publish(self._event_topic, data,
+                                                 qos=self._qos)
+            return self._last_info.rc == mqtt.MQTT_ERR_SUCCESS
         else:
             return False
 
+    def wait_for_publish(self, timeout=None):
+        """
+        Waits until the last published message left the client
+        (qos 0) or was acknowledged by the broker (qos 1 and 2).
+        """
+        if self._last_info is not None:
+            self._last_info.wait_for_publish(timeout)
+
+
+class BatchPublisher(object):
+    """
+    Packs several logs into a single message on the events topic,
+    either as newline delimited JSON or as one JSON array, or as an
+    array in the binary formats of wire.py. A batch is sent once it
+    holds max_records logs or max_bytes bytes, or when flush() is
+    called. With max_records 1 every log is published on its own, as a
+    plain JSON object or map.
+    """
+
+    FORMAT_NDJSON = BATCH_NDJSON
+    FORMAT_JSON = BATCH_JSON
+
+    def __init__(self, client, max_records=1, max_bytes=65536,
+                 fmt=FORMAT_NDJSON, on_failure=None, codec=None):
+
+        self.codec = codec if codec is not None else JsonCodec(fmt)
+
+        self._client = client
+        self._max_records = max(1, max_records)
+        self._max_bytes = max_bytes
+        # Called with the encoded logs of a batch that couldn't be sent
+        self._on_failure = on_failure
+
+        self._encode = self.codec.encode
+        self._records = []
+        self._size = 0
+
+        # Logs handed to the client so far
+        self.published = 0
+
+    @property
+    def max_records(self):
+        return self._max_records
+
+    def __len__(self):
+        return len(self._records)
+
+    def add(self, record):
+        """
+        Queues record. Returns False if a batch had to be sent
+        and publishing it failed.
+        """
+        return self.add_encoded(self._encode(record))
+
+    def add_encoded(self, encoded):
+        """
+        Queues a log already encoded by codec.
+        """
+        if self._records and self._size + len(encoded) > self._max_bytes:
+            if not self.flush():
+                return False
+
+        self._records.append(encoded)
+        self._size += len(encoded) + 1
+
+        if len(self._records) >= self._max_records:
+            return self.flush()
+
+        return True
+
+    def flush(self):
+        """
+        Publishes the pending logs as one message.
+        """
+        if not self._records:
+            return True
+
+        records, self._records, self._size = self._records, [], 0
+
+        if len(records) == 1 and self._max_records == 1:
+            payload = records[0]
+        else:
+            payload = self.codec.pack(records)
+
+        if self._client.publish_log(payload):
+            self.published += len(records)
+            return True
+
+        if self._on_failure is not None:
+            self._on_failure(records)
+
+        return False
+
+
+def publisher_from_config(client, config, on_failure=None):
+    """
+    Creates the BatchPublisher described by the [mqtt] section.
+    """
+    return BatchPublisher(client,
+                          max_records=int(config.get("batch_records", 1)),
+                          max_bytes=int(config.get("batch_bytes", 65536)),
+                          on_failure=on_failure,
+                          codec=codec_from_config(config))
+
 
 if __name__ == "__main__":
     """
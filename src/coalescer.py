@@ -0,0 +1,103 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+from collections import OrderedDict
+
+
+class Coalescer:
+    """
+    Merges repeated logs with the same CAN ID and message. The first
+    occurrence opens a window of window seconds; every repeat inside it
+    only bumps the count. The merged entry is released when the window
+    closes or max_count occurrences were seen, as
+    (can_id, message, count, first_timestamp, last_timestamp).
+    """
+
+    def __init__(self, window, max_count):
+        self._window = window
+        self._max_count = max(1, max_count)
+
+        # (can_id, message) -> [deadline, count, first_ts, last_ts]
+        self._pending = OrderedDict()
+
+        self.merged = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    @property
+    def window(self):
+        return self._window
+
+    @property
+    def next_deadline(self):
+        """
+        Time at which the oldest pending entry is due, or None.
+        """
+        for deadline, _, _, _ in self._pending.values():
+            return deadline
+
+        return None
+
+    def add(self, entry, now):
+        """
+        Adds a parsed (can_id, message, count, timestamp) entry.
+        Returns the entry to release if it reached max_count.
+        """
+        can_id, message, count, timestamp = entry
+        key = (can_id, message)
+
+        pending = self._pending.get(key)
+
+        if pending is None:
+            if count >= self._max_count:
+                return (can_id, message, count, timestamp, timestamp)
+
+            self._pending[key] = [now + self._window, count, timestamp, timestamp]
+            return None
+
+        self.merged += 1
+        pending[1] += count
+        pending[3] = timestamp
+
+        if pending[1] < self._max_count:
+            return None
+
+        del self._pending[key]
+
+        return (can_id, message, pending[1], pending[2], pending[3])
+
+    def expire(self, now):
+        """
+        Releases the entries whose window closed, oldest first.
+        """
+        released = []
+
+        while self._pending:
+            key, pending = next(iter(self._pending.items()))
+
+            if pending[0] > now:
+                break
+
+            del self._pending[key]
+            released.append((key[0], key[1], pending[1], pending[2], pending[3]))
+
+        return released
+
+    def flush(self):
+        """
+        Releases every pending entry.
+        """
+        released = [(key[0], key[1], pending[1], pending[2], pending[3])
+                    for key, pending in self._pending.items()]
+        self._pending.clear()
+
+        return released
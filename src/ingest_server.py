@@ -0,0 +1,232 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+
+Unix socket any number of local producers write logs to, next to the
+fifo, which only works for one writer. Logs are newline terminated, or
+with framing = length preceded by their length (4 bytes, big endian):
+    printf '%s\\n' "$line" | socat - UNIX-CONNECT:/run/dias-logging/ingest.sock
+"""
+
+import asyncio
+import os
+import socket
+import struct
+import time
+
+from log import logger
+from metrics import MetricsRegistry
+from pipeline import OVERFLOW_BLOCK
+from utils import LineFramer, LengthPrefixFramer, FrameTooLarge
+
+FRAMING_LINE = "line"
+FRAMING_LENGTH = "length"
+
+FRAMERS = {
+    FRAMING_LINE: LineFramer,
+    FRAMING_LENGTH: LengthPrefixFramer,
+}
+
+
+def _peer_name(sock):
+    """
+    Name of the process on the other end of sock, from its pid. Names
+    rather than pids label the counters so they survive restarts.
+    """
+    try:
+        pid, _, _ = struct.unpack("3i", sock.getsockopt(
+            socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")))
+    except (AttributeError, OSError):
+        return "unknown"
+
+    try:
+        with open("/proc/{}/comm".format(pid)) as f:
+            return f.read().strip() or "pid-{}".format(pid)
+    except OSError:
+        return "pid-{}".format(pid)
+
+
+class Producer:
+    """
+    Counters of every connection made by one producer.
+    """
+
+    def __init__(self, name, metrics):
+        self.name = name
+        self.connections = 0
+
+        self.lines = metrics.counter("ingest_lines", "Logs received on the ingest socket.",
+                                     producer=name)
+        self.bytes = metrics.counter("ingest_bytes", "Bytes received on the ingest socket.",
+                                     producer=name)
+        self.dropped = metrics.counter("ingest_dropped", "Logs a full ingest queue discarded.",
+                                       producer=name)
+        self.errors = metrics.counter("ingest_errors", "Connections closed on a bad frame.",
+                                      producer=name)
+        self.blocked = metrics.counter("ingest_blocked_seconds",
+                                       "Time reads were paused waiting for the pipeline.",
+                                       producer=name)
+
+    def stats(self):
+        return {
+            "connections": self.connections,
+            "lines": self.lines.value,
+            "bytes": self.bytes.value,
+            "dropped": self.dropped.value,
+            "errors": self.errors.value,
+            "blocked_seconds": self.blocked.value,
+        }
+
+
+class IngestServer:
+    """
+    Reads logs from every connection on the socket at path into queue,
+    the ingest StageQueue of TPMLogger. Each connection is read in
+    chunks of up to read_size bytes, all complete logs of a chunk go
+    into queue as one batch. While a batch waits for room, nothing more
+    is read from that connection, so only the producers writing at the
+    time are slowed down, by the kernel's socket buffer filling up.
+    """
+
+    def __init__(self, path, queue, framing=FRAMING_LINE, max_frame=65536,
+                 read_size=65536, mode=0o660, metrics=None):
+
+        if framing not in FRAMERS:
+            raise ValueError("Unknown framing " + str(framing))
+
+        self._path = path
+        self._queue = queue
+        self._framing = framing
+        self._max_frame = max_frame
+        self._read_size = read_size
+        self._mode = mode
+        # Producers' counters are served with the owner's metrics
+        self._metrics = metrics if metrics is not None else MetricsRegistry()
+
+        self._server = None
+        # Connection handler task -> its writer
+        self._connections = dict()
+        self.producers = dict()
+
+    def _producer(self, name):
+        if name not in self.producers:
+            self.producers[name] = Producer(name, self._metrics)
+
+        return self.producers[name]
+
+    async def start(self):
+        directory = os.path.dirname(self._path)
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+
+        self._server = await asyncio.start_unix_server(
+            self._on_connection, self._path, limit=self._read_size)
+        os.chmod(self._path, self._mode)
+
+        logger.info("Accepting logs on " + self._path)
+
+        return self
+
+    def close(self):
+        """
+        Stops accepting and closes the open connections. Their handlers
+        still queue what was already read, see wait_closed().
+        """
+        if self._server is None:
+            return
+
+        self._server.close()
+        self._server = None
+
+        for writer in list(self._connections.values()):
+            writer.close()
+
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+
+    async def wait_closed(self):
+        """
+        Waits for the connection handlers to finish after close().
+        Cancelled, it cancels them.
+        """
+        if self._connections:
+            await asyncio.gather(*self._connections, return_exceptions=True)
+
+    async def _on_connection(self, reader, writer):
+        producer = self._producer(_peer_name(writer.get_extra_info("socket")))
+        producer.connections += 1
+        framer = FRAMERS[self._framing](self._max_frame)
+
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        logger.debug("Producer %s connected", producer.name)
+
+        try:
+            await self._read(reader, framer, producer)
+        except FrameTooLarge as ex:
+            producer.errors.inc()
+            logger.error("Closing connection of {}: {}".format(producer.name, ex))
+        except (ConnectionError, asyncio.IncompleteReadError) as ex:
+            logger.debug("Producer %s went away: %s", producer.name, ex)
+        finally:
+            self._connections.pop(task, None)
+            writer.close()
+
+    async def _read(self, reader, framer, producer):
+        clock = time.perf_counter
+
+        while True:
+            data = await reader.read(self._read_size)
+
+            if not data:
+                return
+
+            producer.bytes.inc(len(data))
+            lines = framer.feed(data)
+
+            if not lines:
+                continue
+
+            producer.lines.inc(len(lines))
+
+            if self._queue.put_nowait(lines):
+                continue
+
+            if self._queue.overflow == OVERFLOW_BLOCK:
+                # Reading stops here until the pipeline catches up
+                start = clock()
+                await self._queue.put(lines)
+                producer.blocked.inc(clock() - start)
+            else:
+                producer.dropped.inc(len(lines))
+
+    def stats(self):
+        return {name: producer.stats() for name, producer in self.producers.items()}
+
+
+def ingest_from_config(queue, config, metrics=None):
+    """
+    IngestServer described by the [ingest] section, None when there is
+    none or socket is empty. Not started yet.
+    """
+    path = config.get("socket", "") if config is not None else ""
+
+    if not path:
+        return None
+
+    return IngestServer(path, queue,
+                        framing=config.get("framing", FRAMING_LINE),
+                        max_frame=int(config.get("max_frame", 65536)),
+                        read_size=int(config.get("read_size", 65536)),
+                        mode=int(config.get("mode", "660"), 8),
+                        metrics=metrics)
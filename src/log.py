@@ -1,10 +1,131 @@
+import atexit
 import logging
+import os
+import sys
+
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from queue import Queue, Full
 
 formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
 
-handler = logging.FileHandler("verifier.log")
-handler.setFormatter(formatter)
+DEFAULT_LOG = "verifier.log"
+QUEUE_SIZE = 10000
+MAX_BYTES = 10 * 1024 * 1024
+BACKUP_COUNT = 5
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Hands records to the writer thread without touching the disk. When
+    the queue is full, records below WARNING are dropped and counted;
+    warnings and errors wait up to a second for room.
+    """
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Formatted on the writer thread; callers pass immutable args
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            if record.levelno < logging.WARNING:
+                self.dropped += 1
+                return
+
+            try:
+                self.queue.put(record, timeout=1)
+            except Full:
+                self.dropped += 1
+
+
+def _file_handler(path, level, max_bytes=MAX_BYTES, backup_count=BACKUP_COUNT):
+    directory = os.path.dirname(path)
+
+    try:
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Opened on the first record, importing doesn't create the file
+        handler = RotatingFileHandler(path, maxBytes=max_bytes,
+                                      backupCount=backup_count, delay=True)
+    except OSError as ex:
+        sys.stderr.write("Couldn't log to {}: {}, using stderr\n".format(path, ex))
+        handler = logging.StreamHandler()
+
+    handler.setFormatter(formatter)
+    handler.setLevel(level)
+
+    return handler
+
+
+def _start(handlers, queue_size):
+    """
+    Routes the logger through a new queue and writer thread, then lets
+    the previous writer finish what it had queued.
+    """
+    global _listener
+
+    previous = _listener
+    queue = Queue(queue_size)
+
+    _listener = QueueListener(queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    handler.queue = queue
+
+    if previous is not None:
+        previous.stop()
+
+    logger.setLevel(min(h.level for h in handlers))
+
+
+def setup_logging(config, log_key, default_path):
+    """
+    Configures the process' logging from a [log] section: log_key names
+    the main log, written at level (DEBUG by default); info_log, when
+    set, gets a copy of INFO and above. Both rotate at max_bytes.
+    """
+    level = logging.getLevelName(config.get("level", "DEBUG").upper())
+    level = level if isinstance(level, int) else logging.DEBUG
+
+    max_bytes = int(config.get("max_bytes", MAX_BYTES))
+    backup_count = int(config.get("backup_count", BACKUP_COUNT))
+
+    handlers = [_file_handler(config.get(log_key, default_path), level,
+                              max_bytes, backup_count)]
+
+    if config.get("info_log"):
+        handlers.append(_file_handler(config["info_log"], logging.INFO,
+                                      max_bytes, backup_count))
+
+    _start(handlers, int(config.get("queue_size", QUEUE_SIZE)))
+
+
+def dropped_records():
+    """
+    Records dropped because the writer fell behind.
+    """
+    return handler.dropped
+
+
+def _stop():
+    if _listener is not None:
+        _listener.stop()
+
 
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
+logger.propagate = False
+
+_listener = None
+
+handler = DroppingQueueHandler(Queue(QUEUE_SIZE))
 logger.addHandler(handler)
+
+# Until setup_logging() is called, as before: everything to verifier.log
+_start([_file_handler(DEFAULT_LOG, logging.DEBUG)], QUEUE_SIZE)
+
+atexit.register(_stop)
@@ -9,36 +9,319 @@ Technology of Târgu Mureş <https://nislab.umfst.ro/>
 Contributors: Teri Lenard
 """
 
+import json
+
+from array import array
+from hashlib import sha1
+
+from log import logger
+from tpm_backend import PCR_SIZE, format_pcr, parse_pcr
+from wire import json_default
+
+
 class LogModel(object):
 
+    # No __dict__ and no copy of the raw payload, a page of thousands
+    # of logs keeps only the fields below
+    __slots__ = ("id", "message", "pcr", "signature", "can_id", "timestamp",
+                 "count", "is_new_chain", "root", "proof", "leaf_index",
+                 "batch_size")
+
     def __init__(self, json_obj=None):
 
+        self.id = None
+        self.message = None
+        self.pcr = None
+        # Raw bytes, JSON payloads carry it hex encoded
+        self.signature = None
+        self.can_id = None
+        self.timestamp = None
+        self.count = None
+        self.is_new_chain = False
+        # Only set for logs signed in a Merkle batch
+        self.root = None
+        self.proof = None
+        self.leaf_index = None
+        self.batch_size = None
+
         if json_obj:
             self.from_json(json_obj)
-        else:
-            self.id = None
-            self.payload = None
-            self.message = None
-            self.pcr = None
-            self.signature = None
-            self.can_id = None
-            self.timestamp = None
-            self.count = None
-            self.is_new_chain = False
 
     def from_json(self, json_obj):
+        """
+        Reads an Insights document. Raises ValueError if it isn't a
+        signed log.
+        """
         try:
+            payload = json_obj["payload"]
+
             self.id = json_obj["_id"]
-            self.payload = json_obj["payload"]
-            self.message = json_obj["payload"]["Message"]
-            self.pcr = json_obj["payload"]["PCR"]
-            self.signature = json_obj["payload"]["Signature"]
-            self.can_id = json_obj["payload"]["CanId"]
-            self.timestamp = json_obj["payload"]["Timestamp"]
-            self.count = int(json_obj["payload"]["Count"])
-            self.is_new_chain = bool(json_obj["payload"]["IsNewChain"])
+            self.message = payload["Message"]
+            self.pcr = payload["PCR"]
+            signature = payload["Signature"]
+            self.signature = signature if isinstance(signature, bytes) \
+                else bytes.fromhex(signature)
+            self.can_id = payload["CanId"]
+            self.timestamp = payload["Timestamp"]
+            self.count = int(payload["Count"])
+            self.is_new_chain = bool(payload["IsNewChain"])
+            self.root = payload.get("Root")
+            self.proof = payload.get("Proof")
+            self.leaf_index = payload.get("LeafIndex")
+            self.batch_size = payload.get("BatchSize")
 
             return self
-        except ValueError as ex:
-            print(ex.__str__())
-            return None
+        except (KeyError, TypeError, ValueError) as ex:
+            logger.error("Malformed log {}: {!r}".format(
+                json_obj.get("_id") if isinstance(json_obj, dict) else None, ex))
+            raise ValueError("Malformed log") from ex
+
+    def to_record(self):
+        """
+        The log as TPMLogger publishes it, the signature left raw.
+        """
+        record = {
+            "Message": self.message,
+            "PCR": self.pcr,
+            "Signature": self.signature,
+            "CanId": self.can_id,
+            "Timestamp": self.timestamp,
+            "Count": self.count,
+            "IsNewChain": self.is_new_chain,
+        }
+
+        if self.root is not None:
+            record.update(Root=self.root, Proof=self.proof,
+                          LeafIndex=self.leaf_index, BatchSize=self.batch_size)
+
+        return record
+
+    def encode(self, codec):
+        """
+        The log in the format of codec, see wire.py.
+        """
+        return codec.encode(self.to_record())
+
+    @staticmethod
+    def decode(payload, codec):
+        """
+        The logs of a log_events/ message or spooled log in the format of
+        codec. Raises ValueError if one of them can't be read.
+        """
+        return [LogModel().from_json(document(record)) for record in codec.decode(payload)]
+
+
+def document(record):
+    """
+    Wraps a log as published on log_events/ like an Insights document.
+    It has no _id, the digest of its content stands in for one, the
+    same whether the log came as JSON or with a raw signature.
+    Documents exported from Insights are kept as they are.
+    """
+    if "payload" in record:
+        return record
+
+    digest = sha1(json.dumps(record, sort_keys=True, default=json_default).encode()).hexdigest()
+    return {"_id": digest, "payload": record}
+
+
+def timestamp_value(value):
+    """
+    A log timestamp as a float, Insights may return decimals as
+    {"$numberDecimal": "..."}. NaN if it isn't a number.
+    """
+    if isinstance(value, dict):
+        value = value.get("$numberDecimal")
+
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+class LogBatch:
+    """
+    Columnar store for many logs: numbers live in typed arrays, messages
+    and signatures are packed into one buffer each and found through
+    offsets. The verifier checks signatures and replays the chain over
+    the columns, iterating materialises one LogModel at a time.
+    """
+
+    def __init__(self):
+        self.ids = []
+        self.timestamps = array("d")
+        self.can_ids = array("q")
+        self.counts = array("q")
+        self.is_new_chain = bytearray()
+        # PCR_SIZE raw bytes per log
+        self.pcrs = bytearray()
+
+        self._messages = bytearray()
+        self._message_offsets = array("Q", [0])
+        self._signatures = bytearray()
+        self._signature_offsets = array("Q", [0])
+
+        # Merkle fields, None for logs signed alone. Logs of one batch
+        # share the root string.
+        self.roots = []
+        self.proofs = []
+        self.leaf_indexes = []
+        self.batch_sizes = []
+        self._root_pool = dict()
+
+        # Values that don't fit their column, kept as they were, by index
+        self._raw_timestamps = dict()
+        self._raw_can_ids = dict()
+        self._raw_pcrs = dict()
+        self._raw_signatures = dict()
+
+    def __len__(self):
+        return len(self.ids)
+
+    @staticmethod
+    def from_models(objs):
+        batch = LogBatch()
+
+        for obj in objs:
+            batch.append(obj)
+
+        return batch
+
+    def append(self, obj):
+        index = len(self.ids)
+
+        self.ids.append(obj.id)
+        self.timestamps.append(timestamp_value(obj.timestamp))
+        self.can_ids.append(obj.can_id if isinstance(obj.can_id, int) else -1)
+        self.counts.append(obj.count or 0)
+        self.is_new_chain.append(1 if obj.is_new_chain else 0)
+
+        if not isinstance(obj.timestamp, (int, float)):
+            self._raw_timestamps[index] = obj.timestamp
+        if not isinstance(obj.can_id, int):
+            self._raw_can_ids[index] = obj.can_id
+
+        try:
+            pcr = parse_pcr(obj.pcr)
+        except (AttributeError, TypeError, ValueError):
+            pcr = b""
+
+        if len(pcr) != PCR_SIZE or format_pcr(pcr) != obj.pcr:
+            self._raw_pcrs[index] = obj.pcr
+            pcr = bytes(PCR_SIZE)
+
+        self.pcrs += pcr
+
+        self._messages += obj.message.encode()
+        self._message_offsets.append(len(self._messages))
+
+        if isinstance(obj.signature, bytes):
+            self._signatures += obj.signature
+        else:
+            self._raw_signatures[index] = obj.signature
+        self._signature_offsets.append(len(self._signatures))
+
+        self._append_merkle(obj.root, obj.proof, obj.leaf_index, obj.batch_size)
+
+    def _append_merkle(self, root, proof, leaf_index, batch_size):
+        if root is not None:
+            root = self._root_pool.setdefault(root, root)
+
+        self.roots.append(root)
+        self.proofs.append(proof)
+        self.leaf_indexes.append(leaf_index)
+        self.batch_sizes.append(batch_size)
+
+    def select(self, indexes):
+        """
+        A new batch with the logs at indexes, copied column by column.
+        """
+        batch = LogBatch()
+
+        for index in indexes:
+            row = len(batch.ids)
+
+            batch.ids.append(self.ids[index])
+            batch.timestamps.append(self.timestamps[index])
+            batch.can_ids.append(self.can_ids[index])
+            batch.counts.append(self.counts[index])
+            batch.is_new_chain.append(self.is_new_chain[index])
+            batch.pcrs += self.pcrs[index * PCR_SIZE:(index + 1) * PCR_SIZE]
+
+            batch._messages += self.message_bytes(index)
+            batch._message_offsets.append(len(batch._messages))
+            batch._signatures += self._signatures[self._signature_offsets[index]:
+                                                  self._signature_offsets[index + 1]]
+            batch._signature_offsets.append(len(batch._signatures))
+
+            batch._append_merkle(self.roots[index], self.proofs[index],
+                                 self.leaf_indexes[index], self.batch_sizes[index])
+
+            for raw, selected in ((self._raw_timestamps, batch._raw_timestamps),
+                                  (self._raw_can_ids, batch._raw_can_ids),
+                                  (self._raw_pcrs, batch._raw_pcrs),
+                                  (self._raw_signatures, batch._raw_signatures)):
+                if index in raw:
+                    selected[row] = raw[index]
+
+        return batch
+
+    def message_bytes(self, index):
+        """
+        The encoded message, without decoding it (e.g. to hash it).
+        """
+        return memoryview(self._messages)[self._message_offsets[index]:
+                                          self._message_offsets[index + 1]]
+
+    def message(self, index):
+        return self.message_bytes(index).tobytes().decode()
+
+    def timestamp(self, index):
+        return self._raw_timestamps.get(index, self.timestamps[index])
+
+    def pcr(self, index):
+        if index in self._raw_pcrs:
+            return self._raw_pcrs[index]
+        return format_pcr(self.pcr_bytes(index))
+
+    def pcr_bytes(self, index):
+        """
+        The PCR as raw bytes, None if the log's PCR doesn't parse.
+        """
+        if index in self._raw_pcrs:
+            try:
+                return parse_pcr(self._raw_pcrs[index])
+            except (AttributeError, TypeError, ValueError):
+                return None
+
+        return bytes(self.pcrs[index * PCR_SIZE:(index + 1) * PCR_SIZE])
+
+    def signature(self, index):
+        if index in self._raw_signatures:
+            return self._raw_signatures[index]
+        return bytes(self._signatures[self._signature_offsets[index]:
+                                      self._signature_offsets[index + 1]])
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+
+        obj = LogModel()
+        obj.id = self.ids[index]
+        obj.message = self.message(index)
+        obj.pcr = self.pcr(index)
+        obj.signature = self.signature(index)
+        obj.can_id = self._raw_can_ids.get(index, self.can_ids[index])
+        obj.timestamp = self.timestamp(index)
+        obj.count = self.counts[index]
+        obj.is_new_chain = bool(self.is_new_chain[index])
+        obj.root = self.roots[index]
+        obj.proof = self.proofs[index]
+        obj.leaf_index = self.leaf_indexes[index]
+        obj.batch_size = self.batch_sizes[index]
+
+        return obj
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
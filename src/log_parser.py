@@ -0,0 +1,124 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import re
+import time
+
+from string import printable
+
+
+# Translation table removing every ASCII character not in string.printable
+_NON_PRINTABLE = dict.fromkeys(c for c in range(128) if chr(c) not in printable)
+
+_TIMESTAMP_TAG = "Timestamp: "
+
+
+class MessageParser():
+
+    CANID_REGEX = re.compile('CAN ID: (.+?) .')
+    LOG_REGEX = re.compile('(.+?) CAN')
+    TIMESTAMP_REGEX = re.compile("Timestamp: (.+?) .")
+
+    # Message, CAN ID and an optional timestamp in a single pass
+    LINE_REGEX = re.compile('(.+?) CAN ID: (.+?) (?=.)(?:.*?Timestamp: (.+?) .)?')
+
+    def _get_value(regex, msg):
+        found = None
+        m = regex.search(msg)
+
+        if m:
+            found = m.group(1)
+
+        return found
+
+    @staticmethod
+    def _printable(msg):
+        if msg.isascii():
+            if msg.isprintable():
+                return msg
+            return msg.translate(_NON_PRINTABLE)
+
+        return msg.encode("ascii", "ignore").decode("ascii") \
+            .translate(_NON_PRINTABLE)
+
+    @staticmethod
+    def _parse_fallback(log):
+        """
+        Searches each field separately, for lines the single pass
+        pattern doesn't describe.
+        """
+        can_id = 0
+
+        try:
+            can_id = int(MessageParser._get_value(
+                MessageParser.CANID_REGEX, log
+            ))
+        except (ValueError, TypeError):
+                pass
+
+        parsed_log = MessageParser._get_value(
+                MessageParser.LOG_REGEX, log
+            )
+
+        try:
+            timestamp = float(MessageParser._get_value(
+                MessageParser.TIMESTAMP_REGEX, log
+            ))
+        except (ValueError, TypeError):
+            timestamp = time.time()
+
+        return (can_id, parsed_log, 1, timestamp)
+
+    @staticmethod
+    def _parse(log):
+        m = MessageParser.LINE_REGEX.match(log)
+
+        # The single pass result must agree with searching each field
+        # on its own: the message ends at the first " CAN" and the
+        # timestamp is the first one in the line.
+        if m is None or log.find(" CAN") != m.end(1) \
+                or log.find("CAN ID: ") != m.end(1) + 1:
+            return MessageParser._parse_fallback(log)
+
+        ts_start = log.find(_TIMESTAMP_TAG)
+
+        if ts_start != -1 and ts_start + len(_TIMESTAMP_TAG) != m.start(3):
+            return MessageParser._parse_fallback(log)
+
+        try:
+            can_id = int(m.group(2))
+        except ValueError:
+            can_id = 0
+
+        try:
+            timestamp = float(m.group(3))
+        except (ValueError, TypeError):
+            timestamp = time.time()
+
+        return (can_id, m.group(1), 1, timestamp)
+
+    def parse_message(msg):
+        """
+        Returns the can_id, count, log message, timestamp
+        from a single string.
+        """
+        return MessageParser._parse(MessageParser._printable(msg))
+
+    @staticmethod
+    def parse_many(msgs):
+        """
+        Parses a batch of lines. Returns a list of
+        (can_id, log message, count, timestamp) tuples.
+        """
+        parse = MessageParser._parse
+        printable_ = MessageParser._printable
+
+        return [parse(printable_(msg)) for msg in msgs]
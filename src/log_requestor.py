@@ -12,95 +12,329 @@ Contributors: Teri Lenard
 import requests
 import json
 
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from datetime import datetime
 import time
 
 from log_model import LogModel
+from utils import JsonArrayDecoder
+
+# Bytes read from the response at a time when streaming
+STREAM_CHUNK_SIZE = 65536
 
 
 class QueryBuilder:
+    """
+    Builds aggregation queries for the Insights query service. Every
+    call returns a new query: $match, then $sort on (payload.Timestamp,
+    _id), then $limit. Pages are resumed after the (timestamp, id) key
+    of the last log seen, so none are skipped or fetched twice.
+    """
 
-    QUERY_TEMPLATE = {
-        "collection": None,
-        "sample": True,
-        "query": [
-            {
-                "$limit": 1
-            },
-            {
-                "$match": {
-                    # "IsNewChain": False,
-                    "payload.Timestamp": {
-                        "$gte": {
-                            "$numberDecimal": 0.00  # unix time
-                        },
-                        "$lte": {
-                            "$numberDecimal": 0.00  # unix time
-                        }
-                    }
-                }
-            }
+    # Fields read by LogModel, nothing else is shipped
+    PROJECTION = (
+        "payload.Message",
+        "payload.PCR",
+        "payload.Signature",
+        "payload.CanId",
+        "payload.Timestamp",
+        "payload.Count",
+        "payload.IsNewChain",
+        "payload.Root",
+        "payload.Proof",
+        "payload.LeafIndex",
+        "payload.BatchSize",
+    )
 
-        ]
+    SORT = {"payload.Timestamp": 1, "_id": 1}
 
-    }
+    @staticmethod
+    def _decimal(value):
+        # Keys are sent back the way the service returned them
+        if isinstance(value, dict):
+            return value
+        return {"$numberDecimal": value}
 
     @staticmethod
     def build(collection, limit=None,
               is_new_chain=None,
               is_verified=None,
               start_date=None,
-              end_date=None):
+              end_date=None,
+              end_exclusive=False,
+              after=None,
+              after_inclusive=False,
+              projection=PROJECTION):
+        """
+        :param after: (timestamp, id) of the last log of the previous page
+        :param after_inclusive: also match the log at after
+        :param end_exclusive: match end_date with $lt instead of $lte
+        :return: query dict, None if limit is not a number
+        """
+        match = dict()
+        timestamp = dict()
+
+        if start_date is not None:
+            timestamp["$gte"] = QueryBuilder._decimal(start_date)
+
+        if end_date is not None:
+            timestamp["$lt" if end_exclusive else "$lte"] = QueryBuilder._decimal(end_date)
+
+        if timestamp:
+            match["payload.Timestamp"] = timestamp
 
-        query = QueryBuilder.QUERY_TEMPLATE
-        query["collection"] = collection
+        if is_new_chain is not None:
+            match["payload.IsNewChain"] = bool(is_new_chain)
+
+        if after is not None:
+            after_timestamp = QueryBuilder._decimal(after[0])
+
+            match["$or"] = [
+                {"payload.Timestamp": {"$gt": after_timestamp}},
+                {"payload.Timestamp": after_timestamp,
+                 "_id": {"$gte" if after_inclusive else "$gt": after[1]}},
+            ]
+
+        query = [
+            {"$match": match},
+            {"$sort": dict(QueryBuilder.SORT)},
+        ]
 
         if limit:
             try:
-                query["query"][0]["$limit"] = int(limit)
+                query.append({"$limit": int(limit)})
             except ValueError as ex:
                 return None
-        else:
-            query["query"][0]["$limit"] = 1
 
-        if start_date and end_date:
-            query["query"][1]["$match"]["payload.Timestamp"]["$gte"]["$numberDecimal"] = start_date
-            query["query"][1]["$match"]["payload.Timestamp"]["$lte"]["$numberDecimal"] = end_date
-        else:
-            query["query"][1]["$match"]["payload.Timestamp"] = {}
+        if projection:
+            query.append({"$project": {field: 1 for field in projection}})
 
-        return query
+        return {
+            "collection": collection,
+            "query": query,
+        }
 
 
 class LogRequestor:
 
-    def __init__(self, username, password, url, collection, token):
+    # What a failed query raises: timeouts, resets, error statuses and
+    # bodies that aren't the expected JSON
+    errors = (requests.RequestException, ValueError)
+
+    def __init__(self, username, password, url, collection, token,
+                 pool_size=4, concurrency=1, window=None, timeout=30):
         self._username = username
         self._password = password
         self._url = url
         self._collection = collection
         self._token = token
+        self._timeout = timeout
+
+        # Documents skipped because they aren't signed logs
+        self.malformed = 0
 
         self._headers = {
             'Content-type': 'application/json',
             'Accept': 'application/json',
+            'Accept-Encoding': 'gzip',
+            'Connection': 'keep-alive',
             'X-XSRF-TOKEN': self._token
         }
 
-    def request(self, start_date=None, end_date=None, limit=None):
+        # Connections are kept alive and reused across polls
+        self._concurrency = max(1, concurrency)
+        adapter = HTTPAdapter(pool_connections=1,
+                              pool_maxsize=max(pool_size, self._concurrency))
+
+        self._session = requests.Session()
+        self._session.headers.update(self._headers)
+        self._session.auth = (self._username, self._password)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+        # Ranges longer than window seconds are fetched as sub-windows,
+        # up to concurrency requests in flight
+        self._window = window
+        self._executor = None
+
+        if self._concurrency > 1:
+            self._executor = ThreadPoolExecutor(max_workers=self._concurrency)
+
+    @property
+    def concurrency(self):
+        return self._concurrency
+
+    @property
+    def window(self):
+        """
+        Seconds per concurrently fetched sub-window, None if disabled.
+        """
+        return self._window if self._executor else None
+
+    def request(self, start_date=None, end_date=None, limit=None, after=None,
+                end_exclusive=False):
         """
         Returns a list of LogModels
         :param start_date:
         :param end_date:
+        :param limit: page size
+        :param after: (timestamp, id) key to resume after
         :return:
         """
         data = QueryBuilder.build(self._collection, limit=limit,
-                                  start_date=start_date, end_date=end_date)
-        response = requests.post(self._url, data=json.dumps(data),
-                                 headers=self._headers, auth=(self._username, self._password))
+                                  start_date=start_date, end_date=end_date,
+                                  end_exclusive=end_exclusive, after=after)
+
+        return self._post(json.dumps(data))
+
+    def _model(self, item):
+        """
+        The LogModel of a document, None if it isn't a signed log.
+        """
+        try:
+            return LogModel(item)
+        except ValueError:
+            self.malformed += 1
+            return None
+
+    def _post_items(self, body):
+        response = self._session.post(self._url, data=body, timeout=self._timeout)
+        response.raise_for_status()
 
         content = response.content.decode()
-        json_obj = json.loads(content)
-        objects = [LogModel(item) for item in json_obj]
+        return json.loads(content)
+
+    def _post(self, body):
+        objects = [self._model(item) for item in self._post_items(body)]
+        return [obj for obj in objects if obj is not None]
+
+    def _post_stream(self, body):
+        """
+        Yields documents while the response is still downloading,
+        never holding more than a chunk of the raw body.
+        """
+        with self._session.post(self._url, data=body, timeout=self._timeout,
+                                stream=True) as response:
+            response.raise_for_status()
+            decoder = JsonArrayDecoder()
+
+            for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                yield from decoder.feed(chunk)
+
+            decoder.close()
+
+    def pages(self, start_date, end_date, page_size, after=None, end_exclusive=False,
+              after_inclusive=False):
+        """
+        Yields every log in the range, page_size at a time.
+        """
+        while True:
+            data = QueryBuilder.build(self._collection, limit=page_size,
+                                      start_date=start_date, end_date=end_date,
+                                      end_exclusive=end_exclusive, after=after,
+                                      after_inclusive=after_inclusive)
+            items = self._post_items(json.dumps(data))
+            page = [obj for obj in map(self._model, items) if obj is not None]
+
+            if page:
+                yield page
+
+            if len(items) < page_size:
+                return
+
+            if not page:
+                raise ValueError("No readable log in a page of {}".format(page_size))
+
+            after = (page[-1].timestamp, page[-1].id)
+            after_inclusive = False
+
+    def _windows(self, start_date, end_date):
+        """
+        Splits the range in sub-windows when fetching concurrently,
+        returns None if it should be fetched in one go.
+        """
+        if not self._executor or not self._window or start_date is None or \
+                end_date - start_date <= self._window:
+            return None
+
+        windows = []
+        window_start = start_date
+
+        while window_start < end_date:
+            window_end = min(window_start + self._window, end_date)
+            windows.append((window_start, window_end, window_end < end_date))
+            window_start = window_end
+
+        return windows
+
+    def request_all(self, start_date, end_date, page_size, after=None,
+                    after_inclusive=False):
+        """
+        Returns every log in [start_date, end_date] in timestamp order,
+        past the (timestamp, id) key after if given. Ranges longer than
+        window are split into sub-windows, fetched up to concurrency
+        at a time.
+        """
+        windows = self._windows(start_date, end_date)
+
+        if windows is None:
+            return [obj for page in self.pages(start_date, end_date, page_size,
+                                               after=after,
+                                               after_inclusive=after_inclusive)
+                    for obj in page]
+
+        def drain(window):
+            first = window is windows[0]
+
+            return [obj for page in self.pages(window[0], window[1], page_size,
+                                               after=after if first else None,
+                                               end_exclusive=window[2],
+                                               after_inclusive=after_inclusive)
+                    for obj in page]
+
+        # Windows don't overlap and each comes back sorted
+        return [obj for objects in self._executor.map(drain, windows)
+                for obj in objects]
+
+    def stream(self, start_date, end_date, page_size, after=None,
+               after_inclusive=False):
+        """
+        Yields every log in [start_date, end_date] in timestamp order,
+        as soon as it is decoded, starting past the (timestamp, id) key
+        after if given. Concurrent sub-windows are fetched whole, their
+        order is only known once they all arrived.
+        """
+        if after is None and self._windows(start_date, end_date) is not None:
+            yield from self.request_all(start_date, end_date, page_size)
+            return
+
+        while True:
+            data = QueryBuilder.build(self._collection, limit=page_size,
+                                      start_date=start_date, end_date=end_date,
+                                      after=after, after_inclusive=after_inclusive)
+            count = 0
+            last = None
+
+            for item in self._post_stream(json.dumps(data)):
+                count += 1
+                obj = self._model(item)
+
+                if obj is not None:
+                    last = obj
+                    yield obj
+
+            if count < page_size:
+                return
+
+            if last is None:
+                raise ValueError("No readable log in a page of {}".format(page_size))
+
+            after = (last.timestamp, last.id)
+            after_inclusive = False
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
 
-        return objects
+        self._session.close()
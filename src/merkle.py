@@ -0,0 +1,111 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+from hashlib import sha1
+
+# Domain separation between leaves and inner nodes (RFC 6962)
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+
+
+def leaf_hash(digest):
+    return sha1(LEAF_PREFIX + digest).digest()
+
+
+def node_hash(left, right):
+    return sha1(NODE_PREFIX + left + right).digest()
+
+
+class MerkleTree:
+    """
+    Binary sha-1 Merkle tree over a batch of message digests.
+    An odd node at the end of a level is promoted unchanged.
+    """
+
+    def __init__(self, digests):
+
+        if not digests:
+            raise ValueError("Cannot build a Merkle tree without leaves")
+
+        level = [leaf_hash(digest) for digest in digests]
+        self._levels = [level]
+
+        while len(level) > 1:
+            upper = [node_hash(level[i], level[i + 1])
+                     for i in range(0, len(level) - 1, 2)]
+
+            if len(level) % 2:
+                upper.append(level[-1])
+
+            self._levels.append(upper)
+            level = upper
+
+    def __len__(self):
+        return len(self._levels[0])
+
+    @property
+    def root(self):
+        return self._levels[-1][0]
+
+    def proof(self, index):
+        """
+        Returns the sibling hashes from the leaf up to the root.
+        Levels where the node was promoted contribute nothing.
+        """
+        proof = []
+
+        for level in self._levels[:-1]:
+            sibling = index ^ 1
+
+            if sibling < len(level):
+                proof.append(level[sibling])
+
+            index //= 2
+
+        return proof
+
+
+def compute_root(digest, index, size, proof):
+    """
+    Recomputes the root from a leaf digest and its inclusion proof.
+    Returns None if the proof does not fit a tree of the given size.
+    """
+    if not 0 <= index < size:
+        return None
+
+    node = leaf_hash(digest)
+    proof = iter(proof)
+
+    while size > 1:
+        sibling = index ^ 1
+
+        if sibling < size:
+            try:
+                other = next(proof)
+            except StopIteration:
+                return None
+
+            if index % 2:
+                node = node_hash(other, node)
+            else:
+                node = node_hash(node, other)
+
+        index //= 2
+        size = (size + 1) // 2
+
+    if next(proof, None) is not None:
+        return None
+
+    return node
+
+
+def verify_proof(digest, index, size, proof, root):
+    return compute_root(digest, index, size, proof) == root
@@ -0,0 +1,257 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+
+Counters and latency histograms, served in the Prometheus text format:
+    curl http://127.0.0.1:9108/metrics
+    curl --unix-socket /run/dias-logging/metrics.sock http://localhost/metrics
+"""
+
+import os
+import threading
+
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingUnixStreamServer
+
+from log import logger
+
+# 1 us to ~33 s, doubling. Covers a hash in software up to a
+# tpm2-tools subprocess on a busy machine.
+LATENCY_BUCKETS = tuple(1e-6 * 2 ** exponent for exponent in range(26))
+
+UNIX_PREFIX = "unix:"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+
+    return "{" + ",".join('{}="{}"'.format(key, str(value).replace('"', '\\"'))
+                          for key, value in sorted(labels.items())) + "}"
+
+
+def _number(value):
+    if value is None:
+        return "NaN"
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+
+class Counter:
+    """
+    Monotonic count. With func the value is read from it when the
+    metrics are served, for counts a component keeps anyway.
+    """
+
+    __slots__ = ("labels", "value", "_func")
+
+    def __init__(self, labels, func=None):
+        self.labels = labels
+        self.value = 0
+        self._func = func
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self, name):
+        value = self._func() if self._func else self.value
+        yield name + "_total" + _labels(self.labels), value
+
+
+class Gauge(Counter):
+    """
+    Current value, read from func when the metrics are served.
+    """
+
+    __slots__ = ()
+
+    def samples(self, name):
+        yield name + _labels(self.labels), self._func()
+
+
+class Histogram:
+    """
+    Latency histogram over fixed buckets. observe() is one bisect and
+    two additions, cheap enough for every log.
+    """
+
+    __slots__ = ("labels", "_bounds", "_counts", "_sum")
+
+    def __init__(self, labels, buckets=LATENCY_BUCKETS):
+        self.labels = labels
+        self._bounds = buckets
+        # One more for everything above the last bound
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+
+    def observe(self, seconds):
+        self._counts[bisect_left(self._bounds, seconds)] += 1
+        self._sum += seconds
+
+    def samples(self, name):
+        cumulative = 0
+
+        for bound, count in zip(self._bounds, self._counts):
+            cumulative += count
+            yield name + "_bucket" + _labels(dict(self.labels, le=repr(bound))), cumulative
+
+        cumulative += self._counts[-1]
+        yield name + "_bucket" + _labels(dict(self.labels, le="+Inf")), cumulative
+        yield name + "_sum" + _labels(self.labels), self._sum
+        yield name + "_count" + _labels(self.labels), cumulative
+
+
+class MetricsRegistry:
+    """
+    Metric families by name, each with one child per label set. Asking
+    twice for the same name and labels returns the same child.
+    """
+
+    def __init__(self, prefix=""):
+        self._prefix = prefix
+        self._families = dict()
+        self._lock = threading.Lock()
+
+    def _child(self, kind, cls, name, help, labels, *args):
+        name = self._prefix + name
+        key = tuple(sorted(labels.items()))
+
+        with self._lock:
+            family = self._families.setdefault(name, (kind, help, dict()))
+
+            if family[0] != kind:
+                raise ValueError("{} is a {}, not a {}".format(name, family[0], kind))
+
+            children = family[2]
+
+            if key not in children:
+                children[key] = cls(labels, *args)
+
+            return children[key]
+
+    def counter(self, name, help, func=None, **labels):
+        return self._child("counter", Counter, name, help, labels, func)
+
+    def gauge(self, name, help, func, **labels):
+        return self._child("gauge", Gauge, name, help, labels, func)
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS, **labels):
+        return self._child("histogram", Histogram, name, help, labels, buckets)
+
+    def expose(self):
+        """
+        All metrics in the Prometheus text format.
+        """
+        lines = []
+
+        with self._lock:
+            families = [(name, kind, help, list(children.values()))
+                        for name, (kind, help, children) in self._families.items()]
+
+        for name, kind, help, children in families:
+            lines.append("# HELP {} {}".format(name, help))
+            lines.append("# TYPE {} {}".format(name, kind))
+
+            for child in children:
+                try:
+                    for sample, value in child.samples(name):
+                        lines.append("{} {}".format(sample, _number(value)))
+                except Exception as ex:
+                    logger.error("Couldn't read metric {}: {}".format(name, ex))
+
+        return "\n".join(lines) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+
+        body = self.server.registry.expose().encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _UnixServer(ThreadingUnixStreamServer):
+
+    daemon_threads = True
+
+    def get_request(self):
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        request, _ = super().get_request()
+        return request, ("local", 0)
+
+
+class _TCPServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+
+class MetricsServer:
+    """
+    Serves registry on a background thread. listen is host:port, or
+    unix:/path for a Unix socket.
+    """
+
+    def __init__(self, registry, listen):
+        self._listen = listen
+        self._path = None
+
+        if listen.startswith(UNIX_PREFIX):
+            self._path = listen[len(UNIX_PREFIX):]
+
+            if os.path.exists(self._path):
+                os.unlink(self._path)
+
+            self._server = _UnixServer(self._path, _Handler)
+        else:
+            host, _, port = listen.rpartition(":")
+            self._server = _TCPServer((host or "127.0.0.1", int(port)), _Handler)
+
+        self._server.registry = registry
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="metrics", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        logger.info("Serving metrics on " + self._listen)
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+        if self._path and os.path.exists(self._path):
+            os.unlink(self._path)
+
+
+def server_from_config(registry, config):
+    """
+    Starts the MetricsServer described by the [metrics] section, None
+    when there is none or listen is empty.
+    """
+    listen = config.get("listen", "") if config is not None else ""
+
+    if not listen:
+        return None
+
+    try:
+        return MetricsServer(registry, listen).start()
+    except (OSError, ValueError) as ex:
+        logger.error("Couldn't serve metrics on {}: {}".format(listen, ex))
+        return None
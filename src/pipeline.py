@@ -0,0 +1,184 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import asyncio
+
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DROP_NEWEST = "drop_newest"
+
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST)
+
+
+class StageQueue:
+    """
+    Bounded queue connecting two pipeline stages. When full, producers
+    either wait (block) or one item is discarded (drop_oldest/drop_newest).
+    Consumers call task_done() once an item was handled, join() waits
+    until every item put was. Must only be used from the event loop
+    thread.
+    """
+
+    def __init__(self, name, maxsize, overflow=OVERFLOW_BLOCK, on_drop=None):
+
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("Unknown overflow policy " + str(overflow))
+
+        if maxsize < 1:
+            raise ValueError("Queue size must be positive")
+
+        self.name = name
+        self.maxsize = maxsize
+        self.overflow = overflow
+        # Called with every item discarded by the overflow policy
+        self._on_drop = on_drop
+
+        self._queue = asyncio.Queue(maxsize)
+
+        self.put_count = 0
+        self.get_count = 0
+        self.dropped = 0
+        self.high_watermark = 0
+
+    def __len__(self):
+        return self._queue.qsize()
+
+    def full(self):
+        return self._queue.full()
+
+    def empty(self):
+        return self._queue.empty()
+
+    def _enqueued(self):
+        self.put_count += 1
+
+        if self._queue.qsize() > self.high_watermark:
+            self.high_watermark = self._queue.qsize()
+
+    def put_nowait(self, item):
+        """
+        Enqueues item without waiting. Returns False if item was not
+        enqueued: the queue is full and blocks, or drops newest items.
+        """
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+
+            if self.overflow == OVERFLOW_DROP_OLDEST:
+                self._dropped(self._queue.get_nowait())
+                self._queue.task_done()
+                self._queue.put_nowait(item)
+            else:
+                if self.overflow == OVERFLOW_DROP_NEWEST:
+                    self._dropped(item)
+                return False
+
+        self._enqueued()
+        return True
+
+    def _dropped(self, item):
+        self.dropped += 1
+
+        if self._on_drop is not None:
+            self._on_drop(item)
+
+    async def put(self, item):
+        """
+        Enqueues item, waiting for room when the policy is block.
+        Returns False if the item was dropped.
+        """
+        if self.overflow != OVERFLOW_BLOCK:
+            return self.put_nowait(item)
+
+        await self._queue.put(item)
+        self._enqueued()
+        return True
+
+    def get_nowait(self):
+        item = self._queue.get_nowait()
+        self.get_count += 1
+        return item
+
+    async def get(self):
+        item = await self._queue.get()
+        self.get_count += 1
+        return item
+
+    async def get_batch(self, max_items, timeout=0):
+        """
+        Waits for one item, then keeps collecting until max_items are
+        gathered or timeout seconds passed since the first one.
+        Without a timeout only the items already queued are taken.
+        """
+        batch = [await self.get()]
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        while len(batch) < max_items:
+            if not self._queue.empty():
+                batch.append(self.get_nowait())
+                continue
+
+            remaining = deadline - loop.time()
+
+            if remaining <= 0:
+                break
+
+            try:
+                batch.append(await asyncio.wait_for(self.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    def task_done(self, count=1):
+        for _ in range(count):
+            self._queue.task_done()
+
+    async def join(self):
+        await self._queue.join()
+
+    def drain(self):
+        """
+        Removes and returns the items still queued.
+        """
+        items = []
+
+        while not self._queue.empty():
+            items.append(self.get_nowait())
+            self._queue.task_done()
+
+        return items
+
+    def stats(self):
+        return {
+            "depth": self._queue.qsize(),
+            "capacity": self.maxsize,
+            "high_watermark": self.high_watermark,
+            "put": self.put_count,
+            "get": self.get_count,
+            "dropped": self.dropped,
+        }
+
+
+def queue_from_config(name, config, default_size=1024, on_drop=None):
+    """
+    Creates the queue feeding stage name from the [pipeline] section.
+    Per stage keys (<name>_queue_size, <name>_overflow) override the
+    defaults (queue_size, overflow).
+    """
+    size = int(config.get(name + "_queue_size",
+                          config.get("queue_size", default_size)))
+    overflow = config.get(name + "_overflow",
+                          config.get("overflow", OVERFLOW_BLOCK)).lower()
+
+    return StageQueue(name, size, overflow, on_drop)
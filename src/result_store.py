@@ -0,0 +1,333 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+
+Local store of verification outcomes. Query it with:
+    python result_store.py results.db failures --since 3600
+    python result_store.py results.db range --start 1658395439 --can-id 416 --failed
+    python result_store.py results.db summary
+"""
+
+import json
+import sqlite3
+import time
+
+from argparse import ArgumentParser
+
+from log_model import timestamp_value
+
+# Seconds per rollup bucket. Aggregates count at most two partial buckets
+# row by row, changing it needs a fresh store.
+BUCKET = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    chain TEXT NOT NULL,
+    id TEXT NOT NULL,
+    timestamp REAL,
+    can_id INTEGER,
+    count INTEGER,
+    message TEXT,
+    pcr TEXT,
+    signature_ok INTEGER NOT NULL,
+    -- NULL until the chain check decided, or when it is disabled
+    chain_ok INTEGER,
+    verified_at REAL NOT NULL,
+    PRIMARY KEY (chain, id)
+) WITHOUT ROWID;
+
+-- Covers the aggregates, they never read the table itself
+CREATE INDEX IF NOT EXISTS results_timestamp
+    ON results (timestamp, can_id, signature_ok, chain_ok);
+CREATE INDEX IF NOT EXISTS results_can_id ON results (can_id, timestamp);
+CREATE INDEX IF NOT EXISTS results_chain ON results (chain, timestamp);
+-- Failures are rare, finding them must not scan every success
+CREATE INDEX IF NOT EXISTS results_failed ON results (timestamp)
+    WHERE signature_ok = 0 OR chain_ok = 0;
+
+-- Counts per chain, BUCKET seconds and CAN ID (-1 when missing), kept up to date
+-- by the triggers below, so aggregates over millions of rows only read
+-- a few hundred
+CREATE TABLE IF NOT EXISTS rollup (
+    chain TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    can_id INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    signature_failed INTEGER NOT NULL,
+    chain_broken INTEGER NOT NULL,
+    chain_unchecked INTEGER NOT NULL,
+    failed INTEGER NOT NULL,
+    PRIMARY KEY (chain, bucket, can_id)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS results_rollup_insert AFTER INSERT ON results
+BEGIN
+    INSERT INTO rollup VALUES (
+        NEW.chain,
+        IFNULL(CAST(NEW.timestamp / {bucket} AS INTEGER), -1),
+        IFNULL(NEW.can_id, -1),
+        1,
+        NEW.signature_ok = 0,
+        IFNULL(NEW.chain_ok = 0, 0),
+        NEW.chain_ok IS NULL,
+        NEW.signature_ok = 0 OR IFNULL(NEW.chain_ok = 0, 0))
+    ON CONFLICT (chain, bucket, can_id) DO UPDATE SET
+        total = total + 1,
+        signature_failed = signature_failed + excluded.signature_failed,
+        chain_broken = chain_broken + excluded.chain_broken,
+        chain_unchecked = chain_unchecked + excluded.chain_unchecked,
+        failed = failed + excluded.failed;
+END;
+
+CREATE TRIGGER IF NOT EXISTS results_rollup_update
+AFTER UPDATE OF signature_ok, chain_ok ON results
+BEGIN
+    UPDATE rollup SET
+        signature_failed = signature_failed
+            + (NEW.signature_ok = 0) - (OLD.signature_ok = 0),
+        chain_broken = chain_broken
+            + IFNULL(NEW.chain_ok = 0, 0) - IFNULL(OLD.chain_ok = 0, 0),
+        chain_unchecked = chain_unchecked
+            + (NEW.chain_ok IS NULL) - (OLD.chain_ok IS NULL),
+        failed = failed
+            + (NEW.signature_ok = 0 OR IFNULL(NEW.chain_ok = 0, 0))
+            - (OLD.signature_ok = 0 OR IFNULL(OLD.chain_ok = 0, 0))
+    WHERE chain = OLD.chain
+      AND bucket = IFNULL(CAST(OLD.timestamp / {bucket} AS INTEGER), -1)
+      AND can_id = IFNULL(OLD.can_id, -1);
+END;
+"""
+
+_COUNTS = ("COUNT(*), SUM(signature_ok = 0), SUM(IFNULL(chain_ok = 0, 0)),"
+           " SUM(chain_ok IS NULL), SUM(signature_ok = 0 OR IFNULL(chain_ok = 0, 0))")
+
+_ROLLUP_COUNTS = ("SUM(total), SUM(signature_failed), SUM(chain_broken),"
+                  " SUM(chain_unchecked), SUM(failed)")
+
+_UPSERT = """
+INSERT INTO results (chain, id, timestamp, can_id, count, message, pcr,
+                     signature_ok, verified_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (chain, id) DO UPDATE SET
+    signature_ok = excluded.signature_ok,
+    verified_at = excluded.verified_at
+"""
+
+_SET_CHAIN = "UPDATE results SET chain_ok = ? WHERE chain = ? AND id = ?"
+
+COLUMNS = ("chain", "id", "timestamp", "can_id", "count", "message", "pcr",
+           "signature_ok", "chain_ok", "verified_at")
+
+
+def _id(value):
+    # Insights may return ids as {"$oid": "..."}
+    return value if isinstance(value, str) else json.dumps(value, sort_keys=True)
+
+
+class ResultStore:
+    """
+    Keeps one row per verified log in SQLite (WAL, so queries don't
+    block the verifier). Outcomes are buffered and written in one
+    transaction per flush().
+    """
+
+    def __init__(self, path, flush_size=1024):
+        self._path = path
+        self._flush_size = flush_size
+
+        # Written from the verifier thread only, closed from the main one
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA.format(bucket=BUCKET))
+
+        self._rows = []
+        self._chain_updates = []
+
+    def add(self, chain, obj, signature_ok):
+        self._rows.append((chain, _id(obj.id), timestamp_value(obj.timestamp),
+                           obj.can_id if isinstance(obj.can_id, int) else None,
+                           obj.count, obj.message, obj.pcr,
+                           1 if signature_ok else 0, time.time()))
+
+        if len(self._rows) >= self._flush_size:
+            self.flush()
+
+    def set_chain_ok(self, chain, obj, chain_ok):
+        self._chain_updates.append((1 if chain_ok else 0, chain, _id(obj.id)))
+
+    def flush(self):
+        if not self._rows and not self._chain_updates:
+            return
+
+        with self._db:
+            self._db.executemany(_UPSERT, self._rows)
+            self._db.executemany(_SET_CHAIN, self._chain_updates)
+
+        self._rows = []
+        self._chain_updates = []
+
+    def close(self):
+        self.flush()
+        self._db.close()
+
+    # Queries
+
+    @staticmethod
+    def _where(start=None, end=None, can_id=None, chain=None, failed=False):
+        clauses = []
+        params = []
+
+        if start is not None:
+            clauses.append("timestamp >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("timestamp <= ?")
+            params.append(end)
+        if can_id is not None:
+            clauses.append("can_id = ?")
+            params.append(can_id)
+        if chain is not None:
+            clauses.append("chain = ?")
+            params.append(chain)
+        if failed:
+            clauses.append("(signature_ok = 0 OR chain_ok = 0)")
+
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def range(self, start=None, end=None, can_id=None, chain=None,
+              failed=False, limit=1000):
+        """
+        Rows in [start, end] as dicts, oldest first.
+        """
+        where, params = self._where(start, end, can_id, chain, failed)
+        cursor = self._db.execute(
+            "SELECT {} FROM results{} ORDER BY timestamp LIMIT ?".format(
+                ", ".join(COLUMNS), where), params + [limit])
+
+        return [dict(zip(COLUMNS, row)) for row in cursor]
+
+    def _counts(self, start, end, chain):
+        """
+        {can_id: [total, signature_failed, chain_broken, chain_unchecked,
+        failed]} over [start, end]. Whole buckets come from the rollup,
+        only the partial buckets at the edges are counted from the rows.
+        """
+        if start is None and end is None:
+            first, last = -1, 1 << 62
+        else:
+            # Bucket -1 holds logs without a timestamp, no range has them
+            first = 0 if start is None else max(-(-start // BUCKET), 0)
+            last = 1 << 62 if end is None else end // BUCKET
+
+        parts = []
+
+        if first < last:
+            chain_clause = " AND chain = ?" if chain is not None else ""
+            parts.append(self._db.execute(
+                "SELECT can_id, {} FROM rollup WHERE bucket >= ? AND bucket < ?{}"
+                " GROUP BY can_id".format(_ROLLUP_COUNTS, chain_clause),
+                [int(first), int(last)] + ([chain] if chain is not None else [])))
+
+            edges = []
+            if start is not None:
+                edges.append((start, first * BUCKET, True))
+            if end is not None:
+                edges.append((last * BUCKET, end, False))
+        else:
+            edges = [(start, end, False)]
+
+        for edge_start, edge_end, exclusive in edges:
+            where, params = self._where(edge_start, edge_end, chain=chain)
+
+            if exclusive:
+                where = where.replace("timestamp <= ?", "timestamp < ?")
+
+            parts.append(self._db.execute(
+                "SELECT IFNULL(can_id, -1), {} FROM results{} GROUP BY can_id".format(
+                    _COUNTS, where), params))
+
+        counts = dict()
+
+        for cursor in parts:
+            for row in cursor:
+                totals = counts.setdefault(row[0], [0] * 5)
+
+                for index, value in enumerate(row[1:]):
+                    totals[index] += value or 0
+
+        return counts
+
+    def failures_by_can_id(self, start=None, end=None, chain=None):
+        """
+        [(can_id, failed, total)] in [start, end], most failures first.
+        can_id is None for logs without one.
+        """
+        rows = [(can_id if can_id != -1 else None, totals[4], totals[0])
+                for can_id, totals in self._counts(start, end, chain).items()
+                if totals[0]]
+
+        return sorted(rows, key=lambda row: (-row[1], row[0] if row[0] is not None else -1))
+
+    def summary(self, start=None, end=None, chain=None):
+        totals = [0] * 5
+
+        for counts in self._counts(start, end, chain).values():
+            totals = [a + b for a, b in zip(totals, counts)]
+
+        where, params = self._where(start, end, chain=chain)
+        # Separate queries, SQLite only walks the index to one end for
+        # a lone MIN() or MAX()
+        first, = self._db.execute(
+            "SELECT MIN(timestamp) FROM results{}".format(where), params).fetchone()
+        last, = self._db.execute(
+            "SELECT MAX(timestamp) FROM results{}".format(where), params).fetchone()
+
+        return {
+            "total": totals[0],
+            "signature_failed": totals[1],
+            "chain_broken": totals[2],
+            "chain_unchecked": totals[3],
+            "first": first,
+            "last": last,
+        }
+
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(description="Query verification results.")
+    parser.add_argument("db", type=str, help="Path to the result store.")
+    parser.add_argument("query", choices=("range", "failures", "summary"))
+    parser.add_argument("--start", type=float, help="Unix time.")
+    parser.add_argument("--end", type=float, help="Unix time.")
+    parser.add_argument("--since", type=float, help="Seconds before now, instead of --start.")
+    parser.add_argument("--can-id", type=int)
+    parser.add_argument("--chain", type=str)
+    parser.add_argument("--failed", action="store_true", help="Only failed logs.")
+    parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+
+    start = time.time() - args.since if args.since is not None else args.start
+    store = ResultStore(args.db)
+
+    try:
+        if args.query == "range":
+            for row in store.range(start, args.end, args.can_id, args.chain,
+                                   args.failed, args.limit):
+                print(json.dumps(row))
+
+        elif args.query == "failures":
+            for can_id, failed, total in store.failures_by_can_id(start, args.end,
+                                                                   args.chain):
+                print("{:>10} {:>10} failed of {:>10}".format(str(can_id), failed, total))
+
+        else:
+            print(json.dumps(store.summary(start, args.end, args.chain), indent=2))
+    finally:
+        store.close()
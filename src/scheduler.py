@@ -0,0 +1,90 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+MODE_POLL = "poll"
+MODE_CATCH_UP = "catch_up"
+
+
+class PollScheduler:
+    """
+    Paces the verifier's polls. While polls come back full the interval
+    drops to min_interval and the page size doubles up to max_page; an
+    empty poll doubles the interval up to max_interval and halves the
+    page size down to min_page. Once the newest fetched log is more than
+    catch_up_lag seconds old, polls switch to parallel catch-up, which
+    polls again straight away for as long as they return logs.
+    """
+
+    def __init__(self, min_interval=1.0, max_interval=60.0,
+                 min_page=100, max_page=5000, catch_up_lag=300.0):
+        self._min_interval = min_interval
+        self._max_interval = max(max_interval, min_interval)
+        self._min_page = min_page
+        self._max_page = max(max_page, min_page)
+        self._catch_up_lag = catch_up_lag
+
+        self._interval = min_interval
+        self._page_size = min_page
+        self._mode = MODE_POLL
+
+        self.empty_polls = 0
+        self.full_polls = 0
+
+    @property
+    def interval(self):
+        """
+        Seconds to wait before the next poll.
+        """
+        return self._interval
+
+    @property
+    def page_size(self):
+        return self._page_size
+
+    @property
+    def mode(self):
+        return self._mode
+
+    def next_mode(self, lag):
+        """
+        Picks the mode of the next poll from the fetch lag in seconds,
+        None when unknown.
+        """
+        if lag is not None and self._catch_up_lag and lag > self._catch_up_lag:
+            self._mode = MODE_CATCH_UP
+        else:
+            self._mode = MODE_POLL
+
+        return self._mode
+
+    def update(self, fetched):
+        """
+        Adapts interval and page size to the number of logs the last
+        poll returned.
+        """
+        if self._mode == MODE_CATCH_UP and fetched:
+            # More is waiting, poll again straight away
+            self._interval = 0
+            return
+
+        if fetched == 0:
+            self.empty_polls += 1
+            self._interval = min(max(self._interval, self._min_interval) * 2,
+                                 self._max_interval)
+            self._page_size = max(self._page_size // 2, self._min_page)
+
+        elif fetched >= self._page_size:
+            self.full_polls += 1
+            self._interval = self._min_interval
+            self._page_size = min(self._page_size * 2, self._max_page)
+
+        else:
+            self._interval = max(self._interval / 2, self._min_interval)
@@ -0,0 +1,263 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import hashlib
+import os
+import struct
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha1
+
+from merkle import verify_proof
+
+TPM2_ALG_RSA = 0x0001
+TPM2_ALG_SHA1 = 0x0004
+TPM2_ALG_SHA256 = 0x000B
+TPM2_ALG_SHA384 = 0x000C
+TPM2_ALG_SHA512 = 0x000D
+TPM2_ALG_NULL = 0x0010
+TPM2_ALG_RSASSA = 0x0014
+TPM2_ALG_RSAPSS = 0x0016
+TPM2_ALG_OAEP = 0x0017
+
+# Hash function and DER encoded DigestInfo prefix (RFC 8017, 9.2)
+HASH_ALGS = {
+    TPM2_ALG_SHA1: (hashlib.sha1,
+                    bytes.fromhex("3021300906052b0e03021a05000414")),
+    TPM2_ALG_SHA256: (hashlib.sha256,
+                      bytes.fromhex("3031300d060960864801650304020105000420")),
+    TPM2_ALG_SHA384: (hashlib.sha384,
+                      bytes.fromhex("3041300d060960864801650304020205000430")),
+    TPM2_ALG_SHA512: (hashlib.sha512,
+                      bytes.fromhex("3051300d060960864801650304020305000440")),
+}
+
+
+class _Reader:
+    """
+    Reads big endian TPM structures.
+    """
+
+    def __init__(self, data):
+        self._data = data
+        self._offset = 0
+
+    def u16(self):
+        value, = struct.unpack_from(">H", self._data, self._offset)
+        self._offset += 2
+        return value
+
+    def u32(self):
+        value, = struct.unpack_from(">I", self._data, self._offset)
+        self._offset += 4
+        return value
+
+    def sized(self):
+        size = self.u16()
+        value = self._data[self._offset:self._offset + size]
+
+        if len(value) != size:
+            raise ValueError("Truncated TPM structure")
+
+        self._offset += size
+        return value
+
+
+def load_rsa_public_key(path):
+    """
+    Returns (modulus, exponent) from a TPM2B_PUBLIC file,
+    as written by tpm2_create -u.
+    """
+    with open(path, "rb") as f:
+        reader = _Reader(f.read())
+
+    reader.u16()                        # size
+
+    if reader.u16() != TPM2_ALG_RSA:
+        raise ValueError("Not an RSA public key: " + path)
+
+    reader.u16()                        # nameAlg
+    reader.u32()                        # objectAttributes
+    reader.sized()                      # authPolicy
+
+    if reader.u16() != TPM2_ALG_NULL:   # symmetric
+        reader.u16()                    # keyBits
+        reader.u16()                    # mode
+
+    if reader.u16() in (TPM2_ALG_RSASSA, TPM2_ALG_RSAPSS, TPM2_ALG_OAEP):
+        reader.u16()                    # scheme hashAlg
+
+    reader.u16()                        # keyBits
+    exponent = reader.u32() or 65537
+    modulus = int.from_bytes(reader.sized(), "big")
+
+    return modulus, exponent
+
+
+def parse_signature(data):
+    """
+    Returns (hash_alg, signature) from a marshalled TPMT_SIGNATURE,
+    the format tpm2_sign writes by default.
+    """
+    reader = _Reader(data)
+
+    if reader.u16() != TPM2_ALG_RSASSA:
+        raise ValueError("Only RSASSA signatures are supported")
+
+    hash_alg = reader.u16()
+    return hash_alg, reader.sized()
+
+
+class SoftwareVerifier:
+    """
+    Verifies log signatures in-process with the public key, without a TPM.
+    The signed data is the hex sha-1 digest of the message (or the Merkle
+    root), exactly what tpm2_sign was given by the logger.
+    """
+
+    # Number of verified Merkle roots remembered
+    ROOT_CACHE_SIZE = 1024
+
+    def __init__(self, public_key):
+        self._modulus, self._exponent = load_rsa_public_key(public_key)
+        self._size = (self._modulus.bit_length() + 7) // 8
+
+        self._verified_roots = OrderedDict()
+
+    def _verify_digest(self, digest, signature):
+
+        try:
+            if isinstance(signature, str):
+                signature = bytes.fromhex(signature)
+
+            hash_alg, signature = parse_signature(signature)
+            hash_func, prefix = HASH_ALGS[hash_alg]
+        except (KeyError, TypeError, ValueError, struct.error):
+            return False
+
+        if len(signature) != self._size:
+            return False
+
+        value = int.from_bytes(signature, "big")
+
+        if value >= self._modulus:
+            return False
+
+        encoded = pow(value, self._exponent, self._modulus).to_bytes(self._size, "big")
+
+        # EMSA-PKCS1-v1_5: 00 01 FF..FF 00 DigestInfo
+        info = prefix + hash_func(digest.encode()).digest()
+        expected = b"\x00\x01" + b"\xff" * (self._size - len(info) - 3) + b"\x00" + info
+
+        return encoded == expected
+
+    def verify(self, message, signature, root=None, proof=None,
+               leaf_index=None, batch_size=None):
+        return self._verify_leaf(sha1(message.encode()).digest(), signature, root,
+                                 proof, leaf_index, batch_size)
+
+    def _verify_leaf(self, leaf, signature, root, proof, leaf_index, batch_size):
+        """
+        verify() with the sha-1 digest of the message instead of it.
+        """
+        if root is None:
+            return self._verify_digest(leaf.hex(), signature)
+
+        try:
+            included = verify_proof(leaf,
+                                    int(leaf_index), int(batch_size),
+                                    [bytes.fromhex(node) for node in proof],
+                                    bytes.fromhex(root))
+        except (TypeError, ValueError):
+            return False
+
+        if not included:
+            return False
+
+        key = (root, signature)
+
+        if key in self._verified_roots:
+            self._verified_roots.move_to_end(key)
+            return True
+
+        if not self._verify_digest(root, signature):
+            return False
+
+        self._verified_roots[key] = True
+
+        if len(self._verified_roots) > self.ROOT_CACHE_SIZE:
+            self._verified_roots.popitem(last=False)
+
+        return True
+
+    def verify_batch(self, batch):
+        """
+        Returns one boolean per log of a LogBatch, in order. Messages are
+        hashed straight from the batch's buffer.
+        """
+        return [self._verify_leaf(sha1(batch.message_bytes(index)).digest(),
+                                  batch.signature(index), batch.roots[index],
+                                  batch.proofs[index], batch.leaf_indexes[index],
+                                  batch.batch_sizes[index])
+                for index in range(len(batch))]
+
+
+_worker_verifier = None
+
+
+def _init_worker(public_key):
+    global _worker_verifier
+    _worker_verifier = SoftwareVerifier(public_key)
+
+
+def _verify_chunk(chunk):
+    return _worker_verifier.verify_batch(chunk)
+
+
+class ParallelVerifier:
+    """
+    Spreads batches over a pool of processes, each holding its own
+    SoftwareVerifier. workers defaults to the number of cores.
+    """
+
+    def __init__(self, public_key, workers=None, chunk_size=64):
+        self._workers = workers or os.cpu_count() or 1
+        self._chunk_size = chunk_size
+
+        # Fail early on a bad key, not inside the workers
+        load_rsa_public_key(public_key)
+
+        self._pool = ProcessPoolExecutor(max_workers=self._workers,
+                                         initializer=_init_worker,
+                                         initargs=(public_key,))
+
+    @property
+    def workers(self):
+        return self._workers
+
+    def verify_batch(self, batch):
+        """
+        Returns one boolean per log of a LogBatch, in order. Workers get
+        their chunk as a LogBatch too, a few buffers to pickle.
+        """
+        chunks = [batch.select(range(i, min(i + self._chunk_size, len(batch))))
+                  for i in range(0, len(batch), self._chunk_size)]
+
+        results = []
+
+        for chunk_results in self._pool.map(_verify_chunk, chunks):
+            results.extend(chunk_results)
+
+        return results
+
+    def close(self):
+        self._pool.shutdown(wait=True)
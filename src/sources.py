@@ -0,0 +1,552 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+
+Where the verifier gets its logs from. A source runs on the verifier's
+main thread and hands every log to enqueue(obj, timeout=None), which
+blocks while the working queue is full and returns False once the
+verifier stops. With a timeout it raises queue.Full once that many
+seconds passed.
+"""
+
+import json
+import os
+import select
+import sys
+import time
+
+from queue import Full
+
+from log import logger
+from log_model import LogModel, timestamp_value, document
+from scheduler import PollScheduler, MODE_CATCH_UP
+from wire import codec_from_config
+
+SOURCE_INSIGHTS = "insights"
+SOURCE_MQTT = "mqtt"
+SOURCE_FILE = "file"
+
+READ_CHUNK_SIZE = 65536
+
+
+def _key(obj):
+    return timestamp_value(obj.timestamp), obj.id
+
+
+class LogSource:
+    """
+    Base of the sources. name is the chain their checkpoints are
+    journaled under.
+    """
+
+    name = None
+
+    def resume(self, checkpoint):
+        """
+        Continues past checkpoint, the journal entry of this source's
+        chain, None when there is none.
+        """
+        pass
+
+    def run(self, enqueue, stopped):
+        """
+        Feeds logs to enqueue until the stopped Event is set.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def metrics(self):
+        return dict()
+
+
+class InsightsSource(LogSource):
+    """
+    Polls the Bosch IoT Insights collection, see PollScheduler for the
+    pacing. Resumes with a keyset query past the checkpoint.
+    """
+
+    def __init__(self, log_requestor, scheduler, name, settle_delay=5, time_file=None):
+        self.name = name
+        self._log_requestor = log_requestor
+        self._scheduler = scheduler
+        # Logs younger than this may still be on their way, left for
+        # the next poll so none with an older timestamp is skipped
+        self._settle_delay = settle_delay
+        # Only read when there is no checkpoint, to migrate older installs
+        self._time_n_file = time_file
+
+        # Fetching resumes past this (timestamp, id) key
+        self._fetch_start = None
+        self._fetch_after = None
+        self._fetch_inclusive = False
+        self._enqueue = None
+
+        self.failed_polls = 0
+
+    def resume(self, checkpoint):
+        if checkpoint is None:
+            self._fetch_start = self._read_time_file()
+            logger.info("No checkpoint, verifying from {}".format(self._fetch_start))
+            return
+
+        self._fetch_after = tuple(checkpoint["after"])
+        self._fetch_inclusive = checkpoint["inclusive"]
+
+        logger.info("Resuming after log {}".format(self._fetch_after[1]))
+
+    def run(self, enqueue, stopped):
+        self._enqueue = enqueue
+
+        while not stopped.is_set():
+
+            try:
+                if self._scheduler.next_mode(self._fetch_lag()) == MODE_CATCH_UP:
+                    fetched = self._catch_up()
+                else:
+                    fetched = self._fetch()
+            except self._log_requestor.errors as ex:
+                # Retried after the backoff of an empty poll, logs already
+                # queued moved the resume key along
+                logger.error("Couldn't query Insights: {}".format(ex))
+                self.failed_polls += 1
+                fetched = 0
+
+            self._scheduler.update(fetched)
+            stopped.wait(self._scheduler.interval)
+
+    def _fetch_progress(self):
+        """
+        Timestamp up to which logs were fetched, None if unknown.
+        """
+        progress = [self._fetch_start] if self._fetch_start is not None else []
+
+        if self._fetch_after is not None:
+            progress.append(timestamp_value(self._fetch_after[0]))
+
+        return max(progress) if progress else None
+
+    def _fetch_lag(self):
+        progress = self._fetch_progress()
+        return time.time() - progress if progress is not None else None
+
+    def _fetch(self):
+        """
+        Streams the logs past the last fetched one into the working
+        queue, verification starts while later pages still download.
+        Returns the number of logs queued.
+        """
+        count = 0
+        end = time.time() - self._settle_delay
+
+        for obj in self._log_requestor.stream(self._fetch_start, end,
+                                              self._scheduler.page_size,
+                                              after=self._fetch_after,
+                                              after_inclusive=self._fetch_inclusive):
+            if not self._enqueue(obj):
+                return count
+
+            self._fetch_after = (obj.timestamp, obj.id)
+            self._fetch_inclusive = False
+            count += 1
+
+        # Everything up to end is fetched, a quiet collection doesn't
+        # leave the lag growing and the scheduler stuck in catch-up
+        if self._fetch_start is None or end > self._fetch_start:
+            self._fetch_start = end
+
+        return count
+
+    def _catch_up(self):
+        """
+        Fetches the next concurrency * fetch_window seconds of backlog
+        as concurrent sub-windows. Without sub-windows configured this
+        is a regular poll with the largest page size.
+        """
+        window = self._log_requestor.window
+
+        if window is None:
+            return self._fetch()
+
+        start = self._fetch_progress()
+        end = min(start + window * self._log_requestor.concurrency,
+                  time.time() - self._settle_delay)
+
+        objs = self._log_requestor.request_all(start, end, self._scheduler.page_size,
+                                               after=self._fetch_after,
+                                               after_inclusive=self._fetch_inclusive)
+
+        for obj in objs:
+            if not self._enqueue(obj):
+                return 0
+
+            self._fetch_after = (obj.timestamp, obj.id)
+            self._fetch_inclusive = False
+
+        # Everything up to end is fetched, even if the range was empty
+        self._fetch_start = end
+        logger.info("Catching up, {} logs up to {}".format(len(objs), end))
+
+        return len(objs)
+
+    def close(self):
+        self._log_requestor.close()
+
+    def metrics(self):
+        return {
+            "fetch_lag_seconds": self._fetch_lag(),
+            "poll_mode": self._scheduler.mode,
+            "poll_interval": self._scheduler.interval,
+            "page_size": self._scheduler.page_size,
+            "failed_polls": self.failed_polls,
+            "malformed": self._log_requestor.malformed,
+        }
+
+    def _read_time_file(self):
+        """
+        Reads the start time left by versions without a checkpoint
+        journal.
+        :return: unix time, None to start from the oldest log
+        """
+        if not self._time_n_file:
+            return None
+
+        try:
+            with open(self._time_n_file, "r") as f:
+                str_time = f.readline()
+        except FileNotFoundError:
+            return None
+
+        try:
+            unix_time = float(str_time)
+        except ValueError:
+            logger.error("Could not convert to unix time from file")
+            return None
+
+        return unix_time
+
+
+class _PushSource(LogSource):
+    """
+    Sources the logs are pushed to. They can't be asked for the logs
+    past a checkpoint; after a restart, logs up to it (redelivered by
+    the broker or still in the file) are skipped until the first one
+    past it, everything after that is verified in arrival order.
+    """
+
+    def __init__(self):
+        self._after = None
+        self._inclusive = False
+
+        self.received = 0
+        self.skipped = 0
+        self.malformed = 0
+
+    def resume(self, checkpoint):
+        if checkpoint is None:
+            return
+
+        self._after = (timestamp_value(checkpoint["after"][0]), checkpoint["after"][1])
+        self._inclusive = checkpoint["inclusive"]
+
+        logger.info("Skipping logs up to {}".format(self._after[1]))
+
+    def _decode(self, record):
+        try:
+            obj = LogModel().from_json(document(record))
+        except (ValueError, TypeError, AttributeError):
+            obj = None
+
+        if obj is None:
+            self.malformed += 1
+            logger.warning("Dropping malformed log")
+
+        return obj
+
+    def _push(self, enqueue, records):
+        """
+        Queues the decoded records. Returns False once the verifier
+        stopped.
+        """
+        for record in records:
+            obj = self._decode(record)
+
+            if obj is None:
+                continue
+
+            self.received += 1
+
+            if self._after is not None:
+                key = _key(obj)
+
+                if key < self._after or (key == self._after and not self._inclusive):
+                    self.skipped += 1
+                    continue
+
+                self._after = None
+
+            if not enqueue(obj):
+                return False
+
+        return True
+
+    def metrics(self):
+        return {
+            "received": self.received,
+            "skipped": self.skipped,
+            "malformed": self.malformed,
+        }
+
+
+class MQTTSource(_PushSource):
+    """
+    Subscribes to the logger's log_events/ topic. A message holds one
+    log, or a batch as newline delimited JSON or a JSON array, or as an
+    array in the [mqtt] wire_format (see BatchPublisher). Logs are
+    queued from paho's network thread, which has to get back to the
+    broker before the keepalive runs out: while the queue stays full
+    for queue_timeout seconds the rest of the message is dropped.
+    """
+
+    def __init__(self, config, name="log_events"):
+        super().__init__()
+
+        # Imported here, the other sources don't need paho
+        from client_mqtt import MQTTClient
+
+        self.name = name
+        self.dropped = 0
+        self._enqueue = None
+        self._queue_timeout = float(config.get("queue_timeout", 1))
+        self._full = False
+        self._codec = codec_from_config(config)
+        self._client = MQTTClient(config["user"], config["passwd"],
+                                  config["host"], int(config["port"]),
+                                  service_name="LogVerifier",
+                                  on_message_callback=self._on_new_message,
+                                  subscribe_topic="log_events/",
+                                  subscribe_qos=int(config.get("qos", 0)))
+
+    def run(self, enqueue, stopped):
+        self._enqueue = enqueue
+        self._client.connect()
+        logger.info("Subscribed to log_events/")
+
+        stopped.wait()
+
+    def decode_payload(self, payload):
+        """
+        The logs of a log_events/ message as dicts.
+        """
+        return self._codec.decode(payload)
+
+    def _on_new_message(self, mqttc, obj, msg):
+        try:
+            records = self.decode_payload(msg.payload)
+        except (ValueError, AttributeError, TypeError):
+            # e.g. a CBOR payload holding something else than maps
+            self.malformed += 1
+            logger.warning("Dropping malformed message on log_events/")
+            return
+
+        self._full = False
+        self._push(self._enqueue_or_drop, records)
+
+        if self._full:
+            logger.warning("Verification falling behind, dropped logs "
+                           "from log_events/")
+
+    def _enqueue_or_drop(self, obj):
+        """
+        Queues obj without holding up paho's network thread for more than
+        queue_timeout. Once a log timed out, the rest of the message is
+        dropped without waiting.
+        """
+        if not self._full:
+            try:
+                return self._enqueue(obj, self._queue_timeout)
+            except Full:
+                self._full = True
+
+        self.dropped += 1
+        return True
+
+    def metrics(self):
+        metrics = super().metrics()
+        metrics["dropped"] = self.dropped
+        return metrics
+
+    def close(self):
+        self._client.stop()
+
+
+class FileSource(_PushSource):
+    """
+    Reads newline delimited logs from a file, or stdin for "-". Lines
+    hold logs as published on log_events/ or documents exported from
+    Insights. With follow the file is tailed like tail -F: the source
+    waits for new lines and reopens the file when it is rotated.
+    """
+
+    def __init__(self, path, follow=True, poll_interval=0.1, name=None):
+        super().__init__()
+
+        self.name = name or ("stdin" if path == "-" else os.path.basename(path))
+        self._path = path
+        self._follow = follow
+        self._poll_interval = poll_interval
+
+        self._fd = None
+        self._position = 0
+        self._buffer = b""
+
+    def _open(self):
+        if self._path == "-":
+            self._fd = sys.stdin.fileno()
+        else:
+            self._fd = os.open(self._path, os.O_RDONLY)
+
+        self._position = 0
+        self._buffer = b""
+
+    def _rotated(self):
+        """
+        True once path names another file than the open one, or the
+        open one was truncated.
+        """
+        if self._path == "-":
+            return False
+
+        try:
+            current = os.stat(self._path)
+        except FileNotFoundError:
+            return False
+
+        return current.st_ino != os.fstat(self._fd).st_ino or \
+            current.st_size < self._position
+
+    def _read(self, stopped):
+        """
+        Next chunk, b"" at the end of the file. Waits at most
+        poll_interval for a pipe to become readable.
+        """
+        readable, _, _ = select.select([self._fd], [], [], self._poll_interval)
+
+        if stopped.is_set() or not readable:
+            return None
+
+        chunk = os.read(self._fd, READ_CHUNK_SIZE)
+        self._position += len(chunk)
+
+        return chunk
+
+    def run(self, enqueue, stopped):
+        self._open()
+        logger.info("Reading logs from {}".format(self._path))
+
+        while not stopped.is_set():
+            chunk = self._read(stopped)
+
+            if chunk is None:
+                continue
+
+            if not chunk:
+                if not self._follow or self._path == "-":
+                    break
+
+                if self._rotated():
+                    logger.info("{} was rotated, reopening".format(self._path))
+                    self._push_lines(enqueue, [self._buffer])
+                    os.close(self._fd)
+                    self._open()
+                else:
+                    stopped.wait(self._poll_interval)
+
+                continue
+
+            lines = (self._buffer + chunk).split(b"\n")
+            self._buffer = lines.pop()
+
+            if not self._push_lines(enqueue, lines):
+                return
+
+        if not stopped.is_set():
+            # An unterminated last line of a finished file
+            self._push_lines(enqueue, [self._buffer])
+            logger.info("Reached the end of {}".format(self._path))
+
+    def _push_lines(self, enqueue, lines):
+        records = []
+
+        for line in lines:
+            if not line.strip():
+                continue
+
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                self.malformed += 1
+                logger.warning("Dropping malformed line")
+
+        return self._push(enqueue, records)
+
+    def close(self):
+        if self._fd is not None and self._path != "-":
+            os.close(self._fd)
+            self._fd = None
+
+
+def source_from_config(config):
+    """
+    Creates the source named by source in [processing].
+    """
+    kind = config["processing"].get("source", SOURCE_INSIGHTS)
+
+    if kind == SOURCE_MQTT:
+        return MQTTSource(config["mqtt"], config["mqtt"].get("chain", "log_events"))
+
+    if kind == SOURCE_FILE:
+        return FileSource(config["file"].get("path", "-"),
+                          follow=config["file"].getboolean("follow", True),
+                          poll_interval=float(config["file"].get("poll_interval", 0.1)),
+                          name=config["file"].get("chain"))
+
+    if kind != SOURCE_INSIGHTS:
+        raise ValueError("Unknown log source " + str(kind))
+
+    # Imported here, the push sources don't need requests
+    from log_requestor import LogRequestor
+
+    log_requestor = LogRequestor(
+        config["bosch-iot"]["username"],
+        config["bosch-iot"]["password"],
+        config["bosch-iot"]["url"],
+        config["bosch-iot"]["collection"],
+        config["bosch-iot"]["token"],
+        pool_size=int(config["bosch-iot"].get("pool_size", 4)),
+        concurrency=int(config["bosch-iot"].get("fetch_concurrency", 1)),
+        window=float(config["bosch-iot"].get("fetch_window", 0)) or None
+    )
+
+    # Polls speed up and ask for bigger pages while results come back
+    # full, back off while empty, and fetch concurrent sub-windows
+    # once more than catch_up_lag seconds behind
+    pooling_cycle = float(config["processing"]["pooling_cycle"])
+    scheduler = PollScheduler(
+        min_interval=float(config["processing"].get("min_poll_interval", pooling_cycle)),
+        max_interval=float(config["processing"].get("max_poll_interval", 60)),
+        min_page=int(config["processing"].get("page_size", 500)),
+        max_page=int(config["processing"].get("max_page_size", 5000)),
+        catch_up_lag=float(config["processing"].get("catch_up_lag", 300)))
+
+    # One chain per collection
+    return InsightsSource(log_requestor, scheduler, config["bosch-iot"]["collection"],
+                          settle_delay=float(config["processing"].get("settle_delay", 5)),
+                          time_file=config["processing"].get("time_file"))
@@ -0,0 +1,253 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import mmap
+import os
+import struct
+import zlib
+
+from log import logger
+
+# Every record is framed as: payload length, crc32 of payload, payload
+RECORD_HEADER = struct.Struct("<II")
+
+SEGMENT_PREFIX = "spool-"
+SEGMENT_SUFFIX = ".seg"
+CURSOR_FILE = "cursor"
+
+
+class Spool:
+    """
+    Append-only store for signed logs that couldn't be published.
+    Records are written to numbered segment files and read back in
+    order from a persisted cursor. Segments behind the cursor are
+    deleted, and the oldest ones are dropped when the spool outgrows
+    max_bytes, so disk usage stays bounded.
+    """
+
+    def __init__(self, directory, segment_bytes=1 << 20, max_bytes=16 << 20):
+
+        self._directory = directory
+        self._segment_bytes = segment_bytes
+        self._max_bytes = max(max_bytes, segment_bytes)
+
+        os.makedirs(directory, exist_ok=True)
+
+        self._segments = sorted(self._list_segments())
+        self._sizes = {seq: os.path.getsize(self._segment_path(seq))
+                       for seq in self._segments}
+
+        self._read_seq, self._read_offset = self._load_cursor()
+
+        self._writer = None
+        self._write_seq = None
+
+        self.dropped_segments = 0
+        self.corrupted = 0
+
+        self._collect()
+
+    def _segment_path(self, seq):
+        return os.path.join(self._directory,
+                            "{}{:010d}{}".format(SEGMENT_PREFIX, seq, SEGMENT_SUFFIX))
+
+    def _list_segments(self):
+        for name in os.listdir(self._directory):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                try:
+                    yield int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+                except ValueError:
+                    continue
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self._directory, CURSOR_FILE), "r") as f:
+                seq, offset = f.read().split()
+                return int(seq), int(offset)
+        except (OSError, ValueError):
+            pass
+
+        if self._segments:
+            return self._segments[0], 0
+
+        return 0, 0
+
+    def _save_cursor(self):
+        path = os.path.join(self._directory, CURSOR_FILE)
+        tmp = path + ".tmp"
+
+        with open(tmp, "w") as f:
+            f.write("{} {}".format(self._read_seq, self._read_offset))
+
+        os.replace(tmp, path)
+
+    @property
+    def size(self):
+        """
+        Bytes currently used by the segment files.
+        """
+        return sum(self._sizes.values())
+
+    def __bool__(self):
+        return self.has_pending()
+
+    def has_pending(self):
+        for seq in self._segments:
+            if seq > self._read_seq:
+                return True
+            if seq == self._read_seq and self._sizes[seq] > self._read_offset:
+                return True
+
+        return False
+
+    def _open_writer(self):
+        self._write_seq = self._segments[-1] + 1 if self._segments else self._read_seq
+        self._writer = open(self._segment_path(self._write_seq), "ab")
+        self._segments.append(self._write_seq)
+        self._sizes[self._write_seq] = 0
+
+    def append(self, records):
+        """
+        Appends a sequence of byte records.
+        """
+        for record in records:
+            frame = RECORD_HEADER.pack(len(record), zlib.crc32(record)) + record
+
+            if self._writer is None or \
+                    self._sizes[self._write_seq] + len(frame) > self._segment_bytes \
+                    and self._sizes[self._write_seq] > 0:
+                self._roll()
+
+            self._writer.write(frame)
+            self._sizes[self._write_seq] += len(frame)
+
+        if self._writer is not None:
+            self._writer.flush()
+
+        self._enforce_limit()
+
+    def _roll(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._open_writer()
+
+    def _enforce_limit(self):
+        while self.size > self._max_bytes and len(self._segments) > 1:
+            seq = self._segments[0]
+
+            logger.error("Spool full, dropping segment {}".format(seq))
+            self._remove_segment(seq)
+            self.dropped_segments += 1
+
+            if self._read_seq <= seq:
+                self._read_seq, self._read_offset = self._segments[0], 0
+                self._save_cursor()
+
+    def _remove_segment(self, seq):
+        self._segments.remove(seq)
+        del self._sizes[seq]
+
+        try:
+            os.remove(self._segment_path(seq))
+        except OSError as ex:
+            logger.error("Couldn't remove spool segment: " + str(ex))
+
+    def _collect(self):
+        """
+        Deletes the segments the cursor has moved past.
+        """
+        for seq in list(self._segments):
+            if seq < self._read_seq and seq != self._write_seq:
+                self._remove_segment(seq)
+
+        # A fully consumed active segment can be reused from the start
+        if self._read_seq == self._write_seq and \
+                self._read_offset == self._sizes[self._write_seq]:
+            self._writer.seek(0)
+            self._writer.truncate()
+            self._sizes[self._write_seq] = 0
+            self._read_offset = 0
+            self._save_cursor()
+
+    def read(self, max_records):
+        """
+        Returns up to max_records (record, position) pairs starting at
+        the cursor. Pass the last position to commit() once the records
+        are safely published.
+        """
+        records = []
+        seq, offset = self._read_seq, self._read_offset
+
+        while len(records) < max_records:
+
+            if seq not in self._sizes:
+                following = [s for s in self._segments if s > seq]
+                if not following:
+                    break
+                seq, offset = following[0], 0
+                continue
+
+            size = self._sizes[seq]
+
+            if offset < size:
+                offset = self._read_segment(seq, offset, size,
+                                            max_records - len(records), records)
+
+            if offset < size or seq == self._segments[-1]:
+                break
+
+            seq, offset = seq + 1, 0
+
+        return records
+
+    def _read_segment(self, seq, offset, size, max_records, records):
+
+        with open(self._segment_path(seq), "rb") as f:
+            with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as data:
+
+                while offset < size and max_records > 0:
+
+                    if offset + RECORD_HEADER.size > size:
+                        # Only the segment being written can still complete it
+                        if seq == self._write_seq:
+                            break
+                        torn = True
+                    else:
+                        length, crc = RECORD_HEADER.unpack_from(data, offset)
+                        start = offset + RECORD_HEADER.size
+                        record = data[start:start + length]
+                        torn = len(record) != length or zlib.crc32(record) != crc
+
+                    if torn:
+                        # Torn or corrupted write, skip the rest of the segment
+                        logger.error("Corrupted record in spool segment {} "
+                                     "at {}".format(seq, offset))
+                        self.corrupted += 1
+                        return size
+
+                    offset = start + length
+                    records.append((record, (seq, offset)))
+                    max_records -= 1
+
+        return offset
+
+    def commit(self, position):
+        """
+        Moves the cursor past a record returned by read().
+        """
+        self._read_seq, self._read_offset = position
+        self._save_cursor()
+        self._collect()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
@@ -0,0 +1,106 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import json
+import unittest
+
+from client_mqtt import BatchPublisher
+from wire import CborCodec, cbor_dumps, cbor_loads
+
+
+class StubClient:
+    """
+    Stands in for MQTTClient, keeps what was published.
+    """
+
+    def __init__(self, connected=True):
+        self.connected = connected
+        self.payloads = []
+
+    def publish_log(self, payload):
+        if self.connected:
+            self.payloads.append(payload)
+        return self.connected
+
+
+def record(index):
+    return {"Message": "log {}".format(index), "Signature": "ab", "Count": 1}
+
+
+class BatchPublisherTest(unittest.TestCase):
+
+    def test_single_logs_are_plain_objects(self):
+        client = StubClient()
+        publisher = BatchPublisher(client)
+
+        publisher.add(record(0))
+
+        self.assertEqual([json.loads(payload) for payload in client.payloads], [record(0)])
+        self.assertEqual(publisher.published, 1)
+
+    def test_batches_of_max_records(self):
+        for fmt in (BatchPublisher.FORMAT_NDJSON, BatchPublisher.FORMAT_JSON):
+            client = StubClient()
+            publisher = BatchPublisher(client, max_records=3, fmt=fmt)
+
+            for index in range(7):
+                publisher.add(record(index))
+
+            self.assertEqual(len(client.payloads), 2)
+            self.assertEqual(len(publisher), 1)
+
+            publisher.flush()
+            decoded = [publisher.codec.decode(payload) for payload in client.payloads]
+
+            self.assertEqual([len(batch) for batch in decoded], [3, 3, 1])
+            self.assertEqual([log for batch in decoded for log in batch],
+                             [record(index) for index in range(7)])
+
+    def test_batch_sent_before_max_bytes(self):
+        client = StubClient()
+        size = len(json.dumps(record(0)))
+        publisher = BatchPublisher(client, max_records=100, max_bytes=2 * size + 2)
+
+        for index in range(5):
+            publisher.add(record(index))
+        publisher.flush()
+
+        self.assertEqual([len(publisher.codec.decode(payload)) for payload in client.payloads],
+                         [2, 2, 1])
+        self.assertTrue(all(len(payload) <= 2 * size + 2 for payload in client.payloads))
+
+    def test_binary_batch(self):
+        client = StubClient()
+        codec = CborCodec()
+        codec._dumps, codec._loads = cbor_dumps, cbor_loads
+        publisher = BatchPublisher(client, max_records=2, codec=codec)
+
+        publisher.add(record(0))
+        publisher.add(record(1))
+
+        payload, = client.payloads
+        self.assertEqual(len(cbor_loads(payload)), 2)
+        self.assertEqual(codec.decode(payload)[1]["Message"], "log 1")
+
+    def test_failed_batch_goes_to_on_failure(self):
+        failed = []
+        client = StubClient(connected=False)
+        publisher = BatchPublisher(client, max_records=2, on_failure=failed.append)
+
+        self.assertTrue(publisher.add(record(0)))
+        self.assertFalse(publisher.add(record(1)))
+
+        self.assertEqual([json.loads(item) for item in failed[0]], [record(0), record(1)])
+        self.assertEqual((len(publisher), publisher.published), (0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,161 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import random
+import unittest
+
+from hashlib import sha1
+
+from chain_verifier import ChainVerifier, PCR_RESET, extend
+from log_model import LogBatch, LogModel
+from merkle import MerkleTree
+from tpm_backend import format_pcr
+
+
+def chain(sizes):
+    """
+    Logs as TPMLogger signs them, one per entry of sizes: 1 is a log
+    signed alone, more a Merkle batch of that many logs.
+    """
+    pcr = PCR_RESET
+    logs = []
+
+    for size in sizes:
+        messages = ["log {}".format(len(logs) + index) for index in range(size)]
+        digests = [sha1(message.encode()).digest() for message in messages]
+
+        if size == 1:
+            pcr = extend(pcr, digests[0])
+            root = None
+        else:
+            root = MerkleTree(digests).root
+            pcr = extend(pcr, root)
+            root = root.hex()
+
+        for index, message in enumerate(messages):
+            obj = LogModel()
+            obj.id = "id{:04d}".format(len(logs))
+            obj.message = message
+            obj.pcr = format_pcr(pcr)
+            obj.timestamp = float(len(logs))
+            obj.is_new_chain = not logs
+
+            if root is not None:
+                obj.root, obj.leaf_index, obj.batch_size = root, index, size
+
+            logs.append(obj)
+
+    return logs
+
+
+def feed(verifier, logs, chunk):
+    results = []
+
+    for start in range(0, len(logs), chunk):
+        results.extend(verifier.feed(LogBatch.from_models(logs[start:start + chunk])))
+
+    return results
+
+
+class ChainVerifierTest(unittest.TestCase):
+
+    def test_in_order(self):
+        logs = chain([1, 3, 1, 1, 4, 1])
+        verifier = ChainVerifier(reorder_window=4)
+        results = feed(verifier, logs, 5)
+
+        self.assertEqual([obj.id for obj, _ in results], [obj.id for obj in logs])
+        self.assertTrue(all(ok for _, ok in results))
+        self.assertEqual(verifier.broken, 0)
+
+    def test_altered_log_breaks(self):
+        logs = chain([1] * 10)
+        logs[4].message = "altered"
+        verifier = ChainVerifier(reorder_window=2)
+        results = feed(verifier, logs, 10)
+
+        self.assertEqual([obj.id for obj, ok in results if not ok], ["id0004"])
+
+    def test_late_batch_members_link(self):
+        m0, b0, b1, b2, m4, m5 = chain([1, 3, 1, 1])
+        verifier = ChainVerifier(reorder_window=8)
+
+        first = verifier.feed(LogBatch.from_models([m0, b0, m4]))
+        second = verifier.feed(LogBatch.from_models([b1, b2, m5]))
+
+        self.assertEqual([obj.id for obj, _ in first], [m0.id, b0.id, m4.id])
+        self.assertEqual(sorted(obj.id for obj, _ in second), [b1.id, b2.id, m5.id])
+        self.assertTrue(all(ok for _, ok in first + second))
+        self.assertEqual(verifier.pending(), 0)
+        self.assertIsNone(verifier.resume_point())
+
+    def test_local_shuffle(self):
+        logs = chain([1, 4, 1, 1, 8, 1, 2, 1, 1, 16, 1] * 5)
+        rnd = random.Random(0)
+        shuffled = []
+
+        for start in range(0, len(logs), 8):
+            window = logs[start:start + 8]
+            rnd.shuffle(window)
+            shuffled.extend(window)
+
+        verifier = ChainVerifier(reorder_window=32)
+        results = feed(verifier, shuffled, 50)
+
+        self.assertEqual(len(results), len(logs))
+        self.assertEqual(verifier.broken, 0)
+        self.assertEqual(verifier.pending(), 0)
+
+    def test_missing_batch_member(self):
+        logs = chain([1, 4] + [1] * 10)
+        del logs[3]
+        verifier = ChainVerifier(reorder_window=4)
+        results = feed(verifier, logs, 3)
+
+        self.assertTrue(all(ok for _, ok in results))
+        self.assertEqual(verifier.missing, 1)
+        self.assertEqual(verifier.broken, 1)
+
+    def test_gap_on_a_quiet_chain_times_out(self):
+        logs = chain([1] * 5)
+        del logs[2]
+        verifier = ChainVerifier(reorder_window=256, reorder_timeout=30)
+
+        # A log every 10 seconds, far fewer than reorder_window
+        results = [verifier.feed(LogBatch.from_models([obj]), now=10.0 * index)
+                   for index, obj in enumerate(logs)]
+
+        self.assertEqual([[ok for _, ok in result] for result in results],
+                         [[True], [True], [], []])
+
+        # Nothing else arrives, an idle feed reports the gap
+        self.assertEqual(verifier.feed(LogBatch(), now=49.0), [])
+        self.assertEqual([(obj.id, ok) for obj, ok in verifier.feed(LogBatch(), now=50.0)],
+                         [("id0003", False), ("id0004", True)])
+        self.assertEqual(verifier.broken, 1)
+        self.assertEqual(verifier.pending(), 0)
+
+    def test_restore_continues_chain(self):
+        logs = chain([1, 1, 2, 1])
+        verifier = ChainVerifier()
+        verifier.feed(LogBatch.from_models(logs[:3]))
+
+        restored = ChainVerifier()
+        restored.restore(verifier.checkpoint())
+        results = restored.feed(LogBatch.from_models(logs[3:]))
+
+        self.assertEqual([ok for _, ok in results], [True, True])
+        self.assertEqual(restored.pending(), 0)
+        self.assertEqual(restored.broken, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import os
+import tempfile
+import unittest
+
+from checkpoint import CheckpointJournal
+
+
+class CheckpointJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._directory.name, "checkpoint.jsonl")
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def lines(self):
+        with open(self.path) as f:
+            return f.read().splitlines()
+
+    def test_last_checkpoint_of_each_chain_survives_reopen(self):
+        journal = CheckpointJournal(self.path)
+        journal.record("a", (1.0, "x"))
+        journal.record("b", (2.0, "y"), inclusive=True, state={"pcr": None})
+        journal.record("a", (3.0, "z"))
+        journal.close()
+
+        journal = CheckpointJournal(self.path)
+
+        self.assertEqual(journal.get("a")["after"], [3.0, "z"])
+        self.assertEqual(journal.get("b"), {"chain": "b", "after": [2.0, "y"],
+                                            "inclusive": True, "state": {"pcr": None}})
+        self.assertIsNone(journal.get("c"))
+        journal.close()
+
+    def test_torn_last_line_is_skipped(self):
+        journal = CheckpointJournal(self.path)
+        journal.record("a", (1.0, "x"))
+        journal.close()
+
+        with open(self.path, "a") as f:
+            f.write('{"chain": "a", "af')
+
+        journal = CheckpointJournal(self.path)
+        self.assertEqual(journal.get("a")["after"], [1.0, "x"])
+
+        # Written on a line of its own, not after the torn one
+        journal.record("a", (2.0, "y"))
+        journal.close()
+
+        self.assertEqual(CheckpointJournal(self.path).get("a")["after"], [2.0, "y"])
+
+    def test_syncs_every_n_records(self):
+        journal = CheckpointJournal(self.path, sync_every=3, sync_interval=3600)
+
+        journal.record("a", (1.0, "x"))
+        journal.record("a", (2.0, "y"))
+        self.assertEqual(journal._unsynced, 2)
+
+        journal.record("a", (3.0, "z"))
+        self.assertEqual(journal._unsynced, 0)
+        self.assertEqual(len(self.lines()), 3)
+        journal.close()
+
+    def test_compacts_to_one_line_per_chain(self):
+        journal = CheckpointJournal(self.path, sync_every=1, compact_every=4)
+
+        for index in range(10):
+            journal.record("a" if index % 2 else "b", (float(index), str(index)))
+
+        self.assertLessEqual(len(self.lines()), 4 + 2)
+        journal.compact()
+        self.assertEqual(len(self.lines()), 2)
+
+        journal.record("a", (10.0, "10"))
+        journal.close()
+
+        journal = CheckpointJournal(self.path)
+        self.assertEqual(journal.get("a")["after"], [10.0, "10"])
+        self.assertEqual(journal.get("b")["after"], [8.0, "8"])
+        journal.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import unittest
+
+from coalescer import Coalescer
+
+
+class CoalescerTest(unittest.TestCase):
+
+    def test_repeats_merge_until_window_closes(self):
+        coalescer = Coalescer(window=1.0, max_count=100)
+
+        self.assertIsNone(coalescer.add((0x1A0, "alert", 1, 10.0), now=0.0))
+        self.assertIsNone(coalescer.add((0x1A0, "alert", 2, 10.5), now=0.5))
+        self.assertIsNone(coalescer.add((0x1B0, "other", 1, 10.6), now=0.6))
+
+        self.assertEqual(coalescer.next_deadline, 1.0)
+        self.assertEqual(coalescer.expire(0.9), [])
+        self.assertEqual(coalescer.expire(1.0), [(0x1A0, "alert", 3, 10.0, 10.5)])
+        self.assertEqual(coalescer.merged, 1)
+        self.assertEqual(len(coalescer), 1)
+
+    def test_max_count_releases_at_once(self):
+        coalescer = Coalescer(window=1.0, max_count=3)
+
+        self.assertEqual(coalescer.add((1, "alert", 5, 10.0), now=0.0),
+                         (1, "alert", 5, 10.0, 10.0))
+
+        coalescer.add((1, "alert", 1, 10.0), now=0.0)
+        coalescer.add((1, "alert", 1, 11.0), now=0.1)
+
+        self.assertEqual(coalescer.add((1, "alert", 1, 12.0), now=0.2),
+                         (1, "alert", 3, 10.0, 12.0))
+        self.assertEqual(len(coalescer), 0)
+
+    def test_flush_releases_everything_in_order(self):
+        coalescer = Coalescer(window=60.0, max_count=100)
+
+        coalescer.add((2, "b", 1, 11.0), now=0.0)
+        coalescer.add((1, "a", 1, 12.0), now=0.1)
+        coalescer.add((2, "b", 1, 13.0), now=0.2)
+
+        self.assertEqual(coalescer.flush(), [(2, "b", 2, 11.0, 13.0),
+                                             (1, "a", 1, 12.0, 12.0)])
+        self.assertEqual(len(coalescer), 0)
+        self.assertIsNone(coalescer.next_deadline)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import asyncio
+import os
+import struct
+import tempfile
+import unittest
+
+from ingest_server import IngestServer, FRAMING_LENGTH
+from pipeline import StageQueue
+from utils import FrameTooLarge, LengthPrefixFramer, LineFramer
+
+
+def frame(text):
+    data = text.encode()
+    return struct.pack(">I", len(data)) + data
+
+
+class FramerTest(unittest.TestCase):
+
+    def test_lines_across_chunks(self):
+        framer = LineFramer()
+
+        self.assertEqual(framer.feed(b"one\ntw"), ["one"])
+        self.assertEqual(framer.feed(b"o\n\nthree"), ["two"])
+        self.assertEqual(framer.feed(b"\n"), ["three"])
+
+    def test_line_without_newline_is_cut_at_max_line(self):
+        framer = LineFramer(max_line=4)
+
+        self.assertEqual(framer.feed(b"abc"), [])
+        self.assertEqual(framer.feed(b"de"), ["abcde"])
+
+    def test_frames_across_chunks(self):
+        framer = LengthPrefixFramer()
+        data = frame("one\nline") + frame("two")
+
+        self.assertEqual(framer.feed(data[:6]), [])
+        self.assertEqual(framer.feed(data[6:15]), ["one\nline"])
+        self.assertEqual(framer.feed(data[15:]), ["two"])
+
+    def test_frame_too_large(self):
+        with self.assertRaises(FrameTooLarge):
+            LengthPrefixFramer(max_frame=8).feed(frame("x" * 9))
+
+
+class IngestServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._directory.name, "ingest.sock")
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def test_close_waits_for_open_connections(self):
+
+        async def run():
+            queue = StageQueue("ingest", 16)
+            server = await IngestServer(self.path, queue, framing=FRAMING_LENGTH).start()
+
+            _, writer = await asyncio.open_unix_connection(self.path)
+            writer.write(frame("first") + frame("second"))
+            await writer.drain()
+
+            while len(queue) == 0:
+                await asyncio.sleep(0.01)
+
+            server.close()
+            await asyncio.wait_for(server.wait_closed(), 5)
+            writer.close()
+
+            return queue.drain(), server.stats()
+
+        batches, stats = asyncio.run(run())
+        producer, = stats.values()
+
+        self.assertEqual([line for batch in batches for line in batch], ["first", "second"])
+        self.assertEqual(producer["connections"], 1)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_cancelled_wait_cancels_blocked_connections(self):
+
+        async def run():
+            # One batch fits, the next one blocks its connection
+            queue = StageQueue("ingest", 1)
+            server = await IngestServer(self.path, queue, framing=FRAMING_LENGTH).start()
+
+            _, writer = await asyncio.open_unix_connection(self.path)
+            writer.write(frame("first"))
+            await writer.drain()
+            await asyncio.sleep(0.1)
+            writer.write(frame("second"))
+            await writer.drain()
+            await asyncio.sleep(0.1)
+
+            server.close()
+
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(server.wait_closed(), 0.1)
+
+            # The handler is gone, nothing is left pending
+            await asyncio.sleep(0)
+            self.assertEqual(server._connections, dict())
+            writer.close()
+
+            return queue.drain()
+
+        self.assertEqual(asyncio.run(run()), [["first"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
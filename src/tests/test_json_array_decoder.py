@@ -0,0 +1,80 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import json
+import unittest
+
+from utils import JsonArrayDecoder
+
+DOCUMENT = [
+    {"_id": "a", "payload": {"Message": "Ünïcode ] , [ \"quoted\"", "Count": 12345}},
+    [1, [2, 3], {"]": ","}],
+    "text",
+    1.5e3,
+    None,
+    True,
+]
+
+
+def decode(chunks):
+    decoder = JsonArrayDecoder()
+    items = []
+
+    for chunk in chunks:
+        items.extend(decoder.feed(chunk))
+
+    decoder.close()
+    return items
+
+
+class JsonArrayDecoderTest(unittest.TestCase):
+
+    def test_whole_document(self):
+        self.assertEqual(decode([json.dumps(DOCUMENT).encode()]), DOCUMENT)
+
+    def test_every_chunk_boundary(self):
+        # Splits inside multibyte characters, strings and numbers too
+        data = json.dumps(DOCUMENT, ensure_ascii=False, indent=1).encode()
+
+        for size in (1, 2, 3, 7):
+            chunks = [data[i:i + size] for i in range(0, len(data), size)]
+            self.assertEqual(decode(chunks), DOCUMENT, size)
+
+    def test_items_come_out_as_completed(self):
+        decoder = JsonArrayDecoder()
+
+        self.assertEqual(decoder.feed(b'[{"a": 1}, 12'), [{"a": 1}])
+        # 12 may continue in the next chunk
+        self.assertEqual(decoder.feed(b'3 ,'), [123])
+        self.assertEqual(decoder.feed(b' 4]'), [4])
+        self.assertTrue(decoder.done)
+
+    def test_number_cut_at_decimal_point_or_exponent(self):
+        self.assertEqual(decode([b"[1500.", b"25, 1e", b"3, -", b"2]"]), [1500.25, 1e3, -2])
+
+    def test_empty_array(self):
+        self.assertEqual(decode([b" [ ", b"] "]), [])
+
+    def test_not_an_array(self):
+        with self.assertRaises(ValueError):
+            decode([b'{"a": 1}'])
+
+    def test_missing_separator(self):
+        with self.assertRaises(ValueError):
+            decode([b"[1 2]"])
+
+    def test_truncated(self):
+        with self.assertRaises(ValueError):
+            decode([b'[{"a": 1}, {"b"'])
+
+
+if __name__ == "__main__":
+    unittest.main()
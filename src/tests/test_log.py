@@ -0,0 +1,93 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import logging
+import os
+import tempfile
+import unittest
+
+from queue import Queue
+
+import log
+
+from log import DroppingQueueHandler, logger, setup_logging
+
+
+def restore_default():
+    # Stops the writer setup_logging() started, after it flushed its queue
+    log._start([log._file_handler(log.DEFAULT_LOG, logging.DEBUG)], log.QUEUE_SIZE)
+
+
+def record(level):
+    return logging.LogRecord("test", level, __file__, 1, "message %s", ("arg",), None)
+
+
+class DroppingQueueHandlerTest(unittest.TestCase):
+
+    def test_full_queue_drops_below_warning_only(self):
+        queue = Queue(1)
+        handler = DroppingQueueHandler(queue)
+
+        handler.handle(record(logging.INFO))
+        handler.handle(record(logging.DEBUG))
+        self.assertEqual(handler.dropped, 1)
+
+        # Waits for room, then gives up and counts it
+        handler.handle(record(logging.ERROR))
+        self.assertEqual(handler.dropped, 2)
+
+    def test_records_are_formatted_by_the_writer(self):
+        queue = Queue()
+        DroppingQueueHandler(queue).handle(record(logging.INFO))
+
+        queued = queue.get_nowait()
+        self.assertEqual((queued.msg, queued.args), ("message %s", ("arg",)))
+
+
+class SetupLoggingTest(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        restore_default()
+        self._directory.cleanup()
+
+    def read(self, name):
+        with open(os.path.join(self._directory.name, name)) as f:
+            return f.read()
+
+    def test_level_and_info_log(self):
+        path = os.path.join(self._directory.name, "logs", "main.log")
+        info = os.path.join(self._directory.name, "info.log")
+
+        setup_logging({"level": "info", "info_log": info, "queue_size": "16"},
+                      "main_log", path)
+
+        logger.debug("hidden")
+        logger.info("shown")
+        logger.warning("warned")
+
+        restore_default()
+
+        self.assertEqual([line.split(" ", 3)[2:] for line in self.read("logs/main.log")
+                          .splitlines()], [["INFO", "shown"], ["WARNING", "warned"]])
+        self.assertEqual(len(self.read("info.log").splitlines()), 2)
+
+    def test_unknown_level_is_debug(self):
+        path = os.path.join(self._directory.name, "main.log")
+        setup_logging({"level": "chatty"}, "main_log", path)
+
+        self.assertEqual(logger.level, logging.DEBUG)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import unittest
+
+from log_model import LogBatch, LogModel
+from tpm_backend import PCR_SIZE, format_pcr
+
+
+def model(index, **fields):
+    obj = LogModel()
+    obj.id = "id{}".format(index)
+    obj.message = "log {} Târgu Mureş".format(index)
+    obj.pcr = format_pcr(bytes([index]) * PCR_SIZE)
+    obj.signature = bytes([index]) * 4
+    obj.can_id = 0x1A0
+    obj.timestamp = 10.0 + index
+    obj.count = 1
+    obj.is_new_chain = index == 0
+
+    for name, value in fields.items():
+        setattr(obj, name, value)
+
+    return obj
+
+
+def fields(obj):
+    return {name: getattr(obj, name) for name in LogModel.__slots__}
+
+
+class LogBatchTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        objs = [model(0), model(1, root="ab", proof=["cd"], leaf_index=1, batch_size=2),
+                model(2, timestamp={"$numberDecimal": "12.5"}, can_id="0x1A0",
+                      pcr="0x" + "ab" * PCR_SIZE, signature="not bytes")]
+        batch = LogBatch.from_models(objs)
+
+        self.assertEqual(len(batch), 3)
+        self.assertEqual([fields(obj) for obj in batch], [fields(obj) for obj in objs])
+        self.assertEqual(fields(batch[-1]), fields(objs[2]))
+        self.assertEqual(batch.message_bytes(0).tobytes(), objs[0].message.encode())
+
+    def test_select_keeps_columns_and_raw_values(self):
+        objs = [model(index) for index in range(4)]
+        objs[3].timestamp = "late"
+        objs[3].pcr = "broken"
+        batch = LogBatch.from_models(objs)
+
+        selected = batch.select([3, 1])
+
+        self.assertEqual([fields(obj) for obj in selected],
+                         [fields(objs[3]), fields(objs[1])])
+        self.assertEqual(selected.pcr_bytes(1), bytes([1]) * PCR_SIZE)
+        self.assertIsNone(selected.pcr_bytes(0))
+
+    def test_lowercase_pcr_still_parses(self):
+        batch = LogBatch.from_models([model(0, pcr="0x" + "ab" * PCR_SIZE)])
+
+        self.assertEqual(batch.pcr(0), "0x" + "ab" * PCR_SIZE)
+        self.assertEqual(batch.pcr_bytes(0), bytes([0xab]) * PCR_SIZE)
+
+
+if __name__ == "__main__":
+    unittest.main()
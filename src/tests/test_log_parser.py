@@ -0,0 +1,55 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import unittest
+
+from log_parser import MessageParser
+
+LINES = [
+    "Invalid DLC 10 for frame CAN ID: 753 Timestamp: 1658395439.065773 .",
+    "Unexpected payload 0xEB1167B367A9C378 CAN ID: 753 Timestamp: 1658395439.057935 .\x00",
+    "Rule 4 CAN bus off CAN ID: 12 Timestamp: 1.5 .",
+    "Spoofed CAN ID: 7 CAN ID: 8 Timestamp: 2.5 .",
+    "Two stamps CAN ID: 9 Timestamp: 3.5 . Timestamp: 4.5 .",
+    "Bad id CAN ID: x1 Timestamp: 5.5 .",
+    "Bad stamp CAN ID: 10 Timestamp: soon .",
+    "No stamp CAN ID: 11 trailing",
+    "Nothing to find here",
+    "Ünïcode\ttab CAN ID: 13 Timestamp: 6.5 .\r",
+    "",
+]
+
+
+class MessageParserTest(unittest.TestCase):
+
+    def test_fields(self):
+        self.assertEqual(MessageParser.parse_message(LINES[0]),
+                         (753, "Invalid DLC 10 for frame", 1, 1658395439.065773))
+
+    def test_agrees_with_searching_each_field(self):
+        for line, parsed in zip(LINES, MessageParser.parse_many(LINES)):
+            expected = MessageParser._parse_fallback(MessageParser._printable(line))
+
+            # Missing timestamps are the current time, compared apart
+            self.assertEqual(parsed[:3], expected[:3], line)
+            self.assertAlmostEqual(parsed[3], expected[3], delta=60, msg=line)
+
+    def test_non_printable_characters_are_dropped(self):
+        can_id, message, _, _ = MessageParser.parse_message(LINES[-2])
+        self.assertEqual((can_id, message), (13, "ncode\ttab"))
+
+    def test_line_without_fields(self):
+        can_id, message, count, _ = MessageParser.parse_message("Nothing to find here")
+        self.assertEqual((can_id, message, count), (0, None, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
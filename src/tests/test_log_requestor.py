@@ -0,0 +1,169 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import io
+import json
+import unittest
+
+import requests
+
+from log_requestor import LogRequestor, QueryBuilder
+
+
+class StubSession:
+    """
+    Stands in for requests.Session, answers every post with status and
+    body.
+    """
+
+    def __init__(self, status, body):
+        self._status = status
+        self._body = body
+
+    def post(self, url, data=None, timeout=None, stream=False):
+        response = requests.Response()
+        response.status_code = self._status
+        response.raw = io.BytesIO(self._body)
+        response.url = url
+        return response
+
+    def close(self):
+        pass
+
+
+class PagingSession(StubSession):
+    """
+    Serves documents page by page like the query service, keeping the
+    queries it was sent.
+    """
+
+    def __init__(self, documents):
+        super().__init__(200, b"")
+        self._documents = documents
+        self.queries = []
+
+    def post(self, url, data=None, timeout=None, stream=False):
+        query = json.loads(data)["query"]
+        self.queries.append(query)
+
+        documents = self._documents
+        after = query[0]["$match"].get("$or")
+
+        if after:
+            key = (float(after[1]["payload.Timestamp"]["$numberDecimal"]),
+                   after[1]["_id"]["$gt"])
+            documents = [doc for doc in documents if _key(doc) > key]
+
+        self._body = json.dumps(documents[:query[2]["$limit"]]).encode()
+        return super().post(url, data, timeout, stream)
+
+
+def _key(document):
+    return document["payload"]["Timestamp"], document["_id"]
+
+
+def document(id, timestamp):
+    return {"_id": id, "payload": {"Message": "m", "PCR": "0x00", "Signature": "ab",
+                                   "CanId": 1, "Timestamp": timestamp, "Count": 1,
+                                   "IsNewChain": False}}
+
+
+def requestor(status, body, session=None):
+    log_requestor = LogRequestor("user", "password", "http://insights.invalid/query",
+                                 "collection", "token")
+    log_requestor._session = session or StubSession(status, body)
+    return log_requestor
+
+
+class LogRequestorTest(unittest.TestCase):
+
+    def test_error_status_raises(self):
+        for fetch in (lambda r: r.request(0, 10),
+                      lambda r: list(r.stream(0, 10, 100))):
+            with self.assertRaises(LogRequestor.errors):
+                fetch(requestor(503, b"<html>Service Unavailable</html>"))
+
+    def test_non_json_body_raises(self):
+        with self.assertRaises(LogRequestor.errors):
+            requestor(200, b"<html>").request(0, 10)
+
+    def test_empty_page(self):
+        self.assertEqual(requestor(200, b"[]").request(0, 10), [])
+        self.assertEqual(list(requestor(200, b"[]").stream(0, 10, 100)), [])
+
+    def test_malformed_documents_are_skipped(self):
+        good = {"_id": "a", "payload": {"Message": "m", "PCR": "0x00", "Signature": "ab",
+                                        "CanId": 1, "Timestamp": 1.0, "Count": 1,
+                                        "IsNewChain": False}}
+        bad_signature = {"_id": "b", "payload": dict(good["payload"], Signature="zz")}
+        no_payload = {"_id": "c"}
+        body = json.dumps([no_payload, good, bad_signature]).encode()
+
+        for fetch in (lambda r: r.request(0, 10),
+                      lambda r: list(r.stream(0, 10, 100))):
+            log_requestor = requestor(200, body)
+            self.assertEqual([obj.id for obj in fetch(log_requestor)], ["a"])
+            self.assertEqual(log_requestor.malformed, 2)
+
+    def test_full_page_of_malformed_documents_raises(self):
+        body = json.dumps([{"_id": "c"}] * 2).encode()
+
+        with self.assertRaises(LogRequestor.errors):
+            list(requestor(200, body).stream(0, 10, 2))
+
+
+    def test_pages_resume_after_last_key(self):
+        # Equal timestamps are told apart by _id
+        documents = [document(id, timestamp) for id, timestamp in
+                     (("a", 1.0), ("b", 2.0), ("c", 2.0), ("d", 2.0), ("e", 3.0))]
+
+        for fetch in (lambda r: [obj for page in r.pages(0, 10, 2) for obj in page],
+                      lambda r: list(r.stream(0, 10, 2))):
+            session = PagingSession(documents)
+            objs = fetch(requestor(200, b"", session))
+
+            self.assertEqual([obj.id for obj in objs], ["a", "b", "c", "d", "e"])
+            self.assertEqual(len(session.queries), 3)
+            self.assertEqual(session.queries[1][0]["$match"]["$or"][1]["_id"], {"$gt": "b"})
+
+
+class QueryBuilderTest(unittest.TestCase):
+
+    def test_range_sort_limit_projection(self):
+        query = QueryBuilder.build("collection", limit=100, start_date=1.5, end_date=9,
+                                   end_exclusive=True)
+
+        self.assertEqual(query["collection"], "collection")
+        match, sort, limit, project = query["query"]
+
+        self.assertEqual(match, {"$match": {"payload.Timestamp": {
+            "$gte": {"$numberDecimal": 1.5}, "$lt": {"$numberDecimal": 9}}}})
+        self.assertEqual(list(sort["$sort"]), ["payload.Timestamp", "_id"])
+        self.assertEqual(limit, {"$limit": 100})
+        self.assertEqual(set(project["$project"]), set(QueryBuilder.PROJECTION))
+
+    def test_after_key(self):
+        decimal = {"$numberDecimal": "2.5"}
+
+        for inclusive, operator in ((False, "$gt"), (True, "$gte")):
+            match = QueryBuilder.build("collection", after=(decimal, "id"),
+                                       after_inclusive=inclusive)["query"][0]["$match"]
+
+            self.assertEqual(match["$or"], [
+                {"payload.Timestamp": {"$gt": decimal}},
+                {"payload.Timestamp": decimal, "_id": {operator: "id"}}])
+
+    def test_bad_limit(self):
+        self.assertIsNone(QueryBuilder.build("collection", limit="many"))
+
+
+if __name__ == "__main__":
+    unittest.main()
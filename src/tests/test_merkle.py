@@ -0,0 +1,80 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import unittest
+
+from hashlib import sha1
+
+from merkle import MerkleTree, compute_root, leaf_hash, node_hash, verify_proof
+
+
+def digests(count):
+    return [sha1(str(index).encode()).digest() for index in range(count)]
+
+
+class MerkleTreeTest(unittest.TestCase):
+
+    def test_every_leaf_proves_inclusion(self):
+        for size in range(1, 18):
+            leaves = digests(size)
+            tree = MerkleTree(leaves)
+
+            for index, digest in enumerate(leaves):
+                self.assertTrue(verify_proof(digest, index, size, tree.proof(index),
+                                             tree.root), (size, index))
+
+    def test_odd_node_is_promoted(self):
+        a, b, c = digests(3)
+        tree = MerkleTree([a, b, c])
+
+        self.assertEqual(tree.root, node_hash(node_hash(leaf_hash(a), leaf_hash(b)),
+                                              leaf_hash(c)))
+        self.assertEqual(tree.proof(2), [node_hash(leaf_hash(a), leaf_hash(b))])
+
+    def test_single_leaf(self):
+        digest, = digests(1)
+        tree = MerkleTree([digest])
+
+        self.assertEqual(tree.root, leaf_hash(digest))
+        self.assertEqual(tree.proof(0), [])
+
+    def test_empty_batch(self):
+        with self.assertRaises(ValueError):
+            MerkleTree([])
+
+    def test_wrong_leaf_or_position_fails(self):
+        leaves = digests(5)
+        tree = MerkleTree(leaves)
+        proof = tree.proof(1)
+
+        self.assertFalse(verify_proof(leaves[2], 1, 5, proof, tree.root))
+        self.assertFalse(verify_proof(leaves[1], 0, 5, proof, tree.root))
+
+    def test_proof_that_does_not_fit_the_size(self):
+        leaves = digests(4)
+        tree = MerkleTree(leaves)
+        proof = tree.proof(0)
+
+        self.assertIsNone(compute_root(leaves[0], 4, 4, proof))
+        self.assertIsNone(compute_root(leaves[0], 0, 4, proof[:-1]))
+        self.assertIsNone(compute_root(leaves[0], 0, 4, proof + [proof[0]]))
+
+    def test_leaf_is_not_an_inner_node(self):
+        # A pair of leaf hashes presented as a leaf doesn't reach the root
+        leaves = digests(4)
+        tree = MerkleTree(leaves)
+        inner = leaf_hash(leaves[0]) + leaf_hash(leaves[1])
+
+        self.assertFalse(verify_proof(inner, 0, 2, tree.proof(2)[1:], tree.root))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import os
+import socket
+import tempfile
+import unittest
+
+from metrics import MetricsRegistry, MetricsServer, UNIX_PREFIX
+
+
+def samples(text):
+    return dict(line.rsplit(" ", 1) for line in text.splitlines()
+                if not line.startswith("#"))
+
+
+class MetricsRegistryTest(unittest.TestCase):
+
+    def test_exposition(self):
+        registry = MetricsRegistry("tpm_")
+        registry.counter("logs", "Logs.", stage="sign").inc(3)
+        registry.counter("logs", "Logs.", stage="sign").inc()
+        registry.counter("logs", "Logs.", func=lambda: 7, stage="parse")
+        registry.gauge("depth", "Depth.", lambda: 2.5, queue='a"b')
+
+        text = registry.expose()
+
+        self.assertIn("# HELP tpm_logs Logs.\n# TYPE tpm_logs counter\n", text)
+        self.assertEqual(samples(text), {
+            'tpm_logs_total{stage="sign"}': "4",
+            'tpm_logs_total{stage="parse"}': "7",
+            'tpm_depth{queue="a\\"b"}': "2.5",
+        })
+
+    def test_histogram_is_cumulative(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram("seconds", "Latency.", buckets=(0.1, 1.0))
+
+        for seconds in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(seconds)
+
+        self.assertEqual(samples(registry.expose()), {
+            'seconds_bucket{le="0.1"}': "2",
+            'seconds_bucket{le="1.0"}': "3",
+            'seconds_bucket{le="+Inf"}': "4",
+            "seconds_sum": "2.65",
+            "seconds_count": "4",
+        })
+
+    def test_kind_conflict(self):
+        registry = MetricsRegistry()
+        registry.counter("logs", "Logs.")
+
+        with self.assertRaises(ValueError):
+            registry.gauge("logs", "Logs.", lambda: 1)
+
+    def test_failing_metric_is_left_out(self):
+        registry = MetricsRegistry()
+        registry.gauge("broken", "Broken.", lambda: 1 / 0)
+        registry.gauge("fine", "Fine.", lambda: 1)
+
+        self.assertEqual(samples(registry.expose()), {"fine": "1"})
+
+
+class MetricsServerTest(unittest.TestCase):
+
+    def test_serves_on_unix_socket(self):
+        registry = MetricsRegistry()
+        registry.counter("logs", "Logs.").inc(2)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "metrics.sock")
+            server = MetricsServer(registry, UNIX_PREFIX + path).start()
+
+            try:
+                with socket.socket(socket.AF_UNIX) as client:
+                    client.connect(path)
+                    client.sendall(b"GET /metrics HTTP/1.0\r\n\r\n")
+                    response = b"".join(iter(lambda: client.recv(4096), b"")).decode()
+            finally:
+                server.stop()
+
+            self.assertFalse(os.path.exists(path))
+
+        self.assertTrue(response.startswith("HTTP/1.0 200"))
+        self.assertIn("\nlogs_total 2\n", response)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import asyncio
+import unittest
+
+from pipeline import (OVERFLOW_BLOCK, OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST,
+                      StageQueue, queue_from_config)
+
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, 5))
+
+
+class StageQueueTest(unittest.TestCase):
+
+    def test_overflow_policies(self):
+        for overflow, kept, dropped in ((OVERFLOW_BLOCK, [0, 1], []),
+                                        (OVERFLOW_DROP_OLDEST, [1, 2], [0]),
+                                        (OVERFLOW_DROP_NEWEST, [0, 1], [2])):
+            discarded = []
+            queue = StageQueue("test", 2, overflow, on_drop=discarded.append)
+
+            results = [queue.put_nowait(item) for item in range(3)]
+
+            self.assertEqual(results, [True, True, overflow == OVERFLOW_DROP_OLDEST])
+            self.assertEqual(queue.drain(), kept)
+            self.assertEqual(discarded, dropped)
+            self.assertEqual(queue.dropped, len(dropped))
+
+    def test_blocking_put_waits_for_room(self):
+
+        async def test():
+            queue = StageQueue("test", 1)
+            await queue.put(0)
+
+            waiting = asyncio.ensure_future(queue.put(1))
+            await asyncio.sleep(0.01)
+            self.assertFalse(waiting.done())
+
+            self.assertEqual(await queue.get(), 0)
+            self.assertTrue(await waiting)
+            self.assertEqual(queue.stats()["high_watermark"], 1)
+
+        run(test())
+
+    def test_get_batch(self):
+
+        async def test():
+            queue = StageQueue("test", 16)
+
+            for item in range(5):
+                queue.put_nowait(item)
+
+            self.assertEqual(await queue.get_batch(3), [0, 1, 2])
+            self.assertEqual(await queue.get_batch(3), [3, 4])
+
+            # With a timeout, items arriving meanwhile join the batch
+            asyncio.get_running_loop().call_later(0.01, queue.put_nowait, 6)
+            queue.put_nowait(5)
+            self.assertEqual(await queue.get_batch(3, timeout=0.2), [5, 6])
+
+        run(test())
+
+    def test_join_waits_for_task_done(self):
+
+        async def test():
+            queue = StageQueue("test", 16)
+
+            for item in range(3):
+                queue.put_nowait(item)
+
+            joined = asyncio.ensure_future(queue.join())
+            batch = await queue.get_batch(3)
+            await asyncio.sleep(0.01)
+            self.assertFalse(joined.done())
+
+            queue.task_done(len(batch))
+            await joined
+
+        run(test())
+
+    def test_drain_completes_join(self):
+
+        async def test():
+            queue = StageQueue("test", 2, OVERFLOW_DROP_OLDEST)
+
+            for item in range(3):
+                queue.put_nowait(item)
+
+            self.assertEqual(queue.drain(), [1, 2])
+            await queue.join()
+
+        run(test())
+
+    def test_from_config(self):
+        config = {"queue_size": "8", "overflow": "drop_newest", "sign_queue_size": "4",
+                  "sign_overflow": "BLOCK"}
+
+        parse, sign = queue_from_config("parse", config), queue_from_config("sign", config)
+
+        self.assertEqual((parse.maxsize, parse.overflow), (8, OVERFLOW_DROP_NEWEST))
+        self.assertEqual((sign.maxsize, sign.overflow), (4, OVERFLOW_BLOCK))
+
+        with self.assertRaises(ValueError):
+            StageQueue("test", 1, "sometimes")
+
+
+if __name__ == "__main__":
+    unittest.main()
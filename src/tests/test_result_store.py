@@ -0,0 +1,118 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import os
+import random
+import tempfile
+import unittest
+
+from types import SimpleNamespace
+
+from result_store import BUCKET, ResultStore
+
+
+def log(id, timestamp, can_id=1):
+    return SimpleNamespace(id=id, timestamp=timestamp, can_id=can_id, count=1,
+                           message="m", pcr="0x00")
+
+
+class ResultStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.store = ResultStore(os.path.join(self._directory.name, "results.db"),
+                                 flush_size=7)
+
+    def tearDown(self):
+        self.store.close()
+        self._directory.cleanup()
+
+    def test_range_and_failures(self):
+        self.store.add("a", log("1", 10.0, 5), True)
+        self.store.add("a", log("2", 20.0, 5), False)
+        self.store.add("a", log("3", 30.0, 6), True)
+        self.store.set_chain_ok("a", log("3", 30.0), False)
+        self.store.flush()
+
+        self.assertEqual([row["id"] for row in self.store.range(15)], ["2", "3"])
+        self.assertEqual([row["id"] for row in self.store.range(failed=True)], ["2", "3"])
+        self.assertEqual([row["id"] for row in self.store.range(can_id=5, limit=1)], ["1"])
+
+        self.assertEqual(self.store.failures_by_can_id(), [(5, 1, 2), (6, 1, 1)])
+        self.assertEqual(self.store.summary(), {
+            "total": 3, "signature_failed": 1, "chain_broken": 1,
+            "chain_unchecked": 2, "first": 10.0, "last": 30.0})
+
+    def test_reverified_log_is_counted_once(self):
+        self.store.add("a", log("1", 10.0), False)
+        self.store.flush()
+        self.store.add("a", log("1", 10.0), True)
+        self.store.flush()
+
+        summary = self.store.summary()
+        self.assertEqual((summary["total"], summary["signature_failed"]), (1, 0))
+
+    def test_rollup_matches_rows(self):
+        rng = random.Random(7)
+        rows = []
+
+        for index in range(2000):
+            timestamp = rng.uniform(0, 40 * BUCKET) if index % 50 else None
+            can_id = rng.choice((1, 2, 3, "x"))
+            chain = rng.choice(("a", "b"))
+            signature_ok = rng.random() > 0.1
+            chain_ok = rng.choice((True, False, None))
+
+            obj = log(str(index), timestamp, can_id)
+            self.store.add(chain, obj, signature_ok)
+
+            if chain_ok is not None:
+                self.store.set_chain_ok(chain, obj, chain_ok)
+
+            rows.append((timestamp, can_id if isinstance(can_id, int) else None, chain,
+                         signature_ok, chain_ok))
+
+        self.store.flush()
+        self.assertEqual(self.store.summary()["total"], len(rows))
+
+        for _ in range(50):
+            start, end = sorted(rng.uniform(-BUCKET, 41 * BUCKET) for _ in range(2))
+            start = rng.choice((start, None))
+            chain = rng.choice(("a", "b", None))
+
+            # Logs without a timestamp are in no range
+            selected = [row for row in rows
+                        if row[0] is not None and (start is None or row[0] >= start) and
+                        row[0] <= end and (chain is None or row[2] == chain)]
+
+            summary = self.store.summary(start, end, chain)
+
+            self.assertEqual(summary["total"], len(selected))
+            self.assertEqual(summary["signature_failed"],
+                             sum(1 for row in selected if not row[3]))
+            self.assertEqual(summary["chain_broken"],
+                             sum(1 for row in selected if row[4] is False))
+
+            expected = dict()
+
+            for row in selected:
+                failed = not row[3] or row[4] is False
+                totals = expected.setdefault(row[1], [0, 0])
+                totals[0] += failed
+                totals[1] += 1
+
+            self.assertEqual({can_id: [failed, total] for can_id, failed, total
+                              in self.store.failures_by_can_id(start, end, chain)},
+                             expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import time
+import unittest
+
+from scheduler import PollScheduler, MODE_POLL, MODE_CATCH_UP
+from sources import InsightsSource
+
+
+class StubRequestor:
+    """
+    Stands in for LogRequestor, returns no logs.
+    """
+
+    window = None
+    concurrency = 1
+    errors = (ConnectionError, ValueError)
+    malformed = 0
+
+    def __init__(self, error=None):
+        self.polls = []
+        self._error = error
+
+    def stream(self, start, end, page_size, after=None, after_inclusive=False):
+        self.polls.append((start, end))
+
+        if self._error is not None:
+            raise self._error
+
+        return iter(())
+
+    def request_all(self, start, end, page_size, after=None, after_inclusive=False):
+        self.polls.append((start, end))
+        return []
+
+
+class CountingEvent:
+    """
+    Stopped event that sets itself after a number of waits, remembering
+    how long each was.
+    """
+
+    def __init__(self, waits):
+        self.waits = []
+        self._limit = waits
+
+    def is_set(self):
+        return len(self.waits) >= self._limit
+
+    def wait(self, timeout=None):
+        self.waits.append(timeout)
+
+
+class PollSchedulerTest(unittest.TestCase):
+
+    def test_empty_polls_back_off(self):
+        scheduler = PollScheduler(min_interval=1, max_interval=8, min_page=100, max_page=800)
+
+        for expected in (2, 4, 8, 8):
+            scheduler.update(0)
+            self.assertEqual(scheduler.interval, expected)
+
+        self.assertEqual(scheduler.page_size, 100)
+        self.assertEqual(scheduler.empty_polls, 4)
+
+    def test_full_polls_speed_up(self):
+        scheduler = PollScheduler(min_interval=1, max_interval=8, min_page=100, max_page=400)
+        scheduler.update(0)
+
+        for expected in (200, 400, 400):
+            scheduler.update(scheduler.page_size)
+            self.assertEqual(scheduler.interval, 1)
+            self.assertEqual(scheduler.page_size, expected)
+
+    def test_catch_up_mode(self):
+        scheduler = PollScheduler(catch_up_lag=300)
+
+        self.assertEqual(scheduler.next_mode(None), MODE_POLL)
+        self.assertEqual(scheduler.next_mode(10), MODE_POLL)
+        self.assertEqual(scheduler.next_mode(301), MODE_CATCH_UP)
+
+        scheduler.update(50)
+        self.assertEqual(scheduler.interval, 0)
+
+    def test_empty_catch_up_poll_backs_off(self):
+        scheduler = PollScheduler(min_interval=1, catch_up_lag=300)
+        scheduler.next_mode(1000)
+        scheduler.update(0)
+
+        self.assertEqual(scheduler.interval, 2)
+
+
+class InsightsSourceTest(unittest.TestCase):
+
+    def test_quiet_collection_doesnt_busy_poll(self):
+        requestor = StubRequestor()
+        scheduler = PollScheduler(min_interval=1, max_interval=8, catch_up_lag=300)
+        source = InsightsSource(requestor, scheduler, "test", settle_delay=5)
+        source.resume({"after": [time.time() - 3600, "a"], "inclusive": False})
+
+        stopped = CountingEvent(5)
+        source.run(lambda obj: True, stopped)
+
+        self.assertEqual(len(requestor.polls), 5)
+        self.assertNotIn(0, stopped.waits)
+        self.assertEqual(scheduler.mode, MODE_POLL)
+        # The empty poll covered everything up to its end
+        self.assertLess(source._fetch_lag(), 300)
+
+    def test_fetch_resumes_from_end_of_empty_poll(self):
+        requestor = StubRequestor()
+        source = InsightsSource(requestor, PollScheduler(), "test", settle_delay=5)
+        source.resume({"after": [1000.0, "a"], "inclusive": False})
+
+        source.run(lambda obj: True, CountingEvent(2))
+
+        first, second = requestor.polls
+        self.assertEqual(second[0], first[1])
+
+    def test_failed_polls_back_off(self):
+        requestor = StubRequestor(ConnectionError("reset"))
+        scheduler = PollScheduler(min_interval=1, max_interval=8)
+        source = InsightsSource(requestor, scheduler, "test")
+        source.resume({"after": [1000.0, "a"], "inclusive": False})
+
+        stopped = CountingEvent(3)
+        source.run(lambda obj: True, stopped)
+
+        self.assertEqual(stopped.waits, [2, 4, 8])
+        self.assertEqual(source.metrics()["failed_polls"], 3)
+        # Nothing was fetched, the next poll starts where it would have
+        self.assertEqual(requestor.polls[-1][0], None)
+
+
+if __name__ == "__main__":
+    unittest.main()
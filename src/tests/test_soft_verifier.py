@@ -0,0 +1,182 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import os
+import random
+import struct
+import tempfile
+import unittest
+
+from hashlib import sha1
+
+from log_model import LogBatch, LogModel
+from merkle import MerkleTree
+from soft_verifier import (HASH_ALGS, TPM2_ALG_NULL, TPM2_ALG_RSA, TPM2_ALG_RSASSA,
+                           TPM2_ALG_SHA1, TPM2_ALG_SHA256, ParallelVerifier,
+                           SoftwareVerifier, load_rsa_public_key)
+
+EXPONENT = 65537
+
+
+def _is_prime(n, rng):
+    if n % 2 == 0:
+        return n == 2
+
+    d, s = n - 1, 0
+    while d % 2 == 0:
+        d, s = d // 2, s + 1
+
+    for _ in range(20):
+        x = pow(rng.randrange(2, n - 1), d, n)
+
+        if x in (1, n - 1):
+            continue
+
+        for _ in range(s - 1):
+            x = pow(x, 2, n)
+            if x == n - 1:
+                break
+        else:
+            return False
+
+    return True
+
+
+def _prime(bits, rng):
+    while True:
+        n = rng.getrandbits(bits) | (1 << (bits - 1)) | 1
+        if (n - 1) % EXPONENT and _is_prime(n, rng):
+            return n
+
+
+def rsa_key(bits=1024, seed=1):
+    """
+    (modulus, private exponent) of a throwaway key.
+    """
+    rng = random.Random(seed)
+    p, q = _prime(bits // 2, rng), _prime(bits // 2, rng)
+    return p * q, pow(EXPONENT, -1, (p - 1) * (q - 1))
+
+
+def public_area(modulus, bits):
+    """
+    TPM2B_PUBLIC of an RSASSA signing key, as tpm2_create -u writes it.
+    """
+    key = modulus.to_bytes(bits // 8, "big")
+    area = struct.pack(">HHIH", TPM2_ALG_RSA, TPM2_ALG_SHA256, 0x00040072, 0) + \
+        struct.pack(">HHHHI", TPM2_ALG_NULL, TPM2_ALG_RSASSA, TPM2_ALG_SHA256, bits, 0) + \
+        struct.pack(">H", len(key)) + key
+
+    return struct.pack(">H", len(area)) + area
+
+
+def sign(text, modulus, private, hash_alg=TPM2_ALG_SHA1):
+    """
+    TPMT_SIGNATURE over text, what tpm2_sign produces for the logger.
+    """
+    size = (modulus.bit_length() + 7) // 8
+    hash_func, prefix = HASH_ALGS[hash_alg]
+    info = prefix + hash_func(text.encode()).digest()
+    encoded = b"\x00\x01" + b"\xff" * (size - len(info) - 3) + b"\x00" + info
+    signature = pow(int.from_bytes(encoded, "big"), private, modulus).to_bytes(size, "big")
+
+    return struct.pack(">HHH", TPM2_ALG_RSASSA, hash_alg, size) + signature
+
+
+def log(message, signature, root=None, proof=None, leaf_index=None, batch_size=None):
+    obj = LogModel()
+    obj.message, obj.signature = message, signature
+    obj.root, obj.proof, obj.leaf_index, obj.batch_size = root, proof, leaf_index, batch_size
+    return obj
+
+
+class SoftwareVerifierTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.modulus, cls.private = rsa_key()
+        cls._directory = tempfile.TemporaryDirectory()
+        cls.key_path = os.path.join(cls._directory.name, "key.pub")
+
+        with open(cls.key_path, "wb") as f:
+            f.write(public_area(cls.modulus, 1024))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._directory.cleanup()
+
+    def signed(self, message, **kwargs):
+        digest = sha1(message.encode()).hexdigest()
+        return log(message, sign(digest, self.modulus, self.private, **kwargs))
+
+    def test_loads_public_key(self):
+        self.assertEqual(load_rsa_public_key(self.key_path), (self.modulus, EXPONENT))
+
+    def test_signed_logs(self):
+        verifier = SoftwareVerifier(self.key_path)
+
+        self.assertTrue(verifier.verify("log", self.signed("log").signature))
+        self.assertTrue(verifier.verify("log", self.signed("log", hash_alg=TPM2_ALG_SHA256)
+                                        .signature))
+        # Hex signatures, as older JSON payloads carry them
+        self.assertTrue(verifier.verify("log", self.signed("log").signature.hex()))
+
+    def test_altered_logs(self):
+        verifier = SoftwareVerifier(self.key_path)
+        signature = self.signed("log").signature
+
+        self.assertFalse(verifier.verify("log!", signature))
+        self.assertFalse(verifier.verify("log", signature[:-1] + bytes([signature[-1] ^ 1])))
+        self.assertFalse(verifier.verify("log", signature[:20]))
+        self.assertFalse(verifier.verify("log", "not hex"))
+
+    def test_merkle_batch(self):
+        messages = ["log {}".format(index) for index in range(5)]
+        tree = MerkleTree([sha1(message.encode()).digest() for message in messages])
+        root = tree.root.hex()
+        signature = sign(root, self.modulus, self.private)
+
+        objs = [log(message, signature, root, [node.hex() for node in tree.proof(index)],
+                    index, len(messages))
+                for index, message in enumerate(messages)]
+        objs.append(log("forged", signature, root, objs[0].proof, 0, len(messages)))
+
+        self.assertEqual(SoftwareVerifier(self.key_path).verify_batch(LogBatch.from_models(objs)),
+                         [True] * 5 + [False])
+
+    def test_root_cache_is_bounded(self):
+        verifier = SoftwareVerifier(self.key_path)
+        verifier.ROOT_CACHE_SIZE = 2
+
+        for message in ("a", "b", "c", "a"):
+            root = MerkleTree([sha1(message.encode()).digest()]).root.hex()
+            self.assertTrue(verifier.verify(message, sign(root, self.modulus, self.private),
+                                            root, [], 0, 1))
+
+        self.assertEqual([root for root, _ in verifier._verified_roots],
+                         [MerkleTree([sha1(message.encode()).digest()]).root.hex()
+                          for message in ("c", "a")])
+
+    def test_parallel_verifier_keeps_order(self):
+        objs = [self.signed("log {}".format(index)) for index in range(10)]
+        objs[3].message = "altered"
+
+        verifier = ParallelVerifier(self.key_path, workers=2, chunk_size=3)
+
+        try:
+            self.assertEqual(verifier.verify_batch(LogBatch.from_models(objs)),
+                             [index != 3 for index in range(10)])
+        finally:
+            verifier.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import unittest
+
+from queue import Full
+from types import SimpleNamespace
+
+from sources import MQTTSource, _PushSource
+from wire import CborCodec, JsonCodec, cbor_dumps
+
+RECORD = {"Message": "m", "PCR": "0x" + "00" * 20, "Signature": "ab", "CanId": 1,
+          "Timestamp": 1.0, "Count": 1, "IsNewChain": False}
+
+
+def mqtt_source(codec):
+    """
+    An MQTTSource without its client, messages are handed to
+    _on_new_message directly.
+    """
+    source = MQTTSource.__new__(MQTTSource)
+    _PushSource.__init__(source)
+    source.dropped = 0
+    source._codec = codec
+    source._queue_timeout = 1
+    source._full = False
+    source.queued = []
+    source._enqueue = lambda obj, timeout=None: source.queued.append(obj) or True
+    return source
+
+
+def message(payload):
+    return SimpleNamespace(payload=payload)
+
+
+class MQTTSourceTest(unittest.TestCase):
+
+    def test_batch_is_queued(self):
+        codec = CborCodec()
+        source = mqtt_source(codec)
+
+        source._on_new_message(None, None, message(
+            codec.pack([codec.encode(RECORD), codec.encode(dict(RECORD, Count=2))])))
+
+        self.assertEqual([obj.count for obj in source.queued], [1, 2])
+        self.assertEqual(source.malformed, 0)
+
+    def test_malformed_messages_are_dropped(self):
+        source = mqtt_source(CborCodec())
+
+        for payload in (b"\xff", cbor_dumps([1, 2]), cbor_dumps(5)):
+            source._on_new_message(None, None, message(payload))
+
+        self.assertEqual(source.queued, [])
+        self.assertEqual(source.malformed, 3)
+
+    def test_malformed_log_in_a_batch_is_dropped(self):
+        source = mqtt_source(JsonCodec())
+
+        source._on_new_message(None, None, message(b'[{"Message": "m"}, ' +
+                                                   JsonCodec().encode(RECORD).encode() + b"]"))
+
+        self.assertEqual(len(source.queued), 1)
+        self.assertEqual(source.malformed, 1)
+
+    def test_full_queue_drops_the_rest_of_the_message(self):
+        codec = JsonCodec()
+        source = mqtt_source(codec)
+        timeouts = []
+
+        def enqueue(obj, timeout=None):
+            timeouts.append(timeout)
+
+            if len(source.queued) == 1:
+                raise Full()
+
+            source.queued.append(obj)
+            return True
+
+        source._enqueue = enqueue
+        batch = codec.pack([codec.encode(dict(RECORD, Count=count)) for count in range(4)])
+
+        source._on_new_message(None, None, message(batch))
+
+        # Only one wait on a full queue, paho gets its thread back
+        self.assertEqual(timeouts, [1, 1])
+        self.assertEqual([obj.count for obj in source.queued], [0])
+        self.assertEqual(source.metrics()["dropped"], 3)
+
+        source._on_new_message(None, None, message(batch))
+        self.assertEqual(len(timeouts), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import os
+import tempfile
+import unittest
+
+from spool import Spool, SEGMENT_PREFIX
+
+
+def records(start, stop):
+    return [("log {}".format(index)).encode() for index in range(start, stop)]
+
+
+class SpoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.directory = self._directory.name
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def segments(self):
+        return sorted(name for name in os.listdir(self.directory)
+                      if name.startswith(SEGMENT_PREFIX))
+
+    def test_read_commit_in_order(self):
+        spool = Spool(self.directory, segment_bytes=64)
+        spool.append(records(0, 10))
+
+        read = spool.read(4)
+        self.assertEqual([record for record, _ in read], records(0, 4))
+
+        # Not committed, read again
+        self.assertEqual(spool.read(4), read)
+
+        spool.commit(read[-1][1])
+        rest = spool.read(100)
+
+        self.assertEqual([record for record, _ in rest], records(4, 10))
+
+        spool.commit(rest[-1][1])
+        self.assertFalse(spool.has_pending())
+        self.assertEqual(spool.read(100), [])
+        spool.close()
+
+    def test_committed_segments_are_deleted(self):
+        spool = Spool(self.directory, segment_bytes=64)
+        spool.append(records(0, 20))
+        self.assertGreater(len(self.segments()), 2)
+
+        read = spool.read(100)
+        spool.commit(read[-1][1])
+
+        self.assertEqual(len(self.segments()), 1)
+        self.assertEqual(spool.size, 0)
+        spool.close()
+
+    def test_restart_resumes_at_cursor(self):
+        spool = Spool(self.directory, segment_bytes=64)
+        spool.append(records(0, 10))
+        spool.commit(spool.read(3)[-1][1])
+        spool.close()
+
+        spool = Spool(self.directory, segment_bytes=64)
+        spool.append(records(10, 12))
+
+        self.assertTrue(spool.has_pending())
+        self.assertEqual([record for record, _ in spool.read(100)], records(3, 12))
+        spool.close()
+
+    def test_torn_write_skips_rest_of_segment(self):
+        spool = Spool(self.directory)
+        spool.append(records(0, 3))
+        spool.close()
+
+        path = os.path.join(self.directory, self.segments()[-1])
+
+        with open(path, "r+b") as f:
+            f.truncate(os.path.getsize(path) - 2)
+
+        spool = Spool(self.directory)
+        spool.append(records(3, 4))
+
+        self.assertEqual([record for record, _ in spool.read(100)],
+                         records(0, 2) + records(3, 4))
+        self.assertEqual(spool.corrupted, 1)
+        spool.close()
+
+    def test_torn_header_skips_to_next_segment(self):
+        spool = Spool(self.directory)
+        spool.append(records(0, 3))
+        spool.close()
+
+        path = os.path.join(self.directory, self.segments()[-1])
+        frame = os.path.getsize(path) // 3
+
+        # Crashed halfway through the second record's header
+        with open(path, "r+b") as f:
+            f.truncate(frame + 4)
+
+        spool = Spool(self.directory)
+        spool.append(records(3, 5))
+
+        self.assertEqual([record for record, _ in spool.read(100)],
+                         records(0, 1) + records(3, 5))
+        self.assertEqual(spool.corrupted, 1)
+        spool.close()
+
+    def test_full_spool_drops_oldest_segments(self):
+        spool = Spool(self.directory, segment_bytes=64, max_bytes=128)
+        spool.append(records(0, 30))
+
+        self.assertLessEqual(spool.size, 128)
+        self.assertGreater(spool.dropped_segments, 0)
+
+        read = [record for record, _ in spool.read(100)]
+
+        self.assertEqual(read, records(30 - len(read), 30))
+        spool.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
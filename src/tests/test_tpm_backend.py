@@ -0,0 +1,76 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import unittest
+
+from hashlib import sha1
+
+from chain_verifier import extend
+from tpm_backend import (ESAPI, PCR_SIZE, PCR_ZERO, ESAPIBackend, SoftwareBackend,
+                         SubprocessBackend, create_backend, format_pcr, parse_pcr)
+
+
+# What SubprocessBackend needs from the [tpm] section
+FILES = {"tmp_file": "log.tmp", "tmp_digest_file": "digest.tmp", "tmp_output": "sign.tmp"}
+
+
+class PcrFormatTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        raw = bytes(range(PCR_SIZE))
+
+        self.assertEqual(format_pcr(raw), "0x000102030405060708090A0B0C0D0E0F10111213")
+        self.assertEqual(parse_pcr(format_pcr(raw)), raw)
+        self.assertEqual(parse_pcr(format_pcr(raw)[2:].lower()), raw)
+        self.assertEqual(format_pcr(bytes(PCR_SIZE)), PCR_ZERO)
+
+
+class SoftwareBackendTest(unittest.TestCase):
+
+    def test_extend_matches_the_verifier_replay(self):
+        backend = SoftwareBackend({"sim_key": "key"})
+        expected = bytes(PCR_SIZE)
+
+        for message in ("first", "second"):
+            digest = backend.hash(message)
+            self.assertTrue(backend.extend_pcr("16", digest))
+            expected = extend(expected, sha1(message.encode()).digest())
+
+        self.assertEqual(backend.read_pcr(16), format_pcr(expected))
+        self.assertEqual(backend.read_pcr(23), PCR_ZERO)
+
+        backend.reset_pcr(16)
+        self.assertEqual(backend.read_pcr(16), PCR_ZERO)
+
+    def test_signatures_depend_on_the_key(self):
+        digest = sha1(b"log").hexdigest()
+        first, again = SoftwareBackend({"sim_key": "a"}), SoftwareBackend({"sim_key": "a"})
+
+        self.assertEqual(first.sign(digest), again.sign(digest))
+        self.assertNotEqual(first.sign(digest), SoftwareBackend({"sim_key": "b"}).sign(digest))
+
+
+class CreateBackendTest(unittest.TestCase):
+
+    def test_selection(self):
+        self.assertIsInstance(create_backend(FILES), SubprocessBackend)
+        self.assertIsInstance(create_backend({"backend": "Software"}), SoftwareBackend)
+        self.assertIsInstance(create_backend(dict(FILES, backend="quantum")),
+                              SubprocessBackend)
+
+    @unittest.skipIf(ESAPI is not None, "tpm2-pytss is installed")
+    def test_esapi_falls_back_without_tpm2_pytss(self):
+        backend = create_backend(dict(FILES, backend=ESAPIBackend.name))
+        self.assertIsInstance(backend, SubprocessBackend)
+
+
+if __name__ == "__main__":
+    unittest.main()
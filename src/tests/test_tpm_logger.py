@@ -0,0 +1,88 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import unittest
+
+from hashlib import sha1
+
+from tpm_backend import PCR_SIZE, PCR_ZERO, format_pcr
+from tpm_logger import TPMCore
+
+
+def core(**tpm):
+    config = {"tpm2_primary_ctx": "primary.ctx", "tpm2_priv_rsa": "key.priv",
+              "tpm2_pub_rsa": "key.pub", "tmp_file": "logs.dat",
+              "tmp_digest_file": "digest.dat", "pcr": "4", "tmp_output": "out.dat",
+              "tpm2_prov_path": "/nonexistent/", "tpm2_priv_ctx": "priv.ctx",
+              "backend": "software", "sim_key": "key"}
+    config.update(tpm)
+
+    tpm_core = TPMCore({"tpm": config})
+    tpm_core.initialise()
+
+    return tpm_core
+
+
+class PcrMirrorTest(unittest.TestCase):
+
+    def test_mirror_follows_the_pcr(self):
+        tpm_core = core(pcr_reconcile_interval="0")
+        self.assertTrue(tpm_core.pcr_state)
+
+        first = tpm_core.sign("first")
+        self.assertTrue(tpm_core.is_new_chain)
+        second = tpm_core.sign("second")
+        self.assertFalse(tpm_core.is_new_chain)
+
+        expected = bytes(PCR_SIZE)
+        for message, log in (("first", first), ("second", second)):
+            expected = sha1(expected + sha1(message.encode()).digest()).digest()
+            self.assertEqual(log["PCR"], format_pcr(expected))
+
+        self.assertEqual(tpm_core.backend.read_pcr(4), tpm_core.pcr_value)
+        self.assertFalse(tpm_core.pcr_state)
+
+    def test_batch_extends_with_the_root(self):
+        tpm_core = core(pcr_reconcile_interval="0")
+        logs = tpm_core.sign_batch(["a", "b", "c"])
+
+        expected = sha1(bytes(PCR_SIZE) + bytes.fromhex(logs[0]["Root"])).digest()
+        self.assertEqual({log["PCR"] for log in logs}, {format_pcr(expected)})
+        self.assertEqual(tpm_core.backend.read_pcr(4), tpm_core.pcr_value)
+
+    def test_divergence_is_counted_and_followed(self):
+        tpm_core = core(pcr_reconcile_interval="0")
+        tpm_core.sign("first")
+
+        # Something else resets the PCR behind the logger's back
+        tpm_core.backend.reset_pcr(4)
+
+        self.assertTrue(tpm_core.reconcile_pcr())
+        self.assertEqual(tpm_core.pcr_divergences, 1)
+        self.assertEqual(tpm_core.pcr_value, PCR_ZERO)
+
+        self.assertTrue(tpm_core.reconcile_pcr())
+        self.assertEqual(tpm_core.pcr_divergences, 1)
+
+    def test_reconcile_interval(self):
+        tpm_core = core(pcr_reconcile_interval="0.000001")
+        tpm_core.sign("first")
+        tpm_core.backend.reset_pcr(4)
+
+        # Checked before the next extend, which then starts a new chain
+        tpm_core.sign("second")
+        self.assertEqual(tpm_core.pcr_divergences, 1)
+        self.assertTrue(tpm_core.is_new_chain)
+        self.assertEqual(tpm_core.backend.read_pcr(4), tpm_core.pcr_value)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import json
+import os
+import tempfile
+import unittest
+
+from tracing import Tracer, _percentile, summarize
+
+
+def event(name, milliseconds, **args):
+    return {"name": name, "dur": milliseconds * 1000, "args": args}
+
+
+class TracerTest(unittest.TestCase):
+
+    def test_disabled_records_nothing(self):
+        tracer = Tracer()
+
+        with tracer.span("tpm2_sign") as args:
+            args["rc"] = 0
+        tracer.record("tpm2_pcrextend", 0.0, 1.0)
+
+        self.assertEqual(tracer.events(), [])
+
+    def test_span_and_export(self):
+        tracer = Tracer()
+        tracer.enable(max_events=2)
+
+        for rc in (0, 1, 0):
+            with tracer.span("tpm2_sign", argv=["tpm2_sign"]) as args:
+                args["rc"] = rc
+
+        with self.assertRaises(RuntimeError):
+            with tracer.span("tpm2_verifysignature"):
+                raise RuntimeError()
+
+        events = tracer.events()
+
+        # The oldest events are dropped, failed ones recorded too
+        self.assertEqual([event["name"] for event in events],
+                         ["tpm2_sign", "tpm2_verifysignature"])
+        self.assertEqual(events[0]["args"], {"argv": ["tpm2_sign"], "rc": 0})
+        self.assertTrue(all(event["ph"] == "X" and event["dur"] >= 0 for event in events))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "trace.json")
+            tracer.export(path)
+
+            with open(path) as f:
+                self.assertEqual(json.load(f)["traceEvents"], events)
+
+    def test_percentile_is_nearest_rank(self):
+        durations = list(range(1, 11))
+
+        self.assertEqual(_percentile(durations, 0.5), 5)
+        self.assertEqual(_percentile(durations, 0.9), 9)
+        self.assertEqual(_percentile(durations, 0.99), 10)
+        self.assertEqual(_percentile(list(range(1, 9)), 0.5), 4)
+        self.assertEqual(_percentile([3], 0.5), 3)
+
+    def test_summary(self):
+        events = [event("tpm2_sign", ms, rc=0) for ms in range(1, 11)]
+        events += [event("tpm2_pcrread", 100, rc=1), event("tpm2_pcrread", 1, error="x")]
+
+        header, slowest, sign = summarize(events).splitlines()
+
+        self.assertEqual(header.split()[:3], ["command", "count", "failed"])
+        self.assertEqual(slowest.split(), ["tpm2_pcrread", "2", "2", "1.00", "100.00",
+                                           "100.00", "100.00", "101.0"])
+        self.assertEqual(sign.split(), ["tpm2_sign", "10", "0", "5.00", "9.00",
+                                        "10.00", "10.00", "55.0"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import unittest
+
+from utils import LineFramer
+
+
+class LineFramerTest(unittest.TestCase):
+
+    def test_lines_split_across_chunks(self):
+        framer = LineFramer()
+
+        self.assertEqual(framer.feed(b"first\nsec"), ["first"])
+        self.assertEqual(framer.feed(b"ond"), [])
+        self.assertEqual(framer.feed(b"\n\nthird\nfourth\n"), ["second", "third", "fourth"])
+        self.assertEqual(framer.feed(b""), [])
+
+    def test_multibyte_character_cut_by_a_chunk(self):
+        framer = LineFramer()
+        data = "Târgu Mureş\n".encode()
+
+        self.assertEqual(framer.feed(data[:2]), [])
+        self.assertEqual(framer.feed(data[2:]), ["Târgu Mureş"])
+
+    def test_line_without_newline_is_bounded(self):
+        framer = LineFramer(max_line=8)
+
+        self.assertEqual(framer.feed(b"abcd"), [])
+        self.assertEqual(framer.feed(b"efghij"), ["abcdefghij"])
+        self.assertEqual(framer.feed(b"k\n"), ["k"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import unittest
+
+from log_model import LogModel
+from wire import (BATCH_JSON, CborCodec, JsonCodec, MsgpackCodec, cbor2, cbor_dumps,
+                  cbor_loads, codec_from_config, msgpack, to_wire)
+
+RECORD = {
+    "Message": "Firewall: dropped frame",
+    "PCR": "0x" + "0A" * 20,
+    "Signature": "ab" * 8,
+    "CanId": 0x1A0,
+    "Timestamp": 1658395439.25,
+    "Count": 2,
+    "IsNewChain": False,
+}
+
+BATCHED = dict(RECORD, Root="cd" * 20, Proof=["ef" * 20, "01" * 20],
+               LeafIndex=1, BatchSize=3)
+
+# RFC 8949, Appendix A
+CBOR_VECTORS = [
+    (0, "00"), (23, "17"), (24, "1818"), (100, "1864"), (1000, "1903e8"),
+    (1000000, "1a000f4240"), (-1, "20"), (-1000, "3903e7"), (1.1, "fb3ff199999999999a"),
+    (False, "f4"), (True, "f5"), (None, "f6"), (b"\x01\x02\x03\x04", "4401020304"),
+    ("a", "6161"), ("ü", "62c3bc"), ([1, [2, 3]], "8201820203"),
+    ({"a": 1, "b": [2, 3]}, "a26161016162820203"),
+]
+
+
+def builtin_cbor():
+    codec = CborCodec()
+    codec._dumps, codec._loads = cbor_dumps, cbor_loads
+    return codec
+
+
+def codecs():
+    found = [JsonCodec(), JsonCodec(BATCH_JSON), builtin_cbor()]
+
+    if cbor2 is not None:
+        found.append(CborCodec())
+    if msgpack is not None:
+        found.append(MsgpackCodec())
+
+    return found
+
+
+class BuiltinCborTest(unittest.TestCase):
+
+    def test_rfc_vectors(self):
+        for value, encoded in CBOR_VECTORS:
+            self.assertEqual(cbor_dumps(value).hex(), encoded, value)
+            self.assertEqual(cbor_loads(bytes.fromhex(encoded)), value, encoded)
+
+    def test_half_and_single_floats(self):
+        self.assertEqual(cbor_loads(bytes.fromhex("f93c00")), 1.0)
+        self.assertEqual(cbor_loads(bytes.fromhex("fa47c35000")), 100000.0)
+
+    def test_malformed(self):
+        for encoded in ("", "62c3", "8201", "0000", "1c"):
+            with self.assertRaises(ValueError, msg=encoded):
+                cbor_loads(bytes.fromhex(encoded))
+
+    @unittest.skipIf(cbor2 is None, "cbor2 is not installed")
+    def test_same_bytes_as_cbor2(self):
+        record = to_wire(BATCHED)
+        self.assertEqual(cbor_dumps(record), cbor2.dumps(record))
+
+
+class CodecTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        for codec in codecs():
+            for record in (RECORD, BATCHED):
+                decoded, = codec.decode(codec.encode(record))
+                # Only the signature may come back raw
+                if isinstance(decoded["Signature"], bytes):
+                    decoded["Signature"] = decoded["Signature"].hex()
+
+                self.assertEqual(decoded, record, codec.name)
+
+    def test_batches(self):
+        for codec in codecs():
+            payload = codec.pack([codec.encode(RECORD), codec.encode(BATCHED)])
+            self.assertEqual([record["Count"] for record in codec.decode(payload)], [2, 2])
+
+    def test_binary_is_smaller(self):
+        json_size = len(JsonCodec().encode(BATCHED))
+        self.assertLess(len(builtin_cbor().encode(BATCHED)), json_size * 0.7)
+
+    def test_binary_codec_reads_json(self):
+        codec = builtin_cbor()
+        payload = JsonCodec().encode(RECORD).encode()
+
+        self.assertEqual(codec.decode(payload), [RECORD])
+        self.assertEqual(codec.decode(codec.from_stored(payload)), codec.decode(
+            codec.encode(RECORD)))
+
+    def test_stored_round_trip(self):
+        for codec in codecs():
+            encoded = codec.encode(RECORD)
+            self.assertEqual(codec.from_stored(codec.stored(encoded)), encoded)
+
+    def test_pcr_that_would_not_print_back_is_kept(self):
+        record = dict(RECORD, PCR="0x" + "0a" * 20)
+        self.assertEqual(to_wire(record)["PCR"], record["PCR"])
+
+    def test_log_model_round_trip(self):
+        for codec in codecs():
+            obj, = LogModel.decode(LogModel().from_json(
+                {"_id": "a", "payload": BATCHED}).encode(codec), codec)
+
+            self.assertEqual(obj.signature, bytes.fromhex(BATCHED["Signature"]))
+            self.assertEqual((obj.pcr, obj.root, obj.proof, obj.leaf_index),
+                             (BATCHED["PCR"], BATCHED["Root"], BATCHED["Proof"], 1))
+
+    def test_config(self):
+        self.assertIsInstance(codec_from_config({}), JsonCodec)
+        self.assertIsInstance(codec_from_config({"wire_format": "CBOR"}), CborCodec)
+        self.assertEqual(codec_from_config({"batch_format": "json"}).batch_format, BATCH_JSON)
+
+        with self.assertRaises(ValueError):
+            codec_from_config({"wire_format": "xml"})
+
+    @unittest.skipIf(msgpack is not None, "msgpack is installed")
+    def test_msgpack_falls_back_to_json(self):
+        self.assertIsInstance(codec_from_config({"wire_format": "msgpack"}), JsonCodec)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,336 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+"""
+
+import hmac
+import os
+from hashlib import sha1, sha256
+
+from log import logger
+from tracing import tracer
+from utils import dump, load_binary
+from wrapper import TPM2_LoadKey, TPM2_Sign, TPM2_Hash, TPM2_ExtendPcr, \
+    TPM2_ReadPcr, TPM2_CreatePrimary, TPM2_DICTIONARY_LOCKOUT
+
+try:
+    from tpm2_pytss import ESAPI, ESYS_TR, TPM2_ALG, TPM2_ST, TPM2_RH, \
+        TPM2B_DIGEST, TPM2B_PRIVATE, TPM2B_PUBLIC, TPML_DIGEST_VALUES, \
+        TPML_PCR_SELECTION, TPMS_CONTEXT, TPMT_HA, TPMT_SIG_SCHEME, \
+        TPMT_TK_HASHCHECK, TPMU_HA, TSS2_Exception
+except ImportError:
+    ESAPI = None
+
+
+TCTI_ABRMD = "tabrmd:bus_name=com.intel.tss2.Tabrmd"
+
+PCR_SIZE = 20
+PCR_ZERO = "0x" + "00" * PCR_SIZE
+
+
+def format_pcr(value):
+    """
+    Formats a raw PCR value the same way tpm2_pcrread prints it.
+    """
+    return "0x" + value.hex().upper()
+
+
+def parse_pcr(value):
+    """
+    Returns the raw bytes of a PCR value printed by tpm2_pcrread.
+    """
+    if value.startswith(("0x", "0X")):
+        value = value[2:]
+    return bytes.fromhex(value)
+
+
+class TPMBackend:
+    """
+    Operations TPMCore needs from a TPM. Digests and signatures are
+    exchanged as hex strings, PCR values as printed by tpm2_pcrread.
+    """
+
+    name = None
+
+    def __init__(self, config):
+        self._config = config
+
+    def provision(self, prov_path, primary_ctx):
+        """
+        Clears the dictionary lockout and recreates the primary context.
+        """
+        success = TPM2_DICTIONARY_LOCKOUT()
+
+        if success:
+            logger.info("Removed dictionary lockout.")
+        else:
+            logger.error("Could not execute dictionary lockout")
+
+        success = TPM2_CreatePrimary(prov_path, primary_ctx)
+
+        if success:
+            logger.debug("Recreated primary.ctx in " + prov_path)
+        else:
+            logger.error("Could not recreate primary.ctx.")
+
+        return success
+
+    def open(self, primary_ctx, key_pub, key_priv, key_ctx):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def hash(self, msg):
+        raise NotImplementedError
+
+    def extend_pcr(self, pcr, digest):
+        raise NotImplementedError
+
+    def read_pcr(self, pcr):
+        raise NotImplementedError
+
+    def sign(self, digest):
+        raise NotImplementedError
+
+
+class SubprocessBackend(TPMBackend):
+    """
+    Runs every operation through the tpm2-tools binaries in wrapper.py.
+    """
+
+    name = "subprocess"
+
+    def __init__(self, config):
+        super().__init__(config)
+
+        self._tmp_file = config["tmp_file"]
+        self._digest_file = config["tmp_digest_file"]
+        self._sign_file = config["tmp_output"]
+        self._key_ctx = None
+
+        # Digest currently stored in the digest file
+        self._digest_on_disk = None
+
+    def open(self, primary_ctx, key_pub, key_priv, key_ctx):
+        self._key_ctx = key_ctx
+        return TPM2_LoadKey(primary_ctx, key_pub, key_priv, key_ctx)
+
+    def _store_digest(self, digest):
+        if digest != self._digest_on_disk:
+            dump(digest, self._digest_file)
+            self._digest_on_disk = digest
+
+    def hash(self, msg):
+        dump(msg, self._tmp_file)
+
+        if not TPM2_Hash(self._tmp_file, self._digest_file):
+            self._digest_on_disk = None
+            return None
+
+        with open(self._digest_file, "r") as f:
+            self._digest_on_disk = f.read().strip()
+
+        return self._digest_on_disk
+
+    def extend_pcr(self, pcr, digest):
+        self._store_digest(digest)
+        return TPM2_ExtendPcr(pcr, self._digest_file)
+
+    def read_pcr(self, pcr):
+        return TPM2_ReadPcr(pcr)
+
+    def sign(self, digest):
+        self._store_digest(digest)
+
+        if not TPM2_Sign(self._key_ctx, self._digest_file, self._sign_file):
+            return None
+
+        return load_binary(self._sign_file)
+
+
+class ESAPIBackend(TPMBackend):
+    """
+    Talks to the TPM in-process through tpm2-pytss. The TCTI connection
+    and the loaded signing key are kept open until close() is called.
+    """
+
+    name = "esapi"
+
+    def __init__(self, config):
+        super().__init__(config)
+
+        self._tcti = config.get("tcti", TCTI_ABRMD)
+        self._ectx = None
+        self._key = None
+
+    def open(self, primary_ctx, key_pub, key_priv, key_ctx):
+
+        if ESAPI is None:
+            logger.error("tpm2-pytss is not installed.")
+            return False
+
+        try:
+            self._ectx = ESAPI(self._tcti)
+
+            with open(primary_ctx, "rb") as f:
+                parent = self._ectx.context_load(
+                    TPMS_CONTEXT.from_tools(f.read()))
+
+            with open(key_pub, "rb") as f:
+                public, _ = TPM2B_PUBLIC.unmarshal(f.read())
+
+            with open(key_priv, "rb") as f:
+                private, _ = TPM2B_PRIVATE.unmarshal(f.read())
+
+            self._key = self._ectx.load(parent, private, public)
+            self._ectx.flush_context(parent)
+
+        except (OSError, TSS2_Exception) as ex:
+            logger.error("Couldn't load key through ESAPI: " + str(ex))
+            self.close()
+            return False
+
+        return True
+
+    def close(self):
+        if self._ectx is None:
+            return
+
+        if self._key is not None:
+            try:
+                self._ectx.flush_context(self._key)
+            except TSS2_Exception:
+                pass
+            self._key = None
+
+        self._ectx.close()
+        self._ectx = None
+
+    def hash(self, msg):
+        # The digest is public data; there is no need for a TPM round-trip
+        return sha1(msg.encode()).hexdigest()
+
+    def extend_pcr(self, pcr, digest):
+        values = TPML_DIGEST_VALUES([
+            TPMT_HA(hashAlg=TPM2_ALG.SHA1,
+                    digest=TPMU_HA(sha1=bytes.fromhex(digest)))
+        ])
+
+        with tracer.span("esapi.pcr_extend", pcr=pcr) as trace:
+            try:
+                self._ectx.pcr_extend(getattr(ESYS_TR, "PCR" + str(pcr)), values)
+            except TSS2_Exception as ex:
+                trace["error"] = str(ex)
+                logger.error("pcr_extend failed: " + str(ex))
+                return False
+
+        return True
+
+    def read_pcr(self, pcr):
+        selection = TPML_PCR_SELECTION.parse("sha1:" + str(pcr))
+
+        with tracer.span("esapi.pcr_read", pcr=pcr) as trace:
+            try:
+                _, _, digests = self._ectx.pcr_read(selection)
+            except TSS2_Exception as ex:
+                trace["error"] = str(ex)
+                logger.error("pcr_read failed: " + str(ex))
+                return None
+
+        return format_pcr(bytes(digests[0]))
+
+    def sign(self, digest):
+        # tpm2_sign hashes its input file (the hex digest) with sha256,
+        # do the same so signatures stay verifiable by tpm2_verifysignature.
+        scheme = TPMT_SIG_SCHEME(scheme=TPM2_ALG.RSASSA)
+        scheme.details.any.hashAlg = TPM2_ALG.SHA256
+        validation = TPMT_TK_HASHCHECK(tag=TPM2_ST.HASHCHECK,
+                                       hierarchy=TPM2_RH.NULL)
+
+        with tracer.span("esapi.sign") as trace:
+            try:
+                signature = self._ectx.sign(
+                    self._key, TPM2B_DIGEST(sha256(digest.encode()).digest()),
+                    scheme, validation)
+            except TSS2_Exception as ex:
+                trace["error"] = str(ex)
+                logger.error("sign failed: " + str(ex))
+                return None
+
+        return signature.marshal().hex()
+
+
+class SoftwareBackend(TPMBackend):
+    """
+    Pure software TPM simulator, used for benchmarks and tests on machines
+    without a TPM. Signatures are HMAC-SHA256 tags and prove nothing.
+    """
+
+    name = "software"
+
+    def __init__(self, config):
+        super().__init__(config)
+
+        key = config.get("sim_key")
+        self._key = key.encode() if key else os.urandom(32)
+        self._banks = dict()
+
+    def provision(self, prov_path, primary_ctx):
+        return True
+
+    def open(self, primary_ctx, key_pub, key_priv, key_ctx):
+        return True
+
+    def hash(self, msg):
+        return sha1(msg.encode()).hexdigest()
+
+    def extend_pcr(self, pcr, digest):
+        pcr = int(pcr)
+        old = self._banks.get(pcr, bytes(PCR_SIZE))
+        self._banks[pcr] = sha1(old + bytes.fromhex(digest)).digest()
+        return True
+
+    def read_pcr(self, pcr):
+        return format_pcr(self._banks.get(int(pcr), bytes(PCR_SIZE)))
+
+    def reset_pcr(self, pcr):
+        self._banks.pop(int(pcr), None)
+
+    def sign(self, digest):
+        return hmac.new(self._key, digest.encode(), sha256).hexdigest()
+
+
+BACKENDS = {
+    SubprocessBackend.name: SubprocessBackend,
+    ESAPIBackend.name: ESAPIBackend,
+    SoftwareBackend.name: SoftwareBackend,
+}
+
+
+def create_backend(config):
+    """
+    Instantiates the backend selected by the 'backend' key
+    of the [tpm] section. Defaults to tpm2-tools subprocesses.
+    """
+    name = config.get("backend", SubprocessBackend.name).lower()
+
+    try:
+        backend = BACKENDS[name]
+    except KeyError:
+        logger.error("Unknown TPM backend {}, using {}".format(
+            name, SubprocessBackend.name))
+        backend = SubprocessBackend
+
+    if backend is ESAPIBackend and ESAPI is None:
+        logger.error("tpm2-pytss is not installed, using {}".format(
+            SubprocessBackend.name))
+        backend = SubprocessBackend
+
+    return backend(config)
@@ -10,9 +10,12 @@ Contributors: Teri Lenard
 """
 
 import json
+from collections import OrderedDict
 from hashlib import sha1
 
 from log import logger
+from merkle import verify_proof
+from tracing import tracer_from_config, export_trace
 from utils import *
 from wrapper import TPM2_LoadExternalPubKey, TPM2_Verify, TPM2_Hash, \
     TPM2_ExtendPcr, TPM2_ReadPcr, TPM2_CreatePrimary, TPM2_DICTIONARY_LOCKOUT, \
@@ -21,6 +24,9 @@ from wrapper import TPM2_LoadExternalPubKey, TPM2_Verify, TPM2_Hash, \
 
 class TPMCore:
 
+    # Number of verified Merkle roots remembered
+    ROOT_CACHE_SIZE = 1024
+
     def __init__(self, config):
 
         self._primary_ctx = config["tpm2_primary_ctx"]
@@ -32,6 +38,16 @@ class TPMCore:
         self._pcr = config["pcr"]
         self._sign_file = config["sign_file"]
 
+        self._verified_roots = OrderedDict()
+
+        # Every TPM command is traced when trace_file is set, the trace is
+        # written on close()
+        self._trace_file = tracer_from_config(config)
+
+    @property
+    def public_key(self):
+        return self._key_pub
+
     def initialise(self):
 
         success = TPM2_DICTIONARY_LOCKOUT()
@@ -58,6 +74,9 @@ class TPMCore:
 
     def verify(self, obj):
 
+        if obj.root is not None:
+            return self._verify_batched(obj)
+
         dump(obj.message, self._tmp_file)
 
         digest = TPM2_Hash(self._tmp_file, self._digest_file)
@@ -72,7 +91,59 @@ class TPMCore:
                             self._digest_file, self._sign_file)
 
         if not success:
-            print("Couldn't not verify signature {}".format(str(obj.message)))
+            logger.error("Couldn't verify signature {}".format(str(obj.message)))
             return False
 
         return success
+
+    def verify_batch(self, batch):
+        # One TPM command at a time, a LogBatch yields its logs as LogModels
+        return [self.verify(obj) for obj in batch]
+
+    def close(self):
+        if self._trace_file:
+            export_trace(self._trace_file)
+
+    def _verify_batched(self, obj):
+        """
+        Checks the inclusion proof of a log signed in a Merkle batch,
+        then the root signature, which is verified once per batch.
+        """
+        try:
+            included = verify_proof(sha1(obj.message.encode()).digest(),
+                                    int(obj.leaf_index), int(obj.batch_size),
+                                    [bytes.fromhex(node) for node in obj.proof],
+                                    bytes.fromhex(obj.root))
+        except (TypeError, ValueError):
+            included = False
+
+        if not included:
+            logger.error("Invalid inclusion proof for {}".format(str(obj.message)))
+            return False
+
+        return self._verify_root(obj.root, obj.signature)
+
+    def _verify_root(self, root, signature):
+
+        key = (root, signature)
+
+        if key in self._verified_roots:
+            self._verified_roots.move_to_end(key)
+            return True
+
+        dump(root, self._digest_file)
+        write_binary(signature, self._sign_file)
+
+        success = TPM2_Verify(self._key_ctx,
+                              self._digest_file, self._sign_file)
+
+        if not success:
+            logger.error("Couldn't verify root signature {}".format(root))
+            return False
+
+        self._verified_roots[key] = True
+
+        if len(self._verified_roots) > self.ROOT_CACHE_SIZE:
+            self._verified_roots.popitem(last=False)
+
+        return True
@@ -11,32 +11,42 @@ Contributors: Teri Lenard
 
 import asyncio
 import json
+import logging
 import signal
 import sys
-import re
 import time
 
-from string import printable
 from configparser import ConfigParser
 from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from hashlib import sha1
 
-from log import logger
-from client_mqtt import MQTTClient
+from log import logger, setup_logging, dropped_records
+from client_mqtt import MQTTClient, publisher_from_config
+from spool import Spool
+from coalescer import Coalescer
+from log_parser import MessageParser
+from merkle import MerkleTree
+from pipeline import queue_from_config, OVERFLOW_BLOCK
+from metrics import MetricsRegistry, server_from_config
+from ingest_server import ingest_from_config
+from tracing import tracer_from_config, export_trace
 from utils import *
-from wrapper import TPM2_FlushContext, TPM2_LoadKey, TPM2_Sign, TPM2_Hash, \
-    TPM2_ExtendPcr, TPM2_ReadPcr, TPM2_CreatePrimary, TPM2_DICTIONARY_LOCKOUT
+from tpm_backend import create_backend, format_pcr, parse_pcr, \
+    PCR_SIZE, PCR_ZERO
 
 
-class StopProcessException(Exception):
+# Linux fifo capacity, a single read drains a full pipe
+PIPE_CHUNK_SIZE = 65536
 
-    def __init__(self):
-        pass
+# Logs signed per trip to the TPM thread when not batching
+SIGN_DRAIN_SIZE = 64
 
 
 class TPMCore:
 
-    def __init__(self, config):
+    def __init__(self, config, metrics=None):
         self._config = dict(config["tpm"])
 
         self._primary_ctx = self._config["tpm2_primary_ctx"]
@@ -49,6 +59,28 @@ class TPMCore:
         self._prov_path = self._config["tpm2_prov_path"]
         self._key_ctx = self._config["tpm2_priv_ctx"]
 
+        self._backend = create_backend(self._config)
+
+        # Every TPM command is traced when trace_file is set, the trace is
+        # written on close()
+        self._trace_file = tracer_from_config(self._config)
+
+        # Time spent in each TPM command
+        metrics = metrics if metrics is not None else MetricsRegistry()
+        stage = "Seconds per TPM command or pipeline stage."
+        self._hash_seconds = metrics.histogram("stage_seconds", stage, stage="hash")
+        self._extend_seconds = metrics.histogram("stage_seconds", stage, stage="extend_pcr")
+        self._read_seconds = metrics.histogram("stage_seconds", stage, stage="read_pcr")
+        self._sign_seconds = metrics.histogram("stage_seconds", stage, stage="sign")
+        self._merkle_seconds = metrics.histogram("stage_seconds", stage, stage="merkle")
+
+        # Software copy of the PCR, checked against the TPM at startup and
+        # then every pcr_reconcile_interval seconds (0 for startup only)
+        self._pcr_mirror = None
+        self._reconcile_interval = float(self._config.get("pcr_reconcile_interval", 300))
+        self._last_reconcile = 0
+        self._is_new_chain = False
+        self.pcr_divergences = 0
 
         self._key_loaded = False
 
@@ -66,42 +98,100 @@ class TPMCore:
     def pcr_state(self):
         # Return True if PCR is 0x00 else False
 
-        pcr_value = TPM2_ReadPcr(self._pcr);
-
-        if "0x0000000000000000000000000000000000000000" == pcr_value:
-            return True
-        return False
+        if self._pcr_mirror is None:
+            return PCR_ZERO == self._backend.read_pcr(self._pcr)
 
-    def initialise(self):
+        return self._pcr_mirror == bytes(PCR_SIZE)
 
-        success = TPM2_DICTIONARY_LOCKOUT()
+    @property
+    def pcr_value(self):
+        return format_pcr(self._pcr_mirror)
 
-        if success:
-            logger.info("Removed dictionary lockout.")
-        else:
-            logger.error("Could not execute dictionary lockout")
+    @property
+    def is_new_chain(self):
+        """
+        True if the last extend started from a reset PCR.
+        """
+        return self._is_new_chain
 
-        success = TPM2_CreatePrimary(self._prov_path, self._primary_ctx)
+    @property
+    def backend(self):
+        return self._backend
 
-        if success:
-            logger.debug("Recreated primary.ctx in " + self._prov_path)
+    def initialise(self):
 
-            if success:
-                logger.debug("Finished recreating primary.ctx.")
-            else:
-                logger.error("Could not recreate primary.ctx.")
+        self._backend.provision(self._prov_path, self._primary_ctx)
 
-        self._key_loaded = TPM2_LoadKey(self._prov_path + self._primary_ctx,
-                                        self._prov_path + self._key_pub,
-                                        self._prov_path + self._key_priv,
-                                        self._prov_path + self._key_ctx)
+        self._key_loaded = self._backend.open(self._prov_path + self._primary_ctx,
+                                              self._prov_path + self._key_pub,
+                                              self._prov_path + self._key_priv,
+                                              self._prov_path + self._key_ctx)
 
         if not self._key_loaded:
             logger.error("Couldn't load keys into the TPM.")
             return False
 
+        if not self.reconcile_pcr():
+            logger.error("Couldn't read PCR {}".format(self._pcr))
+            return False
+
         return True
 
+    def reconcile_pcr(self):
+        """
+        Reads the PCR from the TPM and compares it with the mirror.
+        A mismatch means something else extended or reset the PCR:
+        it is reported and the mirror follows the TPM.
+        """
+        self._last_reconcile = time.monotonic()
+
+        start = time.perf_counter()
+        value = self._backend.read_pcr(self._pcr)
+        self._read_seconds.observe(time.perf_counter() - start)
+
+        if value is None:
+            return False
+
+        value = parse_pcr(value)
+
+        if self._pcr_mirror is not None and value != self._pcr_mirror:
+            self.pcr_divergences += 1
+            logger.critical("PCR {} diverged from its mirror: TPM {}, "
+                            "expected {}".format(self._pcr, format_pcr(value),
+                                                 format_pcr(self._pcr_mirror)))
+
+        self._pcr_mirror = value
+
+        return True
+
+    def _extend_pcr(self, digest):
+        """
+        Extends the PCR with a hex digest and updates the mirror with
+        sha1(old || digest), the same computation the TPM does.
+        """
+        if self._reconcile_interval > 0 and \
+                time.monotonic() - self._last_reconcile >= self._reconcile_interval:
+            self.reconcile_pcr()
+
+        start = time.perf_counter()
+        extended = self._backend.extend_pcr(self._pcr, digest)
+        self._extend_seconds.observe(time.perf_counter() - start)
+
+        if not extended:
+            return False
+
+        self._is_new_chain = self._pcr_mirror == bytes(PCR_SIZE)
+        self._pcr_mirror = sha1(self._pcr_mirror + bytes.fromhex(digest)).digest()
+
+        return True
+
+    def close(self):
+        self._backend.close()
+        self._key_loaded = False
+
+        if self._trace_file:
+            export_trace(self._trace_file)
+
     def _check_provision(self):
         """
         Verifies that the provision step was done correctly,
@@ -124,127 +214,265 @@ class TPMCore:
 
         json_log["Message"] = msg
 
-        dump(msg, self._tmp_file)
-
-        digest = TPM2_Hash(self._tmp_file, self._digest_file)
+        start = time.perf_counter()
+        digest = self._backend.hash(msg)
+        self._hash_seconds.observe(time.perf_counter() - start)
 
         if not digest:
             logger.error("Couldn't hash: {}.".format(msg))
             return False
 
-        success = TPM2_ExtendPcr(self._pcr, self._digest_file)
+        success = self._extend_pcr(digest)
 
         if not success:
             logger.error("Couldn't extend PCR {} with {}".format(
-                        self._pcr, self._digest_file))
+                        self._pcr, digest))
             return False
 
-        json_log["PCR"] = TPM2_ReadPcr(self._pcr);
+        json_log["PCR"] = self.pcr_value
 
-        success = TPM2_Sign(self._prov_path + self._key_ctx,
-                            self._digest_file, self._sign_file)
+        start = time.perf_counter()
+        signature = self._backend.sign(digest)
+        self._sign_seconds.observe(time.perf_counter() - start)
 
-        if not success:
+        if not signature:
             logger.error("Couldn't sign {}".format(str(msg)))
             return False
 
-        signature = load_binary(self._sign_file)
-
         json_log["Signature"] = signature
 
-        logger.info("New secure log: " + json.dumps(json_log))
+        # Lazy, and only the immutable fields: json_log is filled in
+        # further before the writer thread gets to format the record
+        logger.debug("New secure log, PCR %s: %s", json_log["PCR"], msg)
 
         return json_log
 
+    def sign_batch(self, msgs):
+        """
+        Builds a Merkle tree over the digests of msgs, extends the PCR
+        once with its root and signs the root once. Returns one log per
+        message, each carrying its inclusion proof.
+        """
 
-class MessageParser():
+        if not self._key_loaded:
+            logger.error("Keys not loaded.")
+            return False
 
-    CANID_REGEX = 'CAN ID: (.+?) .'
-    LOG_REGEX = '(.+?) CAN'
-    TIMESTAMP_REGEX = "Timestamp: (.+?) ."
+        start = time.perf_counter()
+        digests = [sha1(msg.encode()).digest() for msg in msgs]
+        tree = MerkleTree(digests)
+        root = tree.root.hex()
+        self._merkle_seconds.observe(time.perf_counter() - start)
 
-    def _get_value(regex, msg):
-        found = None
-        m = re.search(regex, msg)
+        success = self._extend_pcr(root)
 
-        if m:
-            found = m.group(1)
+        if not success:
+            logger.error("Couldn't extend PCR {} with root {}".format(
+                        self._pcr, root))
+            return False
 
-        return found
+        pcr = self.pcr_value
 
-    def parse_message(msg):
-        """
-        Returns the can_id, count, log message, timestamp
-        from a single string.
-        """
-        can_id = 0
-        parsed_log = ""
-        count = 1
-        timestamp = 0.0
+        start = time.perf_counter()
+        signature = self._backend.sign(root)
+        self._sign_seconds.observe(time.perf_counter() - start)
 
-        log = ''.join(char for char in msg if char in printable)
- 
-        try:
-            can_id = int(MessageParser._get_value(
-                MessageParser.CANID_REGEX, log
-            ))
-        except (ValueError, TypeError):
-                pass
+        if not signature:
+            logger.error("Couldn't sign root {}".format(root))
+            return False
 
-        parsed_log = MessageParser._get_value(
-                MessageParser.LOG_REGEX, log
-            )
+        json_logs = list()
 
-        try:
-            timestamp = float(MessageParser._get_value(
-                MessageParser.TIMESTAMP_REGEX, log
-            ))
-        except (ValueError, TypeError):
-            timestamp = time.time()
+        for index, msg in enumerate(msgs):
+            json_logs.append({
+                "Message": msg,
+                "PCR": pcr,
+                "Signature": signature,
+                "Root": root,
+                "LeafIndex": index,
+                "BatchSize": len(msgs),
+                "Proof": [node.hex() for node in tree.proof(index)]
+            })
 
-        return (can_id, parsed_log, count, timestamp)
+        logger.debug("New secure batch of %d logs, root %s", len(msgs), root)
+
+        return json_logs
 
 
 class TPMLogger:
 
     def __init__(self, config):
 
-        self._tpm_core = TPMCore(config)
+        # Served on [metrics] listen, see metrics.py
+        self._metrics = MetricsRegistry(prefix="tpm_logger_")
+        self._metrics_config = config["metrics"] if config.has_section("metrics") else None
+        self._metrics_server = None
+
+        self._tpm_core = TPMCore(config, self._metrics)
 
         self._pipe_path = config["log"]["fifo"]
         self._pipe = None
-        self._queue = list()
-        self._should_read = True
+        # Keeps the fifo open so writers going away don't signal EOF
+        self._pipe_writer = None
+        self._framer = LineFramer()
+        # Puts a batch that didn't fit in the ingest queue, reading waits for it
+        self._pipe_resume = None
+
+        # Repeated logs merged into one signed log, disabled when the window is 0
+        self._coalescer = Coalescer(
+            int(config["log"].get("coalesce_window_ms", 0)) / 1000,
+            int(config["log"].get("count", 1)))
+
+        # Merkle batching, disabled when batch_size is 1
+        self._batch_size = int(config["tpm"].get("batch_size", 1))
+        self._batch_timeout = int(config["tpm"].get("batch_timeout_ms", 100)) / 1000
+
+        # ingest -> parse -> sign -> publish, each stage reads one queue
+        pipeline = config["pipeline"] if config.has_section("pipeline") else {}
+
+        self._ingest_queue = queue_from_config("ingest", pipeline)
+        self._coalesce_queue = queue_from_config("coalesce", pipeline)
+        self._sign_queue = queue_from_config("sign", pipeline)
+        self._publish_queue = queue_from_config("publish", pipeline,
+                                                on_drop=self._spool_log)
+        self._metrics_interval = int(pipeline.get("metrics_interval", 60))
+        # Seconds stop() waits for queued logs to be signed and published
+        self._drain_timeout = float(pipeline.get("drain_timeout", 30))
+        self._stopping = False
+
+        # Unix socket for any number of producers, feeds the ingest queue too
+        self._ingest_server = ingest_from_config(
+            self._ingest_queue, config["ingest"] if config.has_section("ingest") else None,
+            self._metrics)
+        self._failed = 0
+        # Running tasks, each removes itself when done
+        self._tasks = set()
+
+        # Signed logs that couldn't be published wait here for a reconnect
+        self._spool = None
+        self._replay_rate = 0
+        self._replay_task = None
+
+        if config.has_section("spool"):
+            self._spool = Spool(config["spool"]["directory"],
+                                int(config["spool"].get("segment_bytes", 1 << 20)),
+                                int(config["spool"].get("max_bytes", 16 << 20)))
+            self._replay_rate = float(config["spool"].get("replay_rate", 200))
+
+        # TPM commands run one at a time, away from the loop
+        self._tpm_executor = ThreadPoolExecutor(max_workers=1,
+                                                thread_name_prefix="tpm")
 
         self._mqtt_client = MQTTClient(config["mqtt"]["user"],
                                       config["mqtt"]["passwd"],
                                       config["mqtt"]["host"],
                                       int(config["mqtt"]["port"]),
-                                      on_message_callback=self._on_new_message)
+                                      on_message_callback=self._on_new_message,
+                                      qos=int(config["mqtt"].get("qos", 0)),
+                                      max_inflight=int(config["mqtt"].get("max_inflight", 20)),
+                                      on_connect_callback=self._on_mqtt_connected)
 
-        self._loop = asyncio.get_event_loop()
+        self._publisher = publisher_from_config(self._mqtt_client, config["mqtt"],
+                                                on_failure=self._spool_encoded)
+        self._replay_publisher = publisher_from_config(self._mqtt_client,
+                                                       config["mqtt"])
+        self._publish_linger = int(config["mqtt"].get("batch_linger_ms", 50)) / 1000
 
-    def _read_pipe(self):
-        _last_message = ""
-        while self._should_read:
-            _last_message += self._pipe.read(1)
-            if _last_message.endswith('\n'):
-                return _last_message[:-1]
-
-    async def _listen_on_pipe(self):
+        self._loop = asyncio.get_event_loop()
 
+        self._register_metrics()
+
+    def _register_metrics(self):
+        metrics = self._metrics
+        stage = "Seconds per TPM command or pipeline stage."
+
+        self._parse_seconds = metrics.histogram("stage_seconds", stage, stage="parse")
+        self._publish_seconds = metrics.histogram("stage_seconds", stage, stage="publish")
+
+        self._logs_in = metrics.counter("logs_in", "Lines read from the fifo, the ingest socket or MQTT.")
+        self._logs_signed = metrics.counter("logs_signed", "Logs signed.")
+        self._logs_spooled = metrics.counter("logs_spooled", "Signed logs spooled to disk.")
+        metrics.counter("logs_published", "Signed logs handed to the MQTT client.",
+                        lambda: self._publisher.published + self._replay_publisher.published)
+        metrics.counter("logs_failed", "Logs that couldn't be parsed, signed or kept.",
+                        lambda: self._failed)
+        metrics.counter("logs_coalesced", "Repeats merged into an earlier log.",
+                        lambda: self._coalescer.merged)
+        metrics.counter("pcr_divergences", "PCR reads that didn't match the mirror.",
+                        lambda: self._tpm_core.pcr_divergences)
+        metrics.counter("log_records_dropped", "Debug records dropped by a full log queue.",
+                        dropped_records)
+
+        for queue in (self._ingest_queue, self._coalesce_queue,
+                      self._sign_queue, self._publish_queue):
+            metrics.counter("logs_dropped", "Items discarded by a full stage queue.",
+                            lambda queue=queue: queue.dropped, queue=queue.name)
+            metrics.gauge("queue_depth", "Items waiting in a stage queue.",
+                          lambda queue=queue: len(queue), queue=queue.name)
+
+    def _on_pipe_readable(self):
+        """
+        Called by the loop when the fifo has data. Reads one large chunk
+        and hands every complete line in it over as a single batch.
+        """
         try:
-            msg = self._read_pipe()
-        except StopProcessException:
-            self.stop()
+            data = os.read(self._pipe, PIPE_CHUNK_SIZE)
+        except BlockingIOError:
+            return
+        except OSError as ex:
+            logger.error("Couldn't read fifo: " + str(ex))
             return
 
-        asyncio.run_coroutine_threadsafe(self._listen_on_pipe(), self._loop)
+        lines = self._framer.feed(data)
 
-        if not msg:
-            return
+        if lines and not self._ingest_queue.put_nowait(lines) \
+                and self._ingest_queue.overflow == OVERFLOW_BLOCK:
+            # Stop reading until there is room, writers block on the fifo
+            self._loop.remove_reader(self._pipe)
+            self._pipe_resume = self._spawn(self._resume_pipe(lines))
+
+    def _spawn(self, coroutine):
+        task = self._loop.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _resume_pipe(self, lines):
+        await self._ingest_queue.put(lines)
+
+        if self._pipe is not None and not self._stopping:
+            self._loop.add_reader(self._pipe, self._on_pipe_readable)
+
+    async def _read_rest_of_pipe(self):
+        """
+        Takes in what writers left in the fifo before stop(), then
+        closes it.
+        """
+        if self._pipe_resume is not None:
+            await self._pipe_resume
 
-        self._handle_log(msg)
+        while self._pipe is not None:
+            try:
+                data = os.read(self._pipe, PIPE_CHUNK_SIZE)
+            except BlockingIOError:
+                break
+            except OSError as ex:
+                logger.error("Couldn't read fifo: " + str(ex))
+                break
+
+            lines = self._framer.feed(data)
+
+            if lines:
+                await self._ingest_queue.put(lines)
+
+        self._close_pipe()
+
+    def _close_pipe(self):
+
+        if self._pipe is not None:
+            os.close(self._pipe)
+            os.close(self._pipe_writer)
+            self._pipe = None
 
     def start(self):
 
@@ -252,9 +480,8 @@ class TPMLogger:
             logger.error("Couldn't create fifo.")
             return False
 
-        self._should_read = True
-        fd = os.open(self._pipe_path, os.O_RDONLY)
-        self._pipe = os.fdopen(fd, "r")
+        self._pipe = os.open(self._pipe_path, os.O_RDONLY | os.O_NONBLOCK)
+        self._pipe_writer = os.open(self._pipe_path, os.O_WRONLY | os.O_NONBLOCK)
 
         if not self._tpm_core.initialise():
             logger.error("Could not initialise/load keys")
@@ -265,41 +492,294 @@ class TPMLogger:
         if self._loop is None:
             self._loop = asyncio.get_event_loop()
 
-        self._loop.create_task(self._listen_on_pipe())
+        stages = [self._parse_stage, self._sign_stage,
+                  self._publish_stage, self._report_metrics]
+
+        if self._coalescing:
+            stages.append(self._coalesce_stage)
+
+        for stage in stages:
+            self._spawn(stage())
+
+        self._loop.add_reader(self._pipe, self._on_pipe_readable)
+
+        if self._ingest_server is not None:
+            try:
+                self._loop.run_until_complete(self._ingest_server.start())
+            except OSError as ex:
+                logger.error("Couldn't listen for logs, fifo only: " + str(ex))
+                self._ingest_server = None
+
+        self._metrics_server = server_from_config(self._metrics, self._metrics_config)
 
         logger.debug("Starting the loop")
+
         self._loop.run_forever()
+        self._shutdown()
+
+    def stop_on_signals(self, signums=(signal.SIGQUIT, signal.SIGTERM, signal.SIGINT)):
+        """
+        Stops the logger on signums. Handled by the loop between callbacks,
+        so a signal never interrupts a stage halfway. Main thread only.
+        """
+        for signum in signums:
+            self._loop.add_signal_handler(signum, self.stop)
 
     def stop(self):
+        """
+        Stops taking in logs, lets the ones already read be signed and
+        published, then stops the loop. Called again while draining, it
+        stops the loop straight away. Runs on the loop's thread.
+        """
+        if self._stopping:
+            logger.warning("Stopping without draining the pipeline")
+            self._loop.stop()
+            return
+
+        self._stopping = True
+
+        if self._pipe is not None:
+            self._loop.remove_reader(self._pipe)
+
+        if self._ingest_server is not None:
+            self._ingest_server.close()
+
+        if self._loop.is_running():
+            logger.debug("Draining the pipeline...")
+            self._spawn(self._drain_and_stop())
+        else:
+            self._close_pipe()
 
-        if self._pipe:
-            self._should_read = False
-            self._pipe.close()
+    async def _drain(self):
+        await self._read_rest_of_pipe()
+
+        if self._ingest_server is not None:
+            await self._ingest_server.wait_closed()
+
+        # In stage order, each join waits for what the stage before handed on
+        await self._ingest_queue.join()
+
+        # Repeats still inside their window are signed with the count so far,
+        # the coalesce stage flushes itself once it emptied its queue
+        if self._coalesce_queue.empty():
+            for released in self._coalescer.flush():
+                await self._sign_queue.put(released)
+                self._coalesce_queue.task_done()
+
+        await self._coalesce_queue.join()
+        await self._sign_queue.join()
+        await self._publish_queue.join()
+
+    async def _drain_and_stop(self):
+        try:
+            await asyncio.wait_for(self._drain(), self._drain_timeout)
+            logger.debug("Pipeline drained")
+        except asyncio.TimeoutError:
+            logger.error("Pipeline not drained after {} s".format(self._drain_timeout))
+
+        self._loop.stop()
+
+    def _shutdown(self):
+        """
+        Cancels the pipeline stages once the loop stopped, spools the
+        signed logs still queued and releases the TPM.
+        """
+        for task in self._tasks:
+            task.cancel()
+
+        if self._tasks:
+            self._loop.run_until_complete(
+                asyncio.gather(*self._tasks, return_exceptions=True))
+
+        self._close_pipe()
+
+        for json_log in self._publish_queue.drain():
+            self._spool_log(json_log)
+
+        unsigned = sum(len(lines) for lines in self._ingest_queue.drain()) + \
+            len(self._coalesce_queue.drain()) + len(self._coalescer.flush()) + \
+            len(self._sign_queue.drain())
+
+        if unsigned:
+            logger.error("{} logs weren't signed before stopping".format(unsigned))
+            self._failed += unsigned
 
         if self._mqtt_client.is_connected():
             logger.debug("Stopping the mqtt client")
             self._mqtt_client.stop()
             logger.debug("Mqtt client stopped")
 
-        if self._loop.is_running:
-            logger.debug("Stopping the loop...")
-            self._loop.call_soon_threadsafe(self._loop.stop)
-            logger.debug("Loop stopped.")
+        self._tpm_executor.shutdown(wait=True)
+        self._tpm_core.close()
+
+        if self._metrics_server is not None:
+            self._metrics_server.stop()
+            self._metrics_server = None
+
+        if self._spool is not None:
+            self._spool.close()
+
+    def metrics(self):
+        """
+        Returns the per-stage queue counters.
+        """
+        stats = {queue.name: queue.stats() for queue in
+                 (self._ingest_queue, self._coalesce_queue,
+                  self._sign_queue, self._publish_queue)}
+        stats["failed"] = self._failed
+        stats["coalesced"] = self._coalescer.merged
+
+        if self._ingest_server is not None:
+            stats["producers"] = self._ingest_server.stats()
+
+        return stats
+
+    async def _report_metrics(self):
+        while True:
+            await asyncio.sleep(self._metrics_interval)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Pipeline: %s", json.dumps(self.metrics()))
 
     def _on_new_message(self, mqttc, obj, msg):
+        """
+        Runs on paho's network thread, hands the log over to the loop.
+        """
 
         if not msg:
             logger.error("Error on receiving new mqtt message")
             return
 
-        self._handle_log(msg.payload.decode())
+        lines = [msg.payload.decode()]
+
+        if self._ingest_queue.overflow != OVERFLOW_BLOCK:
+            self._loop.call_soon_threadsafe(self._ingest_queue.put_nowait, lines)
+            return
+
+        # Only waits while the pipeline is saturated
+        future = asyncio.run_coroutine_threadsafe(
+            self._ingest_queue.put(lines), self._loop)
+
+        while True:
+            try:
+                future.result(timeout=1)
+                return
+            except FutureTimeoutError:
+                if not self._loop.is_running():
+                    future.cancel()
+                    return
+
+    @property
+    def _coalescing(self):
+        return self._coalescer.window > 0
+
+    async def _parse_stage(self):
+        while True:
+            lines = await self._ingest_queue.get()
+            self._logs_in.inc(len(lines))
+
+            start = time.perf_counter()
+            entries = MessageParser.parse_many(lines)
+            self._parse_seconds.observe(time.perf_counter() - start)
+
+            for entry in entries:
 
-    def _handle_log(self, msg):
+                if entry[1] is None:
+                    logger.error("Couldn't parse log, dropping it.")
+                    self._failed += 1
+                    continue
 
-        can_id, parsed_log, count, timestamp = MessageParser.parse_message(msg)
+                if self._coalescing:
+                    await self._coalesce_queue.put(entry)
+                else:
+                    can_id, parsed_log, count, timestamp = entry
+                    await self._sign_queue.put(
+                        (can_id, parsed_log, count, timestamp, timestamp))
 
-        json_log = self._tpm_core.sign(parsed_log)
+            self._ingest_queue.task_done()
 
+    async def _coalesce_stage(self):
+        """
+        Holds parsed logs for the coalescing window so repeats of the
+        same alert are signed once, with an accurate Count. An entry is
+        done once merged into another or put on the sign queue, so
+        joining the coalesce queue waits for the logs it holds.
+        """
+        while True:
+            deadline = self._coalescer.next_deadline
+
+            try:
+                if not self._coalesce_queue.empty():
+                    entry = self._coalesce_queue.get_nowait()
+                elif deadline is None:
+                    entry = await self._coalesce_queue.get()
+                else:
+                    entry = await asyncio.wait_for(
+                        self._coalesce_queue.get(),
+                        max(0, deadline - self._loop.time()))
+            except asyncio.TimeoutError:
+                entry = None
+
+            now = self._loop.time()
+
+            if entry is not None:
+                held = len(self._coalescer)
+                released = self._coalescer.add(entry, now)
+
+                if released is not None:
+                    await self._sign_queue.put(released)
+
+                # The entry and, if it was released, the one it merged into
+                self._coalesce_queue.task_done(1 + held - len(self._coalescer))
+
+            # While stopping nothing waits for its window any more
+            if self._stopping and self._coalesce_queue.empty():
+                expired = self._coalescer.flush()
+            else:
+                expired = self._coalescer.expire(now)
+
+            for released in expired:
+                await self._sign_queue.put(released)
+                self._coalesce_queue.task_done()
+
+    async def _sign_stage(self):
+
+        if self._batch_size > 1:
+            max_entries, timeout = self._batch_size, self._batch_timeout
+        else:
+            max_entries, timeout = SIGN_DRAIN_SIZE, 0
+
+        while True:
+            entries = await self._sign_queue.get_batch(max_entries, timeout)
+
+            try:
+                json_logs = await self._loop.run_in_executor(
+                    self._tpm_executor, self._sign_entries, entries)
+            except Exception as ex:
+                logger.error("Couldn't sign {} logs: {}".format(len(entries), ex))
+                json_logs = []
+
+            self._failed += len(entries) - len(json_logs)
+            self._logs_signed.inc(len(json_logs))
+
+            for json_log in json_logs:
+                await self._publish_queue.put(json_log)
+
+            self._sign_queue.task_done(len(entries))
+
+    async def _publish_stage(self):
+
+        if self._publisher.max_records > 1:
+            linger = self._publish_linger
+        else:
+            linger = 0
+
+        while True:
+            json_logs = await self._publish_queue.get_batch(
+                self._publisher.max_records, linger)
+            self._publish(json_logs)
+            self._publish_queue.task_done(len(json_logs))
+
+    def _describe(self, json_log, entry):
         """
         json_log now looks like:
             json_log{
@@ -307,34 +787,136 @@ class TPMLogger:
                 "Timestamp": timestamp,
                 "Count": count
         }
-        Next the can id is set
+        Next the can id is set, and the time of the last
+        occurrence for coalesced logs.
         """
+        can_id, _, count, first_timestamp, last_timestamp = entry
+
         json_log["CanId"] = can_id
-        json_log["Timestamp"] = timestamp
+        json_log["Timestamp"] = first_timestamp
         json_log["Count"] = count
 
+        if count > 1:
+            json_log["LastTimestamp"] = last_timestamp
+
+    def _sign_entries(self, entries):
+        """
+        Signs (can_id, log, count, first_timestamp, last_timestamp)
+        entries, one by one or as a single Merkle batch. Runs on the
+        TPM executor.
+        """
+
+        if self._batch_size > 1:
+            json_logs = self._tpm_core.sign_batch(
+                [entry[1] for entry in entries])
+
+            if not json_logs:
+                return []
+
+            is_new_chain = self._tpm_core.is_new_chain
+
+            for json_log, entry in zip(json_logs, entries):
+                self._describe(json_log, entry)
+                json_log["IsNewChain"] = is_new_chain
+
+            return json_logs
+
+        json_logs = list()
+
+        for entry in entries:
+
+            json_log = self._tpm_core.sign(entry[1])
+
+            if not json_log:
+                continue
+
+            self._describe(json_log, entry)
+
+            # Indicate that a new PCR chain started
+            # This should be set to False after the first
+            # log is published
+            json_log["IsNewChain"] = self._tpm_core.is_new_chain
+
+            json_logs.append(json_log)
 
-        # Indicate that a new PCR chain started
-        # This should be set to False after the first
-        # log is published
-        json_log["IsNewChain"] = self._tpm_core.pcr_state
+        return json_logs
+
+    def _publish(self, json_logs):
+        start = time.perf_counter()
+        self._publish_json(json_logs)
+        self._publish_seconds.observe(time.perf_counter() - start)
+
+    def _publish_json(self, json_logs):
 
         if self._mqtt_client.is_connected():
-            self._mqtt_client.publish_log(
-                json.dumps(json_log))
+            for json_log in json_logs:
+                self._publisher.add(json_log)
+            self._publisher.flush()
         else:
+            encode = self._publisher.codec.encode
+            self._spool_encoded([encode(json_log) for json_log in json_logs])
+
+    def _spool_log(self, json_log):
+        self._spool_encoded([self._publisher.codec.encode(json_log)])
+
+    def _spool_encoded(self, records):
+
+        if self._spool is None:
             logger.error("Couldn't publish json to mqtt")
+            self._failed += len(records)
+            return
 
+        logger.warning("Couldn't publish json to mqtt, spooling {} logs".format(
+                       len(records)))
+        self._logs_spooled.inc(len(records))
+        # Spooled as published, in the [mqtt] wire_format
+        stored = self._publisher.codec.stored
+        self._spool.append([stored(record) for record in records])
 
-def signal_handler(signum, frame):
-    raise StopProcessException()
+    def _on_mqtt_connected(self):
+        # Runs on paho's network thread
+        self._loop.call_soon_threadsafe(self._start_replay)
 
+    def _start_replay(self):
 
-if __name__ == "__main__":
+        if self._spool is None or not self._spool.has_pending():
+            return
+
+        if self._replay_task is None or self._replay_task.done():
+            self._replay_task = self._spawn(self._replay_spool())
+
+    async def _replay_spool(self):
+        """
+        Publishes spooled logs in order, at most replay_rate per second
+        so a reconnect doesn't starve live traffic. The cursor only moves
+        once a chunk was handed to the client.
+        """
+        chunk = max(1, int(self._replay_rate / 10)) if self._replay_rate else 256
+
+        logger.info("Replaying spooled logs")
+
+        while self._mqtt_client.is_connected():
+            records = self._spool.read(chunk)
+
+            if not records:
+                logger.info("Spool drained")
+                return
+
+            from_stored = self._replay_publisher.codec.from_stored
+            published = [self._replay_publisher.add_encoded(from_stored(record))
+                         for record, _ in records]
+
+            if not all(published) or not self._replay_publisher.flush():
+                logger.error("Replay interrupted, will resume on reconnect")
+                return
 
-    signal.signal(signal.SIGQUIT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
-    signal.signal(signal.SIGINT, signal_handler)
+            self._spool.commit(records[-1][1])
+
+            await asyncio.sleep(len(records) / self._replay_rate
+                                if self._replay_rate else 0)
+
+
+if __name__ == "__main__":
 
     parser = ArgumentParser(description="TPM Logger")
     parser.add_argument("-c", type=str, help="Path to config file.")
@@ -343,6 +925,10 @@ if __name__ == "__main__":
     config = ConfigParser()
     config.read(args.c)
 
+    if config.has_section("log"):
+        setup_logging(config["log"], "tpm_log", "tpm_logger.log")
+
     global tpm_logger
     tpm_logger = TPMLogger(config)
+    tpm_logger.stop_on_signals()
     tpm_logger.start()
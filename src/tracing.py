@@ -0,0 +1,178 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+
+Opt-in trace of every TPM operation. The export opens in
+chrome://tracing or https://ui.perfetto.dev, and a per-command latency
+summary of it is printed with:
+    python tracing.py tpm_trace.json
+"""
+
+import json
+import math
+import os
+import threading
+import time
+
+from argparse import ArgumentParser
+from collections import deque
+from contextlib import contextmanager
+
+from log import logger
+
+
+class Tracer:
+    """
+    Keeps the last max_events operations in memory while enabled,
+    recording costs nothing otherwise.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._events = deque()
+        self._origin_wall = 0.0
+        self._origin = 0.0
+
+    def enable(self, max_events=100000):
+        self._events = deque(maxlen=max_events)
+        # Trace timestamps are wall clock microseconds, measured with
+        # the monotonic clock
+        self._origin_wall = time.time()
+        self._origin = time.perf_counter()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def record(self, name, start, end, category="tpm", **args):
+        """
+        Records an operation that ran from start to end, perf_counter()
+        values. args end up in the trace, e.g. argv, rc and stderr.
+        """
+        if not self.enabled:
+            return
+
+        self._events.append({
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": (self._origin_wall + start - self._origin) * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_native_id(),
+            "args": args,
+        })
+
+    @contextmanager
+    def span(self, name, category="tpm", **args):
+        """
+        Records the enclosed block. Keys added to the yielded dict end
+        up in the trace.
+        """
+        if not self.enabled:
+            yield args
+            return
+
+        start = time.perf_counter()
+
+        try:
+            yield args
+        finally:
+            self.record(name, start, time.perf_counter(), category, **args)
+
+    def events(self):
+        return list(self._events)
+
+    def export(self, path):
+        """
+        Writes the events as Chrome trace JSON.
+        """
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.events(), "displayTimeUnit": "ms"}, f)
+
+    def summary(self):
+        return summarize(self.events())
+
+
+def _percentile(durations, fraction):
+    # Nearest rank, durations sorted
+    rank = max(0, min(len(durations) - 1, math.ceil(fraction * len(durations)) - 1))
+    return durations[rank]
+
+
+def summarize(events):
+    """
+    Table of per-command latencies in milliseconds, slowest total first.
+    """
+    by_name = dict()
+
+    for event in events:
+        by_name.setdefault(event["name"], []).append(event)
+
+    rows = []
+
+    for name, named in by_name.items():
+        durations = sorted(event["dur"] / 1000 for event in named)
+        failed = sum(1 for event in named if event["args"].get("rc") not in (0, None)
+                     or "error" in event["args"])
+
+        rows.append((sum(durations), name, len(durations), failed,
+                     _percentile(durations, 0.5), _percentile(durations, 0.9),
+                     _percentile(durations, 0.99), durations[-1]))
+
+    rows.sort(reverse=True)
+
+    lines = ["{:<24} {:>8} {:>7} {:>10} {:>10} {:>10} {:>10} {:>12}".format(
+        "command", "count", "failed", "p50 ms", "p90 ms", "p99 ms", "max ms", "total ms")]
+
+    for total, name, count, failed, p50, p90, p99, longest in rows:
+        lines.append("{:<24} {:>8} {:>7} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.2f} {:>12.1f}".format(
+            name, count, failed, p50, p90, p99, longest, total))
+
+    return "\n".join(lines)
+
+
+def tracer_from_config(config):
+    """
+    Enables tracing when trace_file is set in config. Returns the path
+    the trace is exported to, None when tracing is off.
+    """
+    path = config.get("trace_file", "")
+
+    if path:
+        tracer.enable(int(config.get("trace_max_events", 100000)))
+
+    return path or None
+
+
+def export_trace(path):
+    """
+    Writes the trace to path and logs its summary.
+    """
+    try:
+        tracer.export(path)
+    except OSError as ex:
+        logger.error("Couldn't write the TPM trace to {}: {}".format(path, ex))
+        return
+
+    logger.info("TPM trace written to {}\n{}".format(path, tracer.summary()))
+
+
+# Shared by wrapper.py and the in-process backends
+tracer = Tracer()
+
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(description="Summarise a TPM trace.")
+    parser.add_argument("trace", type=str, help="Chrome trace JSON written by Tracer.")
+    args = parser.parse_args()
+
+    with open(args.trace) as f:
+        print(summarize(json.load(f)["traceEvents"]))
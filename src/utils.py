@@ -11,6 +11,8 @@ Contributors: Teri Lenard
 
 import os
 import errno
+import codecs
+import json
 
 from binascii import hexlify, unhexlify
 from stat import S_IFIFO, S_IRUSR, S_IWUSR
@@ -48,11 +50,193 @@ def close_pipe(fifo):
 
 
 def read_pipe(fifo):
-    data = ''
-    while True:
-        data += fifo.read(1)
-        if data.endswith('\n'):
-            return data[:-1]
+    data = fifo.readline()
+    if data.endswith('\n'):
+        return data[:-1]
+    return data
+
+
+class LineFramer:
+    """
+    Splits a stream of byte chunks into decoded lines. An incomplete
+    trailing line is kept until the chunk completing it arrives.
+    """
+
+    def __init__(self, max_line=65536):
+        self._max_line = max_line
+        self._buffer = b""
+
+    def feed(self, data):
+        """
+        Appends a chunk and returns the list of complete, non-empty lines.
+        """
+        head, sep, tail = data.rpartition(b"\n")
+
+        if not sep:
+            self._buffer += data
+
+            if len(self._buffer) <= self._max_line:
+                return []
+
+            # Never grow without bound on a producer that forgot newlines
+            head, self._buffer = self._buffer, b""
+            return [head.decode(errors="replace")]
+
+        head = self._buffer + head
+        self._buffer = tail
+
+        return [line for line in head.decode(errors="replace").split("\n")
+                if line]
+
+
+class FrameTooLarge(ValueError):
+    pass
+
+
+class LengthPrefixFramer:
+    """
+    Splits a stream of byte chunks into decoded frames, each preceded
+    by its length as a 4 byte big endian integer. Same interface as
+    LineFramer, for producers whose logs may contain newlines.
+    """
+
+    HEADER = 4
+
+    def __init__(self, max_frame=65536):
+        self._max_frame = max_frame
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        """
+        Appends a chunk and returns the list of complete frames. Raises
+        FrameTooLarge on a length above max_frame, the stream can't be
+        resynchronised after that.
+        """
+        buffer = self._buffer
+        buffer += data
+
+        frames = []
+        offset = 0
+
+        while len(buffer) - offset >= self.HEADER:
+            length = int.from_bytes(buffer[offset:offset + self.HEADER], "big")
+
+            if length > self._max_frame:
+                raise FrameTooLarge("Frame of {} bytes".format(length))
+
+            end = offset + self.HEADER + length
+
+            if end > len(buffer):
+                break
+
+            if length:
+                frames.append(buffer[offset + self.HEADER:end].decode(errors="replace"))
+
+            offset = end
+
+        del buffer[:offset]
+
+        return frames
+
+
+class JsonArrayDecoder:
+    """
+    Decodes a JSON array from a stream of byte chunks, returning each
+    element as soon as it is complete instead of waiting for the whole
+    document.
+    """
+
+    # What the next non blank character may be
+    _OPEN = 0           # "["
+    _FIRST = 1          # first element or "]"
+    _ELEMENT = 2        # element, after a ","
+    _SEPARATOR = 3      # "," or "]"
+    _DONE = 4
+
+    _WHITESPACE = " \t\n\r"
+    # Characters that may still extend a number
+    _NUMBER = "0123456789.eE+-"
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._state = self._OPEN
+
+    @property
+    def done(self):
+        return self._state == self._DONE
+
+    def _skip(self, pos):
+        while pos < len(self._buffer) and self._buffer[pos] in self._WHITESPACE:
+            pos += 1
+        return pos
+
+    def feed(self, data):
+        """
+        Appends a chunk and returns the list of complete elements.
+        Raises ValueError on malformed input.
+        """
+        self._buffer += self._text.decode(data)
+        items = []
+        pos = self._skip(0)
+
+        while pos < len(self._buffer) and self._state != self._DONE:
+            char = self._buffer[pos]
+
+            if self._state == self._OPEN:
+                if char != "[":
+                    raise ValueError("Expected a JSON array")
+                self._state = self._FIRST
+
+            elif char == "]" and self._state in (self._FIRST, self._SEPARATOR):
+                self._state = self._DONE
+
+            elif self._state == self._SEPARATOR:
+                if char != ",":
+                    raise ValueError("Expected ',' in JSON array")
+                self._state = self._ELEMENT
+
+            else:
+                try:
+                    item, end = self._decoder.raw_decode(self._buffer, pos)
+                except json.JSONDecodeError:
+                    end = len(self._buffer)
+
+                # An element is always followed by "," or "]", until then
+                # it may be cut by the chunk boundary (a number, say)
+                if end >= len(self._buffer) or self._number_cut(item, end):
+                    break
+
+                items.append(item)
+                self._state = self._SEPARATOR
+                pos = self._skip(end)
+                continue
+
+            pos = self._skip(pos + 1)
+
+        self._buffer = self._buffer[pos:]
+        return items
+
+    def _number_cut(self, item, end):
+        """
+        Whether a number ends the buffer, e.g. "12." with its decimals
+        in the next chunk, which raw_decode() read as 12.
+        """
+        if not isinstance(item, (int, float)) or isinstance(item, bool):
+            return False
+
+        while end < len(self._buffer) and self._buffer[end] in self._NUMBER:
+            end += 1
+
+        return end >= len(self._buffer)
+
+    def close(self):
+        """
+        Raises ValueError if the stream ended inside the array.
+        """
+        if self._state != self._DONE:
+            raise ValueError("Truncated JSON array")
 
 
 def dump(data, file):
@@ -62,9 +246,14 @@ def dump(data, file):
 
 
 def write_binary(data, file):
+    """
+    Writes raw bytes, or the bytes of a hex string.
+    """
+    if isinstance(data, str):
+        data = unhexlify(data)
 
     with open(file, "wb") as f:
-        f.write(unhexlify(data))
+        f.write(data)
 
 def load_binary(file):
     data = ''
@@ -10,128 +10,338 @@ Contributors: Teri Lenard
 """
 import time
 import signal
-from threading import Thread
+from threading import Thread, Event
 from queue import Queue
 from queue import Empty as EmptyException
+from queue import Full as FullException
 from configparser import ConfigParser
 from argparse import ArgumentParser
 
-from log import logger
-from log_requestor import LogRequestor
+from log import logger, setup_logging
 from tpm_core import TPMCore
+from soft_verifier import ParallelVerifier
+from chain_verifier import ChainVerifier
+from checkpoint import CheckpointJournal
+from log_model import LogBatch, timestamp_value
+from result_store import ResultStore
+from sources import source_from_config
+from metrics import MetricsRegistry, server_from_config
+
+VERIFY_TPM = "tpm"
+VERIFY_SOFTWARE = "software"
 
 
 class LogVerifier:
 
     def __init__(self, config):
 
-        self._log_requestor = LogRequestor(
-            config["bosch-iot"]["username"],
-            config["bosch-iot"]["password"],
-            config["bosch-iot"]["url"],
-            config["bosch-iot"]["collection"],
-            config["bosch-iot"]["token"]
-        )
+        # Insights polling, log_events/ over MQTT or an NDJSON file,
+        # all feed the working queue below
+        self._source = source_from_config(config)
 
-        # Time_n must store the start (past) timestamp value for queries
-        self._time_n_file = config["processing"]["time_file"]
-        self._time_n = None
-        # Time_0 should store the current time
-        self._time_0 = None
+        # Progress is journaled per chain (one per source) once logs
+        # are verified
+        self._chain = self._source.name
+        self._journal = CheckpointJournal(
+            config["processing"].get("checkpoint_file", "checkpoint.journal"),
+            sync_every=int(config["processing"].get("checkpoint_sync_every", 64)),
+            sync_interval=float(config["processing"].get("checkpoint_sync_interval", 1.0)))
 
         self._should_run = False
-        self._pooling_cycle = int(config["processing"]["pooling_cycle"])
-        self._working_queue = Queue()
+        self._stopped = Event()
+
+        # tpm: tpm2_verifysignature per log, software: in-process RSA
+        # verification spread over verify_workers processes
+        self._verify_mode = config["processing"].get("verify_mode", VERIFY_TPM)
+        self._verify_workers = int(config["processing"].get("verify_workers", 0))
+        self._verify_batch = int(config["processing"].get("verify_batch", 256))
+        self._stats_interval = int(config["processing"].get("stats_interval", 60))
+
+        # Bounded, so a large catch-up isn't held in memory all at once
+        self._working_queue = Queue(int(config["processing"].get(
+            "queue_size", 4 * self._verify_batch)))
         self._worker = Thread(target=self._verify_task, daemon=True)
 
+        self._verified = 0
+        self._failed = 0
+        self._rate = 0.0
+        self._last_verified = None
+
+        # Outcome of every log, for later queries; empty to disable
+        store = config["processing"].get("result_store", "")
+        self._result_store = ResultStore(store) if store else None
+
+        # Replays the PCR extends of the verified logs to catch deleted
+        # or reordered ones, reorder_window logs may arrive out of order
+        # and wait at most reorder_timeout seconds for their predecessor
+        self._chain_check = config["processing"].getboolean("chain_check", True)
+        self._chain_verifier = ChainVerifier(
+            int(config["processing"].get("reorder_window", 256)),
+            reorder_timeout=float(config["processing"].get("reorder_timeout", 30)))
+
         self._tpm_core = TPMCore(config["tpm"])
+        self._engine = None
+
+        # Served on [metrics] listen, see metrics.py
+        self._metrics = MetricsRegistry(prefix="log_verifier_")
+        self._metrics_config = config["metrics"] if config.has_section("metrics") else None
+        self._metrics_server = None
+        self._register_metrics()
+
+    def _register_metrics(self):
+        metrics = self._metrics
+        stage = "Seconds per verification stage, for a whole batch."
+
+        self._verify_seconds = metrics.histogram("stage_seconds", stage, stage="verify")
+        self._chain_seconds = metrics.histogram("stage_seconds", stage, stage="chain")
+        self._store_seconds = metrics.histogram("stage_seconds", stage, stage="store")
+        self._checkpoint_seconds = metrics.histogram("stage_seconds", stage, stage="checkpoint")
+
+        metrics.counter("logs_verified", "Logs with a valid signature.",
+                        lambda: self._verified)
+        metrics.counter("logs_failed", "Logs with an invalid signature.",
+                        lambda: self._failed)
+        metrics.counter("chain_linked", "Logs that continue the PCR chain.",
+                        lambda: self._chain_verifier.accepted)
+        metrics.counter("chain_broken", "Logs that break the PCR chain.",
+                        lambda: self._chain_verifier.broken)
+        metrics.counter("chain_missing", "Logs of Merkle batches that never arrived.",
+                        lambda: self._chain_verifier.missing)
+        metrics.gauge("chain_pending", "Logs held back by the chain check.",
+                      lambda: self._chain_verifier.pending())
+        metrics.gauge("queue_depth", "Logs fetched but not verified yet.",
+                      self._working_queue.qsize)
+        metrics.gauge("lag_seconds", "Age of the last verified log.", self._lag_seconds)
+
+        for key, value in self._source.metrics().items():
+            if value is None or isinstance(value, (int, float)):
+                metrics.gauge("source_" + key, "See the source's metrics().",
+                              lambda key=key: self._source.metrics()[key])
 
     def start(self):
         self._should_run = True
 
         """
-        On the first cycle get the time from file
-        and current time. Extract the logs in the past
-        period of time since last start.
+        Resumes the source past the last checkpoint and runs it
+        until stop(), or until a finite source is exhausted.
         """
 
-        ok = self._tpm_core.initialise()
+        if self._verify_mode == VERIFY_SOFTWARE:
+            self._engine = ParallelVerifier(self._tpm_core.public_key,
+                                            self._verify_workers or None)
+            logger.info("Verifying in software with {} workers".format(
+                        self._engine.workers))
+        else:
+            ok = self._tpm_core.initialise()
 
-        if not ok:
-            logger.error("Could not initialise TPM")
-            return
+            if not ok:
+                logger.error("Could not initialise TPM")
+                return
 
-        logger.info("Loaded tpm public key")
+            logger.info("Loaded tpm public key")
+            self._engine = self._tpm_core
 
         self._worker.start()
         logger.info("Starter working thread")
 
-        self._time_n = self._read_time_file()
-        self._time_0 = time.time()
+        self._metrics_server = server_from_config(self._metrics, self._metrics_config)
+
+        self._resume()
+        self._source.run(self._enqueue, self._stopped)
+
+        if self._should_run:
+            # A file source reached its end, finish what is queued
+            self._working_queue.join()
+            self.stop()
 
-        objects = self._log_requestor.request(self._time_n, self._time_0, limit=5)
+    def _resume(self):
+        checkpoint = self._journal.get(self._chain)
 
-        for obj in objects:
-            self._working_queue.put(obj)
+        if checkpoint is not None and checkpoint["state"]:
+            self._chain_verifier.restore(checkpoint["state"])
 
-        self._time_n = self._time_0
-        self._update_time_file()
-        # self._time_0 = time.time()
+        self._source.resume(checkpoint)
+
+    def _enqueue(self, obj, timeout=None):
+        # The queue is bounded, wait for the worker but not past stop(),
+        # nor past timeout seconds when given: FullException then
+        deadline = None if timeout is None else time.monotonic() + timeout
 
         while self._should_run:
-            time.sleep(self._pooling_cycle)
-            self._time_0 = time.time()
+            wait = 1 if deadline is None else max(0, min(1, deadline - time.monotonic()))
+
+            try:
+                self._working_queue.put(obj, timeout=wait)
+                return True
+            except FullException:
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise
 
-            objects = self._log_requestor.request(self._time_n, self._time_0, limit=100)
-            if len(objects) == 0:
-                continue
+        return False
+
+    def _next_batch(self):
+        """
+        Waits for one object, then takes whatever else is queued,
+        up to verify_batch objects.
+        """
+        objs = [self._working_queue.get(timeout=1)]
 
-            for obj in objects:
-                self._working_queue.put(obj)
+        while len(objs) < self._verify_batch:
+            try:
+                objs.append(self._working_queue.get_nowait())
+            except EmptyException:
+                break
 
-            self._time_n = self._time_0
-            self._update_time_file()
+        return objs
 
     def _verify_task(self):
 
+        window_start = time.monotonic()
+        window_count = 0
+
         while self._should_run:
             try:
-                obj = self._working_queue.get(timeout=1)
+                objs = self._next_batch()
             except EmptyException:
-                continue
-
-            ok = self._tpm_core.verify(obj)
+                # Idle, don't leave checkpoints unsynced
+                self._journal.sync()
+                objs = []
+
+            # Indexes into batch of the logs with a valid signature
+            verified = []
+
+            results = []
+            batch = LogBatch.from_models(objs)
+
+            if objs:
+                start = time.perf_counter()
+
+                try:
+                    results = self._engine.verify_batch(batch)
+                except Exception as ex:
+                    # Counted as not verified, the worker keeps going
+                    logger.error("Couldn't verify {} messages: {}".format(len(objs), ex))
+                    results = [False] * len(objs)
+
+                self._verify_seconds.observe(time.perf_counter() - start)
+
+            for index, (obj, ok) in enumerate(zip(objs, results)):
+                if self._result_store:
+                    self._result_store.add(self._chain, obj, ok)
+
+                if not ok:
+                    self._failed += 1
+                    logger.warning("Message with id %s not verified", obj.id)
+                else:
+                    self._verified += 1
+                    verified.append(index)
+                    logger.debug("Message with id %s verified", obj.id)
+
+            if self._chain_check and verified:
+                start = time.perf_counter()
+                self._check_chain(batch.select(verified))
+                self._chain_seconds.observe(time.perf_counter() - start)
+            elif self._chain_check and not objs:
+                # Idle, logs waiting for a missing one may have timed out
+                self._check_chain(batch)
+
+            for _ in objs:
+                self._working_queue.task_done()
+
+            if objs:
+                if self._result_store:
+                    start = time.perf_counter()
+                    self._result_store.flush()
+                    self._store_seconds.observe(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                self._checkpoint(objs[-1])
+                self._checkpoint_seconds.observe(time.perf_counter() - start)
+                self._last_verified = objs[-1].timestamp
+
+            window_count += len(objs)
+            elapsed = time.monotonic() - window_start
+
+            if elapsed >= self._stats_interval:
+                self._rate = window_count / elapsed
+                logger.info("Verified {:.1f} logs/s ({} verified, {} failed)".format(
+                            self._rate, self._verified, self._failed))
+                window_start = time.monotonic()
+                window_count = 0
+
+    def _check_chain(self, batch):
+        """
+        Only logs with a valid signature take part in the chain,
+        a forged log would otherwise be able to resync it.
+        """
+        for obj, ok in self._chain_verifier.feed(batch):
+            if self._result_store:
+                self._result_store.set_chain_ok(self._chain, obj, ok)
 
             if not ok:
-                logger.warning("Message with id {} not verified".format(obj.id))
-            else:
-                logger.info("Message with id{} verified".format(obj.id))
+                logger.warning("Message with id %s breaks the PCR chain", obj.id)
+
+    def _checkpoint(self, last):
+        """
+        Journals the progress once a batch is fully processed. Logs held
+        back by the chain check are not done yet, a restart fetches
+        them again.
+        """
+        state = None
+        resume = None
+
+        if self._chain_check:
+            state = self._chain_verifier.checkpoint()
+            resume = self._chain_verifier.resume_point()
+
+        if resume is not None:
+            self._journal.record(self._chain, resume, inclusive=True, state=state)
+        else:
+            self._journal.record(self._chain, (last.timestamp, last.id), state=state)
+
+    def metrics(self):
+        metrics = {
+            "verified": self._verified,
+            "failed": self._failed,
+            "verified_per_second": self._rate,
+            "queued": self._working_queue.qsize(),
+            "chain_linked": self._chain_verifier.accepted,
+            "chain_broken": self._chain_verifier.broken,
+            "chain_missing": self._chain_verifier.missing,
+            "chain_pending": self._chain_verifier.pending(),
+            # Verification lag: age of the last verified log, and logs
+            # fetched but not verified yet
+            "lag_seconds": self._lag_seconds(),
+            "lag_records": self._working_queue.qsize() + self._chain_verifier.pending(),
+        }
+        metrics.update(self._source.metrics())
+
+        return metrics
+
+    def _lag_seconds(self):
+        if self._last_verified is None:
+            return None
+        return time.time() - timestamp_value(self._last_verified)
 
     def stop(self):
         self._should_run = False
+        self._stopped.set()
         self._worker.join()
 
-    def _read_time_file(self):
-        """
-        Reads time from file and converts it
-        to a datetime object
-        :return: datetime object
-        """
-        with open(self._time_n_file, "r") as f:
-            str_time = f.readline()
+        if isinstance(self._engine, ParallelVerifier):
+            self._engine.close()
 
-            try:
-                unix_time = float(str_time)
-            except ValueError:
-                print("Could not convert to unix time from file")
-                return None
+        self._tpm_core.close()
 
-            return unix_time
+        self._source.close()
+        self._journal.close()
 
-    def _update_time_file(self):
+        if self._result_store:
+            self._result_store.close()
 
-        with open(self._time_n_file, "w") as f:
-            f.write("{}".format(self._time_n))
+        if self._metrics_server is not None:
+            self._metrics_server.stop()
+            self._metrics_server = None
 
 
 def signal_handler(signum, frame):
@@ -151,6 +361,9 @@ if __name__ == '__main__':
     config = ConfigParser()
     config.read(args.c)
 
+    if config.has_section("log"):
+        setup_logging(config["log"], "verifier_log", "verifier.log")
+
     global log_verifier
 
     log_verifier = LogVerifier(config)
@@ -0,0 +1,362 @@
+"""
+This work is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+Developed by NISLAB - Network and Information Security Laboratory
+at George Emil Palade University of Medicine, Pharmacy, Science and
+Technology of Târgu Mureş <https://nislab.umfst.ro/>
+
+Contributors: Teri Lenard
+
+Encodings of signed logs on log_events/ and in the spool. JSON carries
+the signature, PCR and Merkle hashes as hex strings; CBOR and
+MessagePack carry them as raw bytes, roughly halving a log.
+"""
+
+import json
+import struct
+
+from log import logger
+from tpm_backend import format_pcr, parse_pcr
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+FORMAT_JSON = "json"
+FORMAT_CBOR = "cbor"
+FORMAT_MSGPACK = "msgpack"
+
+BATCH_NDJSON = "ndjson"
+BATCH_JSON = "json"
+
+
+def to_wire(record):
+    """
+    Copy of a signed log with its hex fields as bytes. A PCR that
+    wouldn't print back the same is kept as it is.
+    """
+    record = dict(record)
+    signature = record.get("Signature")
+
+    if isinstance(signature, str):
+        record["Signature"] = bytes.fromhex(signature)
+
+    pcr = record.get("PCR")
+
+    if isinstance(pcr, str):
+        try:
+            raw = parse_pcr(pcr)
+
+            if format_pcr(raw) == pcr:
+                record["PCR"] = raw
+        except ValueError:
+            pass
+
+    # Merkle hashes are lowercase hex, see MerkleTree
+    if "Root" in record:
+        record["Root"] = bytes.fromhex(record["Root"])
+        record["Proof"] = [bytes.fromhex(node) for node in record["Proof"]]
+
+    return record
+
+
+def from_wire(record):
+    """
+    Turns the PCR and Merkle hashes of a decoded log back into text,
+    in place. The signature stays bytes, LogModel takes it as is.
+    """
+    if isinstance(record.get("PCR"), bytes):
+        record["PCR"] = format_pcr(record["PCR"])
+
+    if isinstance(record.get("Root"), bytes):
+        record["Root"] = record["Root"].hex()
+        record["Proof"] = [node.hex() for node in record["Proof"]]
+
+    return record
+
+
+def json_default(value):
+    """
+    Writes raw bytes as hex in JSON, json.dumps(..., default=json_default).
+    """
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex()
+    raise TypeError("{} is not JSON serializable".format(type(value).__name__))
+
+
+def _decode_json(payload):
+    text = payload.decode().strip() if isinstance(payload, bytes) else payload.strip()
+
+    if text.startswith("["):
+        return json.loads(text)
+
+    return [json.loads(line) for line in text.split("\n") if line.strip()]
+
+
+class JsonCodec:
+    """
+    One log per message as a JSON object, batches as newline delimited
+    JSON or a JSON array. Logs are encoded to str.
+    """
+
+    name = FORMAT_JSON
+    binary = False
+
+    def __init__(self, batch_format=BATCH_NDJSON):
+
+        if batch_format not in (BATCH_NDJSON, BATCH_JSON):
+            raise ValueError("Unknown batch format " + str(batch_format))
+
+        self.batch_format = batch_format
+        # A raw signature is written as hex
+        self.encode = json.JSONEncoder(default=json_default).encode
+
+    def pack(self, encoded):
+        if self.batch_format == BATCH_NDJSON:
+            return "\n".join(encoded)
+        return "[" + ",".join(encoded) + "]"
+
+    def decode(self, payload):
+        """
+        The logs of a message, as dicts.
+        """
+        return _decode_json(payload)
+
+    def stored(self, encoded):
+        return encoded.encode()
+
+    def from_stored(self, data):
+        return data.decode()
+
+
+class _BinaryCodec:
+    """
+    One log per message as a map, batches as an array of maps. Logs are
+    encoded to bytes. Messages and spooled logs in JSON, from before the
+    format was changed, are still read.
+    """
+
+    binary = True
+    batch_format = None
+
+    def encode(self, record):
+        return self._dumps(to_wire(record))
+
+    def pack(self, encoded):
+        # Already encoded items concatenated are the array's body
+        return self._array_header(len(encoded)) + b"".join(encoded)
+
+    def decode(self, payload):
+        if payload[:1] in (b"{", b"["):
+            return _decode_json(payload)
+
+        records = self._loads(payload)
+
+        if isinstance(records, dict):
+            records = [records]
+
+        return [from_wire(record) for record in records]
+
+    def stored(self, encoded):
+        return encoded
+
+    def from_stored(self, data):
+        if data[:1] == b"{":
+            return self.encode(json.loads(data))
+        return data
+
+
+class CborCodec(_BinaryCodec):
+    """
+    CBOR (RFC 8949), through cbor2 when it is installed.
+    """
+
+    name = FORMAT_CBOR
+
+    def __init__(self):
+        if cbor2 is not None:
+            self._dumps, self._loads = cbor2.dumps, cbor2.loads
+        else:
+            self._dumps, self._loads = cbor_dumps, cbor_loads
+
+    @staticmethod
+    def _array_header(length):
+        return _cbor_head(4, length)
+
+
+class MsgpackCodec(_BinaryCodec):
+    """
+    MessagePack, needs the msgpack package.
+    """
+
+    name = FORMAT_MSGPACK
+
+    def __init__(self):
+        if msgpack is None:
+            raise ValueError("msgpack is not installed")
+
+        self._dumps = msgpack.Packer(use_bin_type=True).pack
+        self._loads = lambda data: msgpack.unpackb(data, raw=False)
+
+    @staticmethod
+    def _array_header(length):
+        if length < 16:
+            return bytes((0x90 | length,))
+        if length < 1 << 16:
+            return b"\xdc" + struct.pack(">H", length)
+        return b"\xdd" + struct.pack(">I", length)
+
+
+def codec_from_config(config):
+    """
+    Codec selected by wire_format in config, the [mqtt] section. Falls
+    back to JSON when the format's package is missing.
+    """
+    name = config.get("wire_format", FORMAT_JSON).lower()
+    batch_format = config.get("batch_format", BATCH_NDJSON)
+
+    if name == FORMAT_CBOR:
+        return CborCodec()
+
+    if name == FORMAT_MSGPACK:
+        try:
+            return MsgpackCodec()
+        except ValueError as ex:
+            logger.error("{}, using {}".format(ex, FORMAT_JSON))
+            return JsonCodec(batch_format)
+
+    if name != FORMAT_JSON:
+        raise ValueError("Unknown wire format " + name)
+
+    return JsonCodec(batch_format)
+
+
+# Enough CBOR for signed logs when cbor2 isn't installed: maps, arrays,
+# text, bytes, integers, floats, booleans and null, definite lengths.
+
+def _cbor_head(major, value):
+    if value < 24:
+        return bytes((major << 5 | value,))
+    if value < 1 << 8:
+        return bytes((major << 5 | 24, value))
+    if value < 1 << 16:
+        return bytes((major << 5 | 25,)) + struct.pack(">H", value)
+    if value < 1 << 32:
+        return bytes((major << 5 | 26,)) + struct.pack(">I", value)
+    return bytes((major << 5 | 27,)) + struct.pack(">Q", value)
+
+
+def _cbor_encode(value, out):
+    if isinstance(value, str):
+        data = value.encode()
+        out += _cbor_head(3, len(data))
+        out += data
+    elif isinstance(value, bool):
+        out.append(0xf5 if value else 0xf4)
+    elif isinstance(value, int):
+        if value >= 1 << 64 or value < -(1 << 64):
+            raise ValueError("Integer out of CBOR range")
+        out += _cbor_head(0, value) if value >= 0 else _cbor_head(1, -1 - value)
+    elif isinstance(value, float):
+        out.append(0xfb)
+        out += struct.pack(">d", value)
+    elif isinstance(value, (bytes, bytearray)):
+        out += _cbor_head(2, len(value))
+        out += value
+    elif isinstance(value, dict):
+        out += _cbor_head(5, len(value))
+        for key, item in value.items():
+            _cbor_encode(key, out)
+            _cbor_encode(item, out)
+    elif isinstance(value, (list, tuple)):
+        out += _cbor_head(4, len(value))
+        for item in value:
+            _cbor_encode(item, out)
+    elif value is None:
+        out.append(0xf6)
+    else:
+        raise TypeError("{} is not CBOR serializable".format(type(value).__name__))
+
+
+def cbor_dumps(value):
+    out = bytearray()
+    _cbor_encode(value, out)
+    return bytes(out)
+
+
+_SIMPLE = {20: False, 21: True, 22: None}
+
+
+def _cbor_decode(data, offset):
+    initial = data[offset]
+    major, info = initial >> 5, initial & 0x1f
+    offset += 1
+
+    if major == 7:
+        if info in _SIMPLE:
+            return _SIMPLE[info], offset
+        if info == 25:
+            return struct.unpack_from(">e", data, offset)[0], offset + 2
+        if info == 26:
+            return struct.unpack_from(">f", data, offset)[0], offset + 4
+        if info == 27:
+            return struct.unpack_from(">d", data, offset)[0], offset + 8
+        raise ValueError("Unsupported CBOR simple value {}".format(info))
+
+    if info < 24:
+        value = info
+    elif info < 28:
+        size = 1 << (info - 24)
+        value = int.from_bytes(data[offset:offset + size], "big")
+        offset += size
+    else:
+        raise ValueError("Unsupported CBOR length {}".format(info))
+
+    if major == 0:
+        return value, offset
+    if major == 1:
+        return -1 - value, offset
+    if major in (2, 3):
+        end = offset + value
+
+        if end > len(data):
+            raise ValueError("Truncated CBOR")
+
+        chunk = bytes(data[offset:end])
+        return (chunk if major == 2 else chunk.decode()), end
+    if major == 4:
+        items = []
+        for _ in range(value):
+            item, offset = _cbor_decode(data, offset)
+            items.append(item)
+        return items, offset
+    if major == 5:
+        items = dict()
+        for _ in range(value):
+            key, offset = _cbor_decode(data, offset)
+            items[key], offset = _cbor_decode(data, offset)
+        return items, offset
+    if major == 6:
+        # Tags are ignored, the tagged item is returned
+        return _cbor_decode(data, offset)
+
+    raise ValueError("Unsupported CBOR major type {}".format(major))
+
+
+def cbor_loads(data):
+    try:
+        value, offset = _cbor_decode(data, 0)
+    except (IndexError, struct.error, UnicodeDecodeError) as ex:
+        raise ValueError("Malformed CBOR: {}".format(ex))
+
+    if offset != len(data):
+        raise ValueError("Trailing bytes after CBOR item")
+
+    return value
@@ -11,6 +11,10 @@ Contributors: Bela Genge, Teri Lenard
 
 import os, os.path as path
 import subprocess, sys
+import time
+
+from log import logger
+from tracing import tracer
 
 TPM2T_PATH = "" #"/snap/bin"
 TPM2T_CREATEPRIMARY = TPM2T_PATH + "tpm2_createprimary" # "/tpm2-tools-alexmurray.createprimary"
@@ -30,29 +34,53 @@ TPM2T_PCRRESET = TPM2T_PATH + "tpm2_pcrreset"
 TPM2T_TCTI_ABRMD = "--tcti=tabrmd:bus_name=com.intel.tss2.Tabrmd"
 
 
-def TPM2_CreatePrimary(folderName, outFileName):
+def _run(argv, **kwargs):
     '''
-    Provisions a new hierarchy of keys (the endorsemene key), and stores the context file in the given folder.
+    Runs a tpm2-tools command, traces it when tracing is enabled and logs its stderr when it fails.
+    Returns the CompletedProcess, or None if the command couldn't be launched.
     '''
+    name = path.basename(argv[0])
+    start = time.perf_counter()
+
+    try:
+        result = subprocess.run(argv, stderr=subprocess.PIPE, **kwargs)
+    except (OSError, subprocess.SubprocessError) as ex:
+        tracer.record(name, start, time.perf_counter(), argv=argv, error=str(ex))
+        logger.error("There was an error while launching {}: {}".format(name, ex))
+        return None
+
+    end = time.perf_counter()
+
+    stderr = result.stderr
+    if isinstance(stderr, bytes):
+        stderr = stderr.decode(errors="replace")
+
+    tracer.record(name, start, end, argv=argv, rc=result.returncode, stderr=stderr)
+
+    if result.returncode != 0:
+        logger.error("{} failed with {}: {}".format(name, result.returncode, stderr.strip()))
 
+    return result
+
+
+def _make_folder(folderName):
     # In case the folder does not exists, create it
     if (not path.exists(folderName)):
         try:
-            result = os.mkdir(folderName)
+            os.mkdir(folderName)
         except OSError as ex:
-            print("Failed to create folder: ", folderName)
+            logger.error("Failed to create folder {}: {}".format(folderName, ex))
         else:
-            print("Folder %s successfully created" % folderName)
+            logger.info("Folder %s successfully created" % folderName)
 
-    # Launch the command
-    result = ''
-    try:
-        result = subprocess.run([TPM2T_CREATEPRIMARY, '-C', 'p', '-c', folderName + '/' + outFileName, TPM2T_TCTI_ABRMD])
-    except Exception as ex:
-        print("There was an error while launchnig " + TPM2T_CREATEPRIMARY)
-        return False
 
-    return True
+def TPM2_CreatePrimary(folderName, outFileName):
+    '''
+    Provisions a new hierarchy of keys (the endorsemene key), and stores the context file in the given folder.
+    '''
+    _make_folder(folderName)
+
+    return _run([TPM2T_CREATEPRIMARY, '-C', 'p', '-c', folderName + '/' + outFileName, TPM2T_TCTI_ABRMD]) is not None
 
 
 def TPM2_CreateAsymKey(parentkFileName, pkFolderName, pubkFileName, prvkFileName):
@@ -61,111 +89,53 @@ def TPM2_CreateAsymKey(parentkFileName, pkFolderName, pubkFileName, prvkFileName
     '''
 
     if not os.path.isfile(parentkFileName):
-        print("Could not find: " + parentkFileName)
+        logger.error("Could not find: " + parentkFileName)
         return False
 
-    # In case the folder does not exists, create it
-    if (not path.exists(pkFolderName)):
-        try:
-            result = os.mkdir(pkFolderName)
-        except OSError as ex:
-            print("Failed to create folder: ", pkFolderName)
-        else:
-            print("Folder %s successfully created" % pkFolderName)
+    _make_folder(pkFolderName)
 
-    # Launch the command
-    result = ''
-    try:
-        result = subprocess.run([TPM2T_CREATE, '-Q', '-C', parentkFileName, '-u', pkFolderName + '/' + pubkFileName, '-r', pkFolderName + '/' + prvkFileName, TPM2T_TCTI_ABRMD])
-    except Exception as ex:
-        print("There was an error while launchnig " + TPM2T_CREATE)
-        return False
+    return _run([TPM2T_CREATE, '-Q', '-C', parentkFileName, '-u', pkFolderName + '/' + pubkFileName, '-r', pkFolderName + '/' + prvkFileName, TPM2T_TCTI_ABRMD]) is not None
 
-    return True
+
+def _succeeded(result):
+    return result is not None and result.returncode == 0
 
 
 def TPM2_FlushContext():
     '''
     Remove all transient contexts.
     '''
+    return _succeeded(_run([TPM2T_FLUSHCONTEXT, '-t', TPM2T_TCTI_ABRMD]))
 
-    # Run the command
-    try:
-        result = subprocess.run([TPM2T_FLUSHCONTEXT, '-t', TPM2T_TCTI_ABRMD])
-
-        if result.returncode == 0:
-            return True
-
-        return False
-    except subprocess.SubprocessError as ex:
-        print("There was an error while launchnig " + TPM2T_FLUSHCONTEXT)
-        return False
 
 def TPM2_LoadKey(parentFileName, pubkFileName, prvkFileName, outHFileName):
     '''
     Load the key (including public and private area) to the TPM
     '''
-    try:
-        result = subprocess.run([TPM2T_LOAD, '-Q', '-C', parentFileName, '-u', pubkFileName, '-r', prvkFileName, '-c', outHFileName, TPM2T_TCTI_ABRMD])
+    return _succeeded(_run([TPM2T_LOAD, '-Q', '-C', parentFileName, '-u', pubkFileName, '-r', prvkFileName, '-c', outHFileName, TPM2T_TCTI_ABRMD]))
 
-        if result.returncode == 0:
-            return True
-
-        return False
-
-    except subprocess.SubprocessError:
-        print("There was an error while launchnig " + TPM2T_LOAD)
-        return False
 
 def TPM2_RSAEncrypt(keyFile, inFileName, outFileName):
     '''
     Encrypts with RSA the given file, and produces the output file.
     '''
-    try:
-        result = subprocess.run([TPM2T_RSAENCRYPT, '-c', keyFile, '-o', outFileName, inFileName, TPM2T_TCTI_ABRMD])
-        
-        if result.returncode == 0:
-            return True
+    return _succeeded(_run([TPM2T_RSAENCRYPT, '-c', keyFile, '-o', outFileName, inFileName, TPM2T_TCTI_ABRMD]))
 
-        return False
-
-    except subprocess.SubprocessError:
-        print("There was an error while launchnig " + TPM2T_RSAENCRYPT)
-        return False
 
 def TPM2_Sign(keyFile, inFileName, outFileName):
     '''
     Signs with RSA the given file (containing a hash), and produces the output file. It also verifies that the hash was created by the TPM.
     Ticket is ignored for now, the TPM produces errors.
     '''
+    return _succeeded(_run([TPM2T_SIGN, '-Q', '-c', keyFile, '-o', outFileName, inFileName, TPM2T_TCTI_ABRMD]))
 
-    try:
-        result = subprocess.run([TPM2T_SIGN, '-Q', '-c', keyFile, '-o', outFileName, inFileName, TPM2T_TCTI_ABRMD])
-
-        if result.returncode == 0:
-            return True
-
-        return False
-
-    except subprocess.SubprocessError:
-        print("There was an error while launchnig " + TPM2T_SIGN)
-        return False
 
-def TPM2_Hash(inFileName, outFile):
+def TPM2_Hash(inFileName, outFile, hashAlg="sha1"):
     '''
-    Compute the hash over the given file.
+    Compute the hash over the given file. Defaults to sha-1, the bank used for PCR extends.
     '''
-    try:
+    return _succeeded(_run([TPM2T_HASH, inFileName, "-g", hashAlg, "-o", outFile, "--hex", TPM2T_TCTI_ABRMD, '-Q']))
 
-        result = subprocess.run([TPM2T_HASH, inFileName, "-o", outFile, "--hex",TPM2T_TCTI_ABRMD, '-Q'])
-        if result.returncode == 0:
-            return True
-
-        return False
-
-    except subprocess.SubprocessError:
-        print("There was an error while launchnig " + TPM2T_HASH)
-        return False
 
 def TPM2_ExtendPcr(pcrIndex, digestFile):
     '''
@@ -173,24 +143,16 @@ def TPM2_ExtendPcr(pcrIndex, digestFile):
     '''
     digest = ""
     try:
-        digest = subprocess.run(["cat", digestFile], capture_output=True, text=True)
-        print(digest.stdout)
-    except subprocess.SubprocessError:
-        print("There was an error while reading " + digestFile)
+        with open(digestFile, "r") as f:
+            digest = f.read().strip()
+    except OSError:
+        logger.error("There was an error while reading " + digestFile)
         return False
 
-    args = "{}:{}={}".format(str(pcrIndex), "sha1", digest.stdout)
-    try:
-       
-        result = subprocess.run([TPM2T_EXTEND_PCR, args, "-Q"])
-        if result.returncode == 0:
-            return True
+    args = "{}:{}={}".format(str(pcrIndex), "sha1", digest)
 
-        return False
+    return _succeeded(_run([TPM2T_EXTEND_PCR, args, "-Q"]))
 
-    except subprocess.SubprocessError:
-        print("There was an error while launchnig " + TPM2T_EXTEND_PCR)
-        return False
 
 def TPM2_ReadPcr(pcrIndex):
     '''
@@ -198,73 +160,35 @@ def TPM2_ReadPcr(pcrIndex):
     '''
 
     args = "{}:{}".format("sha1", str(pcrIndex))
-    try:
-        result = subprocess.run([TPM2T_READ_PCR, args], capture_output=True, text=True)
-
-        output = result.stdout[-43:].strip()
-        if result.returncode == 0:
-            return output
-
-        return None
+    result = _run([TPM2T_READ_PCR, args], stdout=subprocess.PIPE, text=True)
 
-    except subprocess.SubprocessError:
-        print("There was an error while launchnig " + TPM2T_EXTEND_PCR)
+    if not _succeeded(result):
         return None
 
-def TPM2_DICTIONARY_LOCKOUT():
-
-    try:
-        result = subprocess.run([TPM2T_DICTIONNARY_LOCKOUT, "--setup-parameters", "--max-tries=4294967295", "--clear-lockout"])
+    return result.stdout[-43:].strip()
 
-        if result.returncode == 0:
-            return True
-
-        return False
 
-    except subprocess.SubprocessError:
-        print("There was an error while launchnig " + TPM2T_EXTEND_PCR)
-        return False
+def TPM2_DICTIONARY_LOCKOUT():
+    return _succeeded(_run([TPM2T_DICTIONNARY_LOCKOUT, "--setup-parameters", "--max-tries=4294967295", "--clear-lockout"]))
 
 
 def TPM2_LoadExternalPubKey(pkFile, outFileName):
-
-    try:
-        result = subprocess.run([TPM2T_LOADEXTERNAL, '-C', 'n', '-u', pkFile, '-c', outFileName, TPM2T_TCTI_ABRMD])
-    except Exception as ex:
-        print("There was an error while launchnig " + TPM2T_LOADEXTERNAL)
-        return False
-
-    return True
+    return _run([TPM2T_LOADEXTERNAL, '-C', 'n', '-u', pkFile, '-c', outFileName, TPM2T_TCTI_ABRMD]) is not None
 
 
 def TPM2_Verify(keyFile, fData, fSig):
     '''
-    Signs with RSA the given file (containing a hash), and produces the output file. It also verifies that the hash was created by the TPM.
-    Ticket is ignored for now, the TPM produces errors.
+    Verifies with the loaded public key that fSig is a signature over fData.
     '''
+    return _succeeded(_run([TPM2T_VERIFY, '-c', keyFile, '-m', fData, '-s', fSig, TPM2T_TCTI_ABRMD]))
 
-    # Run the command
-    result = ''
-    try:
-        result = subprocess.run([TPM2T_VERIFY, '-c', keyFile,'-m', fData, '-s', fSig, TPM2T_TCTI_ABRMD])
-    except Exception as ex:
-        print("There was an error while launchnig " + TPM2T_SIGN)
-        print("Exception: " + str(ex))
-        return False
-
-    if ('returncode=0' in str(result)):
-        return True
-    return False
 
 def TPM2_ResetPCR():
-    try:
-        subprocess.run([TPM2T_PCRRESET])
-        return True
-    except Exception as ex:
-        print("There was an error while launchnig " + TPM2T_SIGN)
-        print("Exception: " + str(ex))
-        return False
+    return _run([TPM2T_PCRRESET]) is not None
+
 
 if __name__ == "__main__":
+    tracer.enable()
     success = TPM2_ReadPcr(3)
-    print(str(success))
\ No newline at end of file
+    print(str(success))
+    print(tracer.summary())